@@ -0,0 +1,127 @@
+#!/usr/bin/env python
+#
+# Helpers shared by the benchmark modules: timing, result records and
+# synthetic firmware images.
+#
+# (C) 2009-2010 Flying Camp Design
+#
+# All Rights Reserved.
+#
+# AUTHOR: Chris Wilson <cwilson@flyingcampdesign.com>
+#
+# Released under a BSD-style license (please see LICENSE)
+
+import os, sys, time, struct, random
+
+#make the package importable when running from a source checkout
+SRC = os.path.join(os.path.dirname(os.path.abspath(__file__)), '..', 'src')
+if SRC not in sys.path:
+    sys.path.insert(0, SRC)
+
+from msp430bslu.mspgcc.memory import Memory, Segment
+
+def measure(func, repeat=5, number=None, mintime=0.2):
+    """time func() and return the best and median seconds per call.
+    if number is None it is chosen so that one repetition takes at
+    least mintime seconds"""
+    if number is None:
+        number = 1
+        while 1:
+            start = time.time()
+            for i in xrange(number):
+                func()
+            elapsed = time.time() - start
+            if elapsed >= mintime / 10:
+                number = max(1, int(number * mintime / elapsed))
+                break
+            number = number * 10
+    times = []
+    for r in range(repeat):
+        start = time.time()
+        for i in xrange(number):
+            func()
+        times.append((time.time() - start) / number)
+    times.sort()
+    return times[0], times[len(times) // 2], number
+
+def result(name, seconds, median=None, number=1, size=None, **extra):
+    """build a result record. seconds is the value compared against the
+    baseline, lower is better"""
+    record = {'name': name, 'seconds': seconds, 'median': median is None and seconds or median, 'number': number}
+    if size is not None:
+        record['bytes'] = size
+        record['bytes_per_second'] = seconds and size / seconds or 0.0
+    record.update(extra)
+    return record
+
+def timed(name, func, size=None, repeat=5, number=None, **extra):
+    """measure func and return its result record"""
+    best, median, number = measure(func, repeat, number)
+    return result(name, best, median, number, size, **extra)
+
+def random_data(size, seed=430):
+    """reproducible pseudo random bytes, with some 0xff runs like real
+    firmware images"""
+    rnd = random.Random(seed)
+    data = []
+    while len(data) < size:
+        if rnd.random() < 0.1:
+            data.extend([chr(0xff)] * rnd.randint(16, 256))
+        else:
+            data.extend([chr(rnd.randint(0, 255)) for i in range(64)])
+    return ''.join(data[:size])
+
+def make_image(size, segment=4096, gap=256, base=0x1100, seed=430):
+    """return a Memory object with size bytes split into segments with
+    gaps in between. addresses are 32 bit, images above 64kB do not
+    fit a MSP430 but are fine for the parsers"""
+    data = random_data(size, seed)
+    mem = Memory()
+    address = base
+    for start in range(0, size, segment):
+        chunk = data[start:start+segment]
+        mem.append(Segment(address, chunk))
+        address = address + len(chunk) + gap
+    return mem
+
+def make_elf(mem):
+    """return the contents of a minimal MSP430 ELF executable with one
+    loadable section per segment, as understood by elf.ELFObject"""
+    EHDR = "<16sHHIIIIIHHHHHH"
+    PHDR = "<IIIIIIII"
+    SHDR = "<IIIIIIIIII"
+    names = ['', '.shstrtab'] + ['.sec%d' % i for i in range(len(mem))]
+    shstrtab = '\0'.join(names) + '\0'
+    offsets = []
+    pos = 0
+    for name in names:
+        offsets.append(pos)
+        pos = pos + len(name) + 1
+    phoff = struct.calcsize(EHDR)
+    dataoff = phoff + struct.calcsize(PHDR) * len(mem)
+    body = []
+    sections = [struct.pack(SHDR, 0, 0, 0, 0, 0, 0, 0, 0, 0, 0)]
+    programs = []
+    pos = dataoff
+    for i, seg in enumerate(mem):
+        sections.append(struct.pack(SHDR, offsets[i+2], 1, 0x6, seg.startaddress, pos, len(seg.data), 0, 0, 2, 0))
+        programs.append(struct.pack(PHDR, 1, pos, seg.startaddress, seg.startaddress, len(seg.data), len(seg.data), 5, 2))
+        body.append(seg.data)
+        pos = pos + len(seg.data)
+    sections.insert(1, struct.pack(SHDR, offsets[1], 3, 0, 0, pos, len(shstrtab), 0, 0, 1, 0))
+    shoff = pos + len(shstrtab)
+    ident = '\x7fELF\x01\x01\x01' + '\0' * 9
+    header = struct.pack(EHDR, ident, 2, 0x69, 1, 0, phoff, shoff, 0,
+                         struct.calcsize(EHDR), struct.calcsize(PHDR), len(programs),
+                         struct.calcsize(SHDR), len(sections), 1)
+    return header + ''.join(programs) + ''.join(body) + shstrtab + ''.join(sections)
+
+def quiet(func, *args, **kwargs):
+    """call func with the status output on stderr silenced"""
+    stderr = sys.stderr
+    sys.stderr = open(os.devnull, 'w')
+    try:
+        return func(*args, **kwargs)
+    finally:
+        sys.stderr.close()
+        sys.stderr = stderr
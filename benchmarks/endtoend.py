@@ -0,0 +1,80 @@
+#!/usr/bin/env python
+#
+# End to end benchmarks: program, verify and upload against the simulated
+# target for each baudrate and frame size. The simulator spends the line
+# time of every byte, so the numbers track what a real F1x would do,
+# minus the flash programming time.
+#
+# (C) 2009-2010 Flying Camp Design
+#
+# All Rights Reserved.
+#
+# AUTHOR: Chris Wilson <cwilson@flyingcampdesign.com>
+#
+# Released under a BSD-style license (please see LICENSE)
+
+import time
+
+from common import result, make_image, quiet
+from msp430bslu.mspgcc import bsl, simulator
+from msp430bslu.mspgcc.autotune import FrameSizeTuner
+
+BAUDS = (9600, 19200, 38400)
+FRAME_SIZES = (64, 128, 240, 0)         #0: auto-tuned
+IMAGE_SIZE = 2048
+IMAGE_ADDRESS = 0xf000
+
+def session(baud, frame, image, latency=0.0005):
+    """run one erase/program/verify/upload session and return the
+    seconds spent in each phase. frame 0 selects auto-tuning"""
+    target = simulator.SimulatedTarget('bench', latency=latency, realtime=1)
+    bslobj = bsl.BootStrapLoader()
+    bslobj.showprogress = 0
+    if frame:
+        bslobj.maxData = frame
+    else:
+        bslobj.tuner = FrameSizeTuner()
+    bslobj.data = image
+    phases = {}
+    size = sum([len(seg.data) for seg in image])
+    start = time.time()
+    bslobj.comInit(target)
+    try:
+        bslobj.actionMassErase()
+        bslobj.actionStartBSL(speed=baud != 9600 and baud or None)
+        phases['entry'] = time.time() - start
+        t = time.time()
+        bslobj.actionProgram()
+        phases['program'] = time.time() - t
+        t = time.time()
+        bslobj.actionVerify()
+        phases['verify'] = time.time() - t
+        t = time.time()
+        data = bslobj.uploadData(image[0].startaddress, size)
+        phases['upload'] = time.time() - t
+    finally:
+        bslobj.comDone()
+    if data != image[0].data[:size]:
+        raise AssertionError('uploaded data differs')
+    phases['total'] = time.time() - start
+    return phases, size
+
+def run(quick=0):
+    results = []
+    bauds = quick and BAUDS[-1:] or BAUDS
+    frames = quick and (240,) or FRAME_SIZES
+    image = make_image(quick and IMAGE_SIZE / 2 or IMAGE_SIZE, segment=IMAGE_SIZE, base=IMAGE_ADDRESS)
+    for baud in bauds:
+        for frame in frames:
+            phases, size = quiet(session, baud, frame, image)
+            for phase in ('entry', 'program', 'verify', 'upload', 'total'):
+                name = 'e2e.%s.%d.%s' % (phase, baud, frame or 'auto')
+                if phase in ('program', 'verify', 'upload'):
+                    results.append(result(name, phases[phase], size=size, baudrate=baud, frame=frame))
+                else:
+                    results.append(result(name, phases[phase], baudrate=baud, frame=frame))
+    return results
+
+if __name__ == '__main__':
+    for r in run():
+        print '%-40s %10.3f s' % (r['name'], r['seconds'])
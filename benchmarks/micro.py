@@ -0,0 +1,74 @@
+#!/usr/bin/env python
+#
+# Micro benchmarks: checksum, frame encoding and Memory range queries.
+#
+# (C) 2009-2010 Flying Camp Design
+#
+# All Rights Reserved.
+#
+# AUTHOR: Chris Wilson <cwilson@flyingcampdesign.com>
+#
+# Released under a BSD-style license (please see LICENSE)
+
+import struct
+
+from common import timed, random_data, make_image
+from msp430bslu.mspgcc import bsl, simulator
+
+FRAME = 240     #largest multiple of 16 fitting the 250 byte frame limit
+
+class AckPort:
+    """port that acknowledges everything, leaves only the host side
+    cost of a frame: sync, encoding, checksum and header checks"""
+    portstr = 'ack'
+    baudrate = 9600
+    timeout = None
+    def setBaudrate(self, baudrate): pass
+    def flushInput(self): pass
+    def flushOutput(self): pass
+    def setDTR(self, level=1): pass
+    def setRTS(self, level=1): pass
+    def close(self): pass
+    def write(self, data): return len(data)
+    def read(self, size=1): return chr(bsl.LowLevel.DATA_ACK)
+
+def run(quick=0):
+    results = []
+    repeat = quick and 3 or 5
+    data = random_data(FRAME + 4)
+    ll = bsl.LowLevel()
+    results.append(timed('micro.checksum.%d' % len(data),
+        lambda: ll.calcChecksum(data, len(data)), size=len(data), repeat=repeat))
+
+    ll = bsl.LowLevel()
+    ll.comInit(AckPort())
+    ll.metrics.start()
+    payload = data[:FRAME]
+    results.append(timed('micro.frame.txblk.%d' % FRAME,
+        lambda: ll.bslTxRx(ll.BSL_TXBLK, 0x2000, len(payload), payload), size=FRAME, repeat=repeat))
+    ll.comDone()
+
+    #a full round trip with the simulator decoding the frame and answering
+    target = simulator.SimulatedTarget('bench')
+    ll = bsl.LowLevel()
+    ll.comInit(target)
+    target.unlocked = target.inBSL = 1         #skip the entry sequence
+    results.append(timed('micro.frame.rxblk.%d' % FRAME,
+        lambda: ll.bslTxRx(ll.BSL_RXBLK, 0x2000, FRAME), size=FRAME, repeat=repeat))
+    ll.comDone()
+
+    mem = make_image(0xe000, segment=0x1000, gap=0, base=0x2000)
+    results.append(timed('micro.memory.getMemrange.%d' % FRAME,
+        lambda: mem.getMemrange(0x2ff0, 0x2ff0 + FRAME - 1), size=FRAME, repeat=repeat))
+    results.append(timed('micro.memory.getMemrange.4096',
+        lambda: mem.getMemrange(0x8800, 0x8800 + 4095), size=4096, repeat=repeat))
+    results.append(timed('micro.memory.getMem.%d' % FRAME,
+        lambda: mem.getMem(0xe800, FRAME), size=FRAME, repeat=repeat))
+    block = struct.pack('<%dH' % (FRAME / 2), *range(FRAME / 2))
+    results.append(timed('micro.memory.setMem.%d' % FRAME,
+        lambda: mem.setMem(0xe800, block), size=FRAME, repeat=repeat))
+    return results
+
+if __name__ == '__main__':
+    for r in run():
+        print '%-40s %12.3f us' % (r['name'], r['seconds'] * 1e6)
@@ -0,0 +1,59 @@
+#!/usr/bin/env python
+#
+# Parser benchmarks: loading synthetic Intel-HEX, TI-Text, S-record and
+# ELF images of different sizes.
+#
+# (C) 2009-2010 Flying Camp Design
+#
+# All Rights Reserved.
+#
+# AUTHOR: Chris Wilson <cwilson@flyingcampdesign.com>
+#
+# Released under a BSD-style license (please see LICENSE)
+
+import cStringIO
+
+from common import timed, make_image, make_elf
+from msp430bslu.mspgcc.memory import Memory
+
+SIZES = (64*1024, 256*1024, 1024*1024)
+
+def encode(mem):
+    """return the image in all formats"""
+    ihex = cStringIO.StringIO()
+    mem.saveIHex(ihex)
+    titext = cStringIO.StringIO()
+    mem.saveTIText(titext)
+    srec = cStringIO.StringIO()
+    mem.saveSRec(srec)
+    return {
+        'ihex': (Memory.loadIHex, ihex.getvalue()),
+        'titext': (Memory.loadTIText, titext.getvalue()),
+        'srec': (Memory.loadSRec, srec.getvalue()),
+        'elf': (Memory.loadELF, make_elf(mem)),
+    }
+
+def loader(method, contents):
+    def load():
+        mem = Memory()
+        method(mem, cStringIO.StringIO(contents))
+        return mem
+    return load
+
+def run(quick=0):
+    results = []
+    sizes = quick and SIZES[:1] or SIZES
+    for size in sizes:
+        formats = encode(make_image(size))
+        for name in sorted(formats.keys()):
+            method, contents = formats[name]
+            load = loader(method, contents)
+            if sum([len(seg.data) for seg in load()]) != size:
+                raise AssertionError('%s loader lost data' % name)
+            results.append(timed('parser.%s.%dk' % (name, size / 1024), load,
+                size=size, repeat=quick and 1 or 3, number=1, file_bytes=len(contents)))
+    return results
+
+if __name__ == '__main__':
+    for r in run():
+        print '%-40s %10.3f ms %10.1f kB/s' % (r['name'], r['seconds'] * 1e3, r['bytes_per_second'] / 1024)
@@ -0,0 +1,139 @@
+#!/usr/bin/env python
+#
+# Run the benchmark suites, write the results as JSON and compare them
+# against a stored baseline.
+#
+#   python benchmarks/run.py --output results.json
+#   python benchmarks/run.py --save-baseline baseline.json
+#   python benchmarks/run.py --baseline baseline.json --threshold 0.2
+#
+# (C) 2009-2010 Flying Camp Design
+#
+# All Rights Reserved.
+#
+# AUTHOR: Chris Wilson <cwilson@flyingcampdesign.com>
+#
+# Released under a BSD-style license (please see LICENSE)
+
+import sys, time, json, platform
+from optparse import OptionParser
+
+import micro, parsers, endtoend
+
+SUITES = (
+    ('micro', micro),
+    ('parsers', parsers),
+    ('e2e', endtoend),
+)
+
+def run_suites(names, quick=0, log=sys.stderr):
+    results = []
+    for name, module in SUITES:
+        if name in names:
+            log.write('running %s benchmarks ...\n' % name)
+            start = time.time()
+            results.extend(module.run(quick))
+            log.write('  %.1f s\n' % (time.time() - start))
+    return {
+        'created': time.strftime('%Y-%m-%dT%H:%M:%S'),
+        'python': platform.python_version(),
+        'platform': platform.platform(),
+        'quick': quick and 1 or 0,
+        'results': results,
+    }
+
+def compare(report, baseline, threshold):
+    """compare the results against the baseline. returns a list of
+    (name, baseline seconds, current seconds, ratio, status)"""
+    old = dict([(r['name'], r) for r in baseline['results']])
+    rows = []
+    for r in report['results']:
+        if r['name'] not in old:
+            rows.append((r['name'], None, r['seconds'], None, 'new'))
+            continue
+        before = old[r['name']]['seconds']
+        ratio = before and r['seconds'] / before or 1.0
+        if ratio > 1.0 + threshold:
+            status = 'slower'
+        elif ratio < 1.0 / (1.0 + threshold):
+            status = 'faster'
+        else:
+            status = 'ok'
+        rows.append((r['name'], before, r['seconds'], ratio, status))
+    return rows
+
+def format_seconds(value):
+    if value is None:
+        return '-'
+    if value < 1e-3:
+        return '%.2f us' % (value * 1e6)
+    if value < 1.0:
+        return '%.2f ms' % (value * 1e3)
+    return '%.3f s' % value
+
+def print_results(report, out=sys.stdout):
+    for r in report['results']:
+        rate = ''
+        if 'bytes_per_second' in r:
+            rate = '%10.1f kB/s' % (r['bytes_per_second'] / 1024)
+        out.write('%-36s %12s %s\n' % (r['name'], format_seconds(r['seconds']), rate))
+
+def print_comparison(rows, out=sys.stdout):
+    out.write('%-36s %12s %12s %8s\n' % ('benchmark', 'baseline', 'current', 'ratio'))
+    for name, before, after, ratio, status in rows:
+        out.write('%-36s %12s %12s %8s %s\n' % (name, format_seconds(before), format_seconds(after),
+                  ratio is not None and '%.2f' % ratio or '-', status != 'ok' and status or ''))
+
+def save(report, filename):
+    f = open(filename, 'w')
+    try:
+        json.dump(report, f, indent=2, sort_keys=True)
+        f.write('\n')
+    finally:
+        f.close()
+
+def main(argv=None):
+    parser = OptionParser(usage="%prog [options]")
+    parser.add_option("-s", "--suite", dest="suites", action="append", default=[],
+            help="run only this suite (%s), may be given several times" % ', '.join([name for name, module in SUITES]))
+    parser.add_option("-q", "--quick", dest="quick", action="store_true", default=False,
+            help="smaller inputs and fewer repetitions")
+    parser.add_option("-o", "--output", dest="output", metavar="FILE",
+            help="write the results as JSON to FILE")
+    parser.add_option("-b", "--baseline", dest="baseline", metavar="FILE",
+            help="compare the results against a previous JSON output")
+    parser.add_option("--save-baseline", dest="save_baseline", metavar="FILE",
+            help="write the results to FILE for later comparisons")
+    parser.add_option("-t", "--threshold", dest="threshold", type="float", default=0.25,
+            help="relative slowdown reported as regression (default %default)")
+    options, args = parser.parse_args(argv)
+    names = options.suites or [name for name, module in SUITES]
+    for name in names:
+        if name not in dict(SUITES):
+            parser.error("unknown suite %r" % name)
+
+    report = run_suites(names, options.quick)
+    if options.output:
+        save(report, options.output)
+    if options.save_baseline:
+        save(report, options.save_baseline)
+
+    if options.baseline:
+        f = open(options.baseline)
+        try:
+            baseline = json.load(f)
+        finally:
+            f.close()
+        rows = compare(report, baseline, options.threshold)
+        print_comparison(rows)
+        report['comparison'] = [dict(zip(('name', 'baseline', 'current', 'ratio', 'status'), row)) for row in rows]
+        if options.output:
+            save(report, options.output)
+        if [row for row in rows if row[4] == 'slower']:
+            return 1
+    else:
+        print_results(report)
+    return 0
+
+if __name__ == '__main__':
+    sys.exit(main())
@@ -0,0 +1,16 @@
+#!/usr/bin/env python
+#
+# Serial Bootstrap Loader Utility command line startup script
+#
+# (C) 2009-2010 Flying Camp Design
+#
+# All Rights Reserved.
+#
+# AUTHOR: Chris Wilson <cwilson@flyingcampdesign.com>
+#
+# Released under a BSD-style license (please see LICENSE)
+
+import sys
+import msp430bslu.cli
+
+sys.exit(msp430bslu.cli.main())
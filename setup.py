@@ -32,6 +32,8 @@ sys.path.append(src_dir_name)
 import msp430bslu.app
 
 app_script = os.path.join(scr_dir_name, 'msp430-bsl-utility.pyw')
+cli_script = os.path.join(scr_dir_name, 'msp430-bsl-utility-cli.py')
+station_script = os.path.join(scr_dir_name, 'msp430-bsl-station.py')
 app_icon = msp430bslu.app.ICONFILE
 
 # Platform independent setup
@@ -48,7 +50,7 @@ setup_args = dict(
     packages = find_packages(where=src_dir_name),
     package_dir = {pkg_name: os.path.join(src_dir_name, pkg_name)},
     package_data = {pkg_name: [app_icon]},
-    scripts = [app_script],
+    scripts = [app_script, cli_script, station_script],
     options = setup_options,
 )
 
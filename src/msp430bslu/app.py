@@ -22,14 +22,16 @@ import sys
 import errno
 import platform
 import ConfigParser
-import serial
 import sscan
+import hotplug
+import job
 from Tkinter import *
 from ttk import *
 from tkFileDialog import *
 from tkMessageBox import *
 from tkExtras import *
-from mspgcc.util import hexdump, makeihex
+from job import INFO_OPTS, APP_OPTS, BSL_OPTS, parse_config_value
+from job import BAUDS, FILE_TYPES, CPU_TYPES, UPLOAD_FORMATS, JobError, JobExecutor, SessionManager, OutputRouter, ProgressProxy
 from mspgcc import memory, bsl
 from pkg_resources import resource_filename
 
@@ -52,22 +54,14 @@ CONFIG_FILE_TYPES = [
     ('Config Files', CONFIG_EXT),
     ('All Files', '*'),
 ]
-INFO_OPTS = 'App Info'
-APP_OPTS = 'App Options'
-BSL_OPTS = 'BSL Options'
-BAUDS = [9600, 19200, 38400]
-FILE_TYPES = ['Auto Select', 'IntelHex', 'TI-Text']
-CPU_TYPES = ['Auto Select', 'F1x', 'F4x']
-UPLOAD_FORMATS = ['hex', 'ihex', 'bin']
+EVENT_POLL_MS = 100 # interval for handling events posted by worker threads
+GO_TAG = 'Go' # executor tag of the job started with the 'Go' button
 FIRMWARE_FILE_TYPES = [
     ('hex Files', '.hex'),
     ('ihex Files', '.ihex'),
     ('bin Files', '.bin'),
     ('All Files', '*'),
 ]
-HEX = 0
-INTELHEX = 1
-BINARY = 2
 PLATFORM = platform.platform()
 WINDOWS = PLATFORM.lower().startswith('windows')
 DARWIN = PLATFORM.lower().startswith('darwin')
@@ -112,6 +106,8 @@ def set_debug(level):
     DEBUG = level
     bsl.DEBUG = level
     memory.DEBUG = level
+    job.DEBUG = level
+    hotplug.DEBUG = level
 
 def get_tk_var_name(var):
     """
@@ -125,29 +121,6 @@ def set_tk_var_name(var, name):
     """
     var._name = name
 
-class AppError(Exception):
-    pass
-
-class UpdatingBootStrapLoader(bsl.BootStrapLoader):
-    """
-    BootStrapLoader wrapper class that updates a progress object
-    """
-    def __init__(self, progress_obj=None, *args, **kwargs):
-        bsl.BootStrapLoader.__init__(self, *args, **kwargs)
-        self.progress_obj = progress_obj
-    
-    def progress_update(self, count, total=100):
-        """
-        Overloads the bsl.progress_update method in bsl.BootStrapLoader
-        """
-        if bsl.DEBUG:
-            pcnt = (100*count/total)
-            sys.stderr.write("  %d%%\n" % pcnt)
-            sys.stderr.flush()
-        if self.progress_obj != None:
-            self.progress_obj.set(count, total)
-    
-
 class AppMainWindow(MainWindow):
     """
     Main app window
@@ -161,6 +134,10 @@ class AppMainWindow(MainWindow):
         self.enable_warnings = True
         self.running = False
         self.configfile = ''
+        self.sessions = SessionManager() # the BSL stays active between jobs on a port
+        self.executor = JobExecutor(self.sessions) # events are handled in poll_events
+        self.progress = ProgressProxy()
+        self.monitor = None
         self.make_defaults()
         self.make_vars()
         self.make_menu()
@@ -168,16 +145,17 @@ class AppMainWindow(MainWindow):
         self.make_callback_list()
         self.log = PopupGuiOutput(title=DESCRIPTION, kind='Log', iconfile=ICONFILE, var=self.logwinvisible)
         self.log.resizable(width=FALSE, height=FALSE)
-        sys.stderr = self.log
+        sys.stderr = OutputRouter(self.log)
         self.out = PopupGuiOutput(title=DESCRIPTION, kind='Output', iconfile=ICONFILE, var=self.outwinvisible)
         self.out.resizable(width=FALSE, height=FALSE)
-        sys.stdout = self.out
+        sys.stdout = OutputRouter(self.out)
         self.bind('<Return>', self.on_go)
         self.set_defaults()
         self.enable_sanity_checks = True
         if os.path.isfile(INIFILE):
             self.load_config(INIFILE)
         self.initialize_widgets()
+        self.after(EVENT_POLL_MS, self.poll_events)
         self.update()
     
     def error(self, message):
@@ -238,42 +216,10 @@ class AppMainWindow(MainWindow):
         self.app_defaults['outwinvisible'] = False
         self.app_defaults['warnings'] = True
         self.app_defaults['debuglevel'] = 0
+        self.app_defaults['autoprogram'] = False
         
         # BSL Defaults
-        self.bsl_defaults = {}
-        self.bsl_defaults['comport'] = None
-        self.bsl_defaults['password'] = None
-        self.bsl_defaults['filename'] = None
-        self.bsl_defaults['framesize'] = 224
-        self.bsl_defaults['erasecycles'] = 1
-        self.bsl_defaults['unpatched'] = False
-        self.bsl_defaults['filetype'] = 'Auto Select'
-        self.bsl_defaults['timeout'] = 1
-        self.bsl_defaults['bslfile'] = None
-        self.bsl_defaults['speed'] = BAUDS[0]
-        self.bsl_defaults['cpu'] = 'Auto Select'
-        self.bsl_defaults['invertrst'] = False
-        self.bsl_defaults['inverttest'] = False
-        self.bsl_defaults['swapresettest'] = False
-        self.bsl_defaults['testontx'] = False
-        self.bsl_defaults['ignoreanswer'] = False
-        self.bsl_defaults['nodownloadbsl'] = False
-        self.bsl_defaults['forcebsl'] = False
-        self.bsl_defaults['slowmode'] = False
-        self.bsl_defaults['masserase'] = False
-        self.bsl_defaults['mainerase'] = False
-        self.bsl_defaults['erase'] = None
-        self.bsl_defaults['erasecheck'] = False
-        self.bsl_defaults['program'] = False
-        self.bsl_defaults['verify'] = False
-        self.bsl_defaults['bslversion'] = False
-        self.bsl_defaults['startaddr'] = None
-        self.bsl_defaults['size'] = 2
-        self.bsl_defaults['outputformat'] = 'hex'
-        self.bsl_defaults['uploadfile'] = None
-        self.bsl_defaults['goaddr'] = None
-        self.bsl_defaults['reset'] = False
-        self.bsl_defaults['wait'] = False
+        self.bsl_defaults = dict(job.BSL_DEFAULTS)
     
     def make_vars(self):
         """
@@ -297,6 +243,8 @@ class AppMainWindow(MainWindow):
         self.warnings = BooleanVar()
         self.debuglevel = IntVar()
         self.debuglevel.trace_variable('w', lambda *args: set_debug(self.debuglevel.get()))
+        self.autoprogram = BooleanVar()
+        self.autoprogram.trace_variable('w', self.on_autoprogram)
         
         # BSL vars
         self.v_comport = StringVar()
@@ -427,6 +375,7 @@ class AppMainWindow(MainWindow):
         options.add_checkbutton(label='Show log window', variable=self.logwinvisible)
         options.add_checkbutton(label='Show output window', variable=self.outwinvisible)
         options.add_checkbutton(label='Show warnings', variable=self.warnings)
+        options.add_checkbutton(label='Auto program on connect', variable=self.autoprogram)
         debugmenu = Menu(options, tearoff=0)
         for i in range(MAX_DEBUG + 1):
             debugmenu.add_radiobutton(label=("%s" % i), command=self.on_debug_level, variable=self.debuglevel, value=i)
@@ -623,6 +572,7 @@ class AppMainWindow(MainWindow):
         Button(button_frame, text='Defaults', command=self.set_defaults).pack(side=LEFT, anchor=W, padx=5, pady=5)
         Button(button_frame, text='Scan', command=self.on_serial_scan).pack(side=LEFT, anchor=W, padx=0, pady=5)
         Button(button_frame, text='Go', command=self.on_go).pack(side=RIGHT, anchor=E, padx=5, pady=5)
+        Button(button_frame, text='Cancel', command=self.on_cancel).pack(side=RIGHT, anchor=E, padx=0, pady=5)
         # Button(button_frame, text='Print', command=self.print_vars).pack(side=LEFT, anchor=S, padx=5, pady=5) # DEBUG
     
     # Variable callback methods
@@ -789,10 +739,7 @@ class AppMainWindow(MainWindow):
         self.disable_popups()
         for opts in [APP_OPTS, BSL_OPTS]:
             for opt, val in cfg.items(opts):
-                if val.startswith("'") and val.endswith("'"):
-                    val = val[1:-1]
-                else:
-                    val = eval(val)
+                val = parse_config_value(val)
                 try:
                     self.set_val(opt, val)
                 except tkExtrasError, err:
@@ -893,7 +840,7 @@ class AppMainWindow(MainWindow):
         """
         Update available serial ports
         """                                                                         
-        if self.warnings.get():
+        if self.warnings.get() and sscan.OPENS_PORTS:
             if not askyesno('Warning', 'This will attempt to open and close all serial ports on this system.  This has the potential to reset devices connected to the serial port.  Do you wish to proceed?'):
                 return
         self.log.write('Scanning for available serial ports...')
@@ -925,341 +872,139 @@ class AppMainWindow(MainWindow):
                     return
         elif os.path.isfile(INIFILE):
             os.remove(INIFILE)
+        if self.monitor:
+            self.monitor.stop()
+        self.executor.cancel_all()
+        self.sessions.close_all()
         self.quit()
     
-    # Most of the bsl logic below is adapted from msp430-bsl.py by Chris Liechti
+    def get_job_options(self):
+        """
+        Returns a dict with the current BSL option values
+        """
+        options = {}
+        for opt in self.bsl_defaults.keys():
+            options[opt] = self.get_val(opt)
+        return options
+    
     def on_go(self, *args):
+        """
+        Starts a job with the current options in a worker thread
+        """
+        if self.running:
+            return
+        if not self.sanity_check_options():
+            return
+        self.log.write("%s Version: %s\n" % (DESCRIPTION, VERSION))
+        if DEBUG:
+            self.log.write("Debug level set to %d\n" % DEBUG)
+            self.log.write("Python version: %s\n" % sys.version)
+            self.log.write("Tcl version: %s\n" % TclVersion)
+            self.log.write("Tk version: %s\n" % TkVersion)
         try:
-            
-            if self.running:
-                return
-            else:
-                if not self.sanity_check_options():
-                    return
-                self.running = True
-            
-            # Initialize BSL variables
-            bslobj = None
-            warnings = self.warnings.get()
-            wait = self.wait.get()
-            maxData = self.framesize.get()
-            meraseCycles = self.erasecycles.get()
-            masserase = self.masserase.get()
-            mainerase = self.mainerase.get()
-            erasecheck = self.erasecheck.get()
-            program = self.program.get()
-            verify = self.verify.get()
-            reset = self.reset.get()
-            goaddr = self.goaddr.get()
-            unpatched = self.unpatched.get()
-            startaddr = self.startaddr.get()
-            size = self.size.get()
-            invertrst = self.invertrst.get()
-            inverttest = self.inverttest.get()
-            forcebsl = self.forcebsl.get()
-            slowmode = self.slowmode.get()
-            swapresettest = self.swapresettest.get()
-            testontx = self.testontx.get()
-            ignoreanswer = self.ignoreanswer.get()
-            uploadfile = self.uploadfile.get()
-            bslversion = self.bslversion.get()
-            
-            timeout = self.timeout.get()
-            if not timeout:
-                timeout = 0
-            
-            comPort = self.comport.get()
-            if comPort.startswith('COM'):
-                try:
-                    comPort = int(comPort.lstrip('COM'), 0) - 1
-                except ValueError:
-                    raise AppError('Invalid COM port\n')
-            
-            password = self.password.get()
-            if password == '':
-                password = None
-            elif not os.path.isfile(password):
-                self.password.focus()
-                raise AppError('Invalid password file\n')
-            
-            erase = self.erase.get()
-            if erase:
-                if '-' in erase:
-                    str1, str2 = erase.split('-', 1)
-                    adr1 = int(str1, 0)
-                    adr2 = int(str2, 0)
-                else:
-                    adr1 = int(erase, 0)
-                    adr2 = None
-            else:
-                adr1 = None
-                adr2 = None
-            
-            outputformat = self.outputformat.get()
-            if outputformat == 'hex':
-                outputformat = HEX
-            elif outputformat == 'bin':
-                outputformat = BINARY
-            elif outputformat == 'ihex':
-                outputformat = INTELHEX
-            else:
-                raise AppError('Invalid output format\n')
-            
-            filetype = self.filetype.get()
-            if filetype == 'Auto Select':
-                filetype = None
-            elif filetype == 'IntelHex':
-                filetype = 0
-            elif filetype == 'TI-Text':
-                filetype = 1
-            else:
-                raise AppError('Invalid firmware file type\n')
-            
-            bslfile = self.bslfile.get()
-            if bslfile == '':
-                bslfile = None
-            elif not os.path.isfile(bslfile):
-                raise AppError('Invalid BSL file\n')
-            
-            speed = self.speed.get()
-            if speed not in BAUDS:
-                raise AppError("Unspported baud rate: %d\nSupported baud rates: %s" % (speed, BAUDS))
-            
-            cpu = self.cpu.get()
-            if cpu == 'Auto Select':
-                cpu = None
-            elif cpu == 'F1x':
-                cpu = bsl.F1x
-            elif cpu == 'F4x':
-                cpu = bsl.F4x
-            else:
-                raise AppError('Invalid device type\n')
-            
-            mayusebsl = not self.nodownloadbsl.get()
-            
-            filename = self.filename.get()
-            if filename == '':
-                filename = None
-            elif filename == '-': # FIXME
-                pass
-            elif program and not os.path.isfile(filename):
-                raise AppError('Invalid firmware input file\n')
-            
-            # BSL Init
-            self.log.write("%s Version: %s\n" % (DESCRIPTION, VERSION))
-            if DEBUG:
-                self.log.write("Debug level set to %d\n" % DEBUG)
-                self.log.write("Python version: %s\n" % sys.version)
-                self.log.write("Tcl version: %s\n" % TclVersion)
-                self.log.write("Tk version: %s\n" % TkVersion)
-            
-            bslobj = UpdatingBootStrapLoader(progress_obj=self.progressbar)
-            bslobj.showprogress = 1
-            toinit = []
-            todo = []
-            
-            if timeout:
-                bslobj.timeout = timeout
-                if DEBUG: self.log.write("Timeout set to %d.\n" % timeout)
-            
-            if password:
-                bslobj.passwd = memory.Memory(password).getMemrange(0xffe0, 0xffff)
-                if DEBUG: self.log.write("Using password file: %s.\n" % password)
-            
-            # Make sure that conditions for maxData are met:
-            # ( >= 16 and == n*16 and <= MAX_DATA_BYTES!)
-            if maxData > bsl.BootStrapLoader.MAX_DATA_BYTES:
-                maxData = bsl.BootStrapLoader.MAX_DATA_BYTES
-            elif maxData < 16:
-                maxData = 16
-            bslobj.maxData = maxData - (maxData % 16)
-            if DEBUG: self.log.write("Max. number of data bytes within one frame set to %d.\n" % maxData)
-            
-            bslobj.meraseCycles = meraseCycles
-            if DEBUG: self.log.write("Number of mass erase cycles set to %d.\n" % meraseCycles)
-            
-            if masserase:
-                toinit.append(bslobj.actionMassErase) # Erase entire Flash
-            
-            if mainerase:
-                toinit.append(bslobj.actionMainErase) # Erase main Flash
-            
-            if adr1:
-                if adr2:
-                    while adr1 <= adr2:
-                        if adr1 < 0x1100:
-                            modulo = 64 # F2xx:64: F1xx, F4xx: 128 (segments get erased twice)
-                        elif adr1 < 0x1200:
-                            modulo = 256
-                        else:
-                            modulo = 512
-                        adr1 = adr1 - (adr1 % modulo)
-                        toinit.append(bslobj.makeActionSegmentErase(adr1))
-                        adr1 = adr1 + modulo
-                else:
-                    toinit.append(bslobj.makeActionSegmentErase(adr1))
-            
-            if erasecheck:
-                toinit.append(bslobj.actionEraseCheck) # Erase Check (by file)
-            
-            if program:
-                todo.append(bslobj.actionProgram) # Program file
-            
-            if verify:
-                todo.append(bslobj.actionVerify) # Verify file
-            
-            if bslfile:
-                bslrepl = memory.Memory() # File to program
-                bslrepl.loadFile(bslfile)
-            else:
-                bslrepl = None
-            
-            if bslversion:
-                todo.append(bslobj.actionReadBSLVersion) # load replacement BSL as first item
-            
-            if cpu:
-                bslobj.cpu = cpu
-            
-            bslobj.invertRST = invertrst
-            
-            bslobj.invertTEST = inverttest
-            
-            bslobj.slowmode = slowmode
-            
-            bslobj.swapResetTest = swapresettest
-            
-            bslobj.testOnTX = testontx
-            
-            bslobj.ignoreAnswer = ignoreanswer
-            
-            if toinit:
-                if DEBUG > 0:
-                    # show a nice list of sheduled actions
-                    self.log.write('TOINIT list:\n')
-                    for f in toinit:
-                        try:
-                            self.log.write("   %s\n" % f.func_name)
-                        except AttributeError:
-                           self.log.write("   %r\n" % f)
-            if todo:
-                if DEBUG > 0:
-                    # show a nice list of sheduled actions
-                    self.log.write('TODO list:\n')
-                    for f in todo:
-                        try:
-                            self.log.write("   %s\n" % f.func_name)
-                        except AttributeError:
-                            self.log.write("   %r\n" % f)
-            
-            # prepare data to download
-            bslobj.data = memory.Memory() # prepare downloaded data
-            if filename is not None: # if the filename is given...
-                file = open(filename, 'rb') # or from a file
-                if filetype is not None:
-                    if filetype == 0: # select load function
-                        bslobj.data.loadIHex(file) # intel hex
-                    elif filetype == 1:
-                        bslobj.data.loadTIText(file) # TI's format
-                    else:
-                        raise ValueError('Illegal filetype specified')
-                else: # no filetype given...
-                    bslobj.data.loadFile(filename) # autodetect otherwise
-            if DEBUG > 3: self.log.write("File: %r" % filename)
-            
-            bslobj.comInit(comPort) # init port
-            
-            # initialization list
-            if toinit: # erase and erase check
-                if DEBUG: self.log.write('Preparing device ...\n')
-                # bslobj.actionStartBSL(usepatch=0, adjsp=0) # no workarounds needed
-                # if speed: bslobj.actionChangeBaudrate(speed) # change baud rate as fast as possible
-                for f in toinit: f()
-            
-            if todo or goaddr or startaddr:
-                if DEBUG: self.log.write('Actions ...\n')
-                # connect to the BSL
-                bslobj.actionStartBSL(
-                    usepatch=not unpatched,
-                    replacementBSL=bslrepl,
-                    forceBSL=forcebsl,
-                    mayuseBSL=mayusebsl,
-                    speed=speed,
-                )
-            
-            # work list
-            if todo:
-                for f in todo: f() # work through todo list
-            
-            if reset: # reset device first if desired
-                bslobj.actionReset()
-            
-            if goaddr is not None: # start user programm at specified address
-                bslobj.actionRun(goaddr) # load PC and execute
-            
-            # upload datablock and output
-            if startaddr is not None:
-                if goaddr: # if a program was started...
-                    # don't restart BSL but wait for the device to enter it itself
-                    if DEBUG: self.log.write('Waiting for device to reconnect for upload: ')
-                    bslobj.txPasswd(bslobj.passwd, wait=1) # synchronize, try forever...
-                    data = bslobj.uploadData(startaddr, size) # upload data
-                else:
-                    data = bslobj.uploadData(startaddr, size) # upload data
-                if outputformat == HEX: # depending on output format
-                    if uploadfile:
-                        self.log.write("Uploading hex data to %s..." % uploadfile)
-                        f = open(uploadfile, 'wb')
-                        hexdump((startaddr, data), output=f)
-                        f.close()
-                        self.log.write('SUCCESS\n')
-                    else:
-                        if DEBUG: self.log.write('Uploading hex data to output window...')
-                        hexdump((startaddr, data), output=self.out)
-                        if DEBUG: self.log.write('SUCCESS\n')
-                elif outputformat == INTELHEX:
-                    if uploadfile:
-                        self.log.write("Uploading ihex data to %s..." % uploadfile)
-                        f = open(uploadfile, 'wb')
-                        makeihex((startaddr, data), output=f)
-                        f.close()
-                        self.log.write('SUCCESS\n')
-                    else:
-                        if DEBUG: self.log.write('Uploading ihex data to output window...')
-                        makeihex((startaddr, data), output=self.out)
-                        if DEBUG: self.log.write('SUCCESS\n')
-                else:
-                    if uploadfile:
-                        self.log.write("Uploading binary data to %s..." % uploadfile)
-                        f = open(uploadfile, 'wb')
-                        f.write(data)
-                        f.close()
-                        self.log.write('SUCCESS\n')
-                    else:
-                        if DEBUG: self.log.write('Uploading binary data to output window...')
-                        self.out.write(data) #binary output w/o newline!
-                        if DEBUG: self.log.write('SUCCESS\n')
-            
-            if wait: # wait at the end if desired
-                showinfo('Wait', "Press 'OK' to continue...")
-                
-            if bslobj:
-                bslobj.comDone() # Release serial communication port
-        
-        except serial.SerialException, err:
-            self.log.write('\n')
+            self.executor.submit(self.get_job_options(), GO_TAG, progress=self.progress)
+        except JobError, err:
             self.logged_error("%s\n" % err)
-        except bsl.BSLException, err:
-            if bslobj:
-                bslobj.comDone() # Release serial communication port
-            self.log.write('\n')
-            self.logged_error("%s\n" % err)
-        except AppError, err:
+            return
+        self.running = True
+    
+    def on_cancel(self, *args):
+        """
+        Cancels the running job
+        """
+        if self.running:
+            self.log.write('Cancelling...\n')
+            self.executor.cancel(GO_TAG)
+    
+    def on_job_finished(self, err):
+        """
+        Reports the outcome of the job started with 'Go'
+        """
+        if err is not None:
+            if isinstance(err, JobError) and err.option:
+                getattr(self, err.option).focus()
             self.log.write('\n')
             self.logged_error("%s\n" % err)
-        finally:
-            self.progressbar.reset()
-            self.log.write('Done.\n')
-            self.running = False
+        self.progress.take()
+        self.progressbar.reset()
+        self.log.write('Done.\n')
+        self.running = False
+    
+    def on_autoprogram(self, *args):
+        """
+        Starts or stops the hotplug monitor
+        """
+        if self.autoprogram.get():
+            if not self.monitor:
+                self.monitor = hotplug.HotplugMonitor(lambda event, port: self.executor.post('hotplug', event, port))
+                self.monitor.start()
+                self.log.write('Auto programming: waiting for USB serial adapters...\n')
+        elif self.monitor:
+            self.monitor.stop()
+            self.monitor = None
+            self.log.write('Auto programming stopped.\n')
+    
+    def start_auto_job(self, port):
+        """
+        Runs a job with the current options on a newly connected port
+        """
+        if self.executor.running(port):
+            self.log.write("[%s] job already running, ignored\n" % port)
+            return
+        self.disable_popups()
+        ok = self.sanity_check_options()
+        self.enable_popups()
+        if not ok:
+            self.log.write("[%s] current options will result in errors, job not started\n" % port)
+            return
+        options = self.get_job_options()
+        options['comport'] = port
+        self.log.write("[%s] connected, starting job\n" % port)
+        self.executor.submit(options, port, prefix="[%s] " % port)
+    
+    def poll_events(self):
+        """
+        Handles events posted by worker threads, runs in the Tk main loop.
+        Text is collected and written once per call, the progress bar is
+        only set to the latest value.
+        """
+        logtext = []
+        outtext = []
+        def flush_text():
+            if logtext:
+                self.log.write(''.join(logtext))
+                del logtext[:]
+            if outtext:
+                self.out.write(''.join(outtext))
+                del outtext[:]
+        for event in self.executor.events():
+            kind, tag = event[:2]
+            if kind == 'log':
+                logtext.append(event[2])
+            elif kind == 'out':
+                outtext.append(event[2])
+            else:
+                flush_text() # keep the order of text and other events
+                if kind == 'hotplug':
+                    change, port = event[1:]
+                    if change == 'add' and self.autoprogram.get():
+                        self.start_auto_job(port)
+                elif kind == 'session':
+                    self.log.write("[%s] BSL session ended (%s)\n" % (tag, event[2]))
+                elif kind == 'wait':
+                    showinfo('Wait', "Press 'OK' to continue...")
+                    event[2].set()
+                elif tag == GO_TAG:
+                    self.on_job_finished(event[2])
+                elif kind == 'done':
+                    self.log.write("[%s] Done.\n" % tag)
+                elif kind == 'error':
+                    self.log.write("\n[%s] FAIL: %s\n" % (tag, event[2]))
+        flush_text()
+        progress = self.progress.take()
+        if progress is not None and self.running:
+            self.progressbar.set(*progress)
+        self.after(EVENT_POLL_MS, self.poll_events)
     
 
 def main():
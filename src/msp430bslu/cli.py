@@ -0,0 +1,201 @@
+#!/usr/bin/env python
+#
+# Command line front end for headless BSL jobs
+#
+# (C) 2009-2010 Flying Camp Design
+#
+# All Rights Reserved.
+#
+# AUTHOR: Chris Wilson <cwilson@flyingcampdesign.com>
+#
+# Released under a BSD-style license (please see LICENSE)
+
+# Only GUI independent modules may be imported here, the command line
+# programmer has to run on machines without Tkinter.
+
+import sys
+import json
+from cStringIO import StringIO
+from optparse import OptionParser, OptionGroup
+import job
+from mspgcc import memory, bsl
+
+USAGE = "%prog [options] [firmware file [more files to compose, FILE@ADDR for binaries] ...]"
+METRICS_FORMATS = ['json', 'prometheus']
+
+class TextProgress:
+    """
+    Progress object printing percentages on one line
+    """
+    def __init__(self, output=sys.stderr):
+        self.output = output
+        self.last = None
+
+    def set(self, count, total=100):
+        pcnt = total and 100*count/total
+        if pcnt != self.last:
+            self.last = pcnt
+            self.output.write("\r%3d%%" % pcnt)
+            if pcnt == 100:
+                self.output.write("\n")
+            self.output.flush()
+
+def wait_for_enter():
+    sys.stderr.write("Press <Enter> to continue...")
+    sys.stderr.flush()
+    sys.stdin.readline()
+
+def make_parser():
+    parser = OptionParser(usage=USAGE)
+    parser.add_option('--config', dest='config', metavar='FILE',
+        help="load BSL options from a config file saved by the GUI, command line options take precedence")
+    parser.add_option('--json', dest='json', action='store_true', default=False,
+        help="print the job result as JSON on stdout")
+    parser.add_option('--progress', dest='progress', action='store_true', default=False,
+        help="show progress on stderr")
+    parser.add_option('--trace', dest='trace', metavar='FILE',
+        help="record the serial traffic to FILE, replay it with -c replay:FILE")
+    parser.add_option('--timeline', dest='timeline', metavar='FILE',
+        help="save a timeline of the session to FILE (Chrome trace event JSON)")
+    parser.add_option('--metrics', dest='metrics', metavar='FILE',
+        help="write protocol metrics of the session to FILE")
+    parser.add_option('--metrics-format', dest='metricsformat', choices=METRICS_FORMATS, default='json',
+        help="metrics file format %s (default %%default)" % METRICS_FORMATS)
+    parser.add_option('-D', '--debug', dest='debug', type='int', default=0, metavar='LEVEL',
+        help="debug level")
+
+    group = OptionGroup(parser, 'Serial Port')
+    group.add_option('-c', '--comport', dest='comport', help="serial port device, e.g. /dev/ttyUSB0 or COM1")
+    group.add_option('-s', '--speed', dest='speed', type='int', help="baud rate %s" % job.BAUDS)
+    group.add_option('--invert-reset', dest='invertrst', action='store_true', help="invert RESET")
+    group.add_option('--invert-test', dest='inverttest', action='store_true', help="invert TEST")
+    group.add_option('--swap-reset-test', dest='swapresettest', action='store_true', help="swap RESET and TEST")
+    group.add_option('--slow', dest='slowmode', action='store_true', help="slow mode")
+    group.add_option('-t', '--timeout', dest='timeout', type='int', help="timeout in seconds (0: disabled)")
+    parser.add_option_group(group)
+
+    group = OptionGroup(parser, 'Firmware')
+    group.add_option('-I', '--intelhex', dest='filetype', action='store_const', const='IntelHex', help="force Intel-Hex input")
+    group.add_option('-T', '--titext', dest='filetype', action='store_const', const='TI-Text', help="force TI-Text input")
+    group.add_option('-B', '--binary', dest='filetype', action='store_const', const='Binary', help="force raw binary input (default for .bin files)")
+    group.add_option('--srec', dest='filetype', action='store_const', const='S-Record', help="force Motorola S-record input")
+    group.add_option('--base', dest='binaddress', metavar='ADDR',
+        help="start address of a binary image (default: the image ends at 0xffff)")
+    group.add_option('--trim', dest='bintrim', action='store_true', default=False,
+        help="drop trailing 0xff bytes of a binary image")
+    group.add_option('--overlap', dest='overlap', choices=memory.OVERLAP_POLICIES, default=memory.OVERLAP_ERROR,
+        help="ranges that several firmware files define differently: %s (default %%default)" % list(memory.OVERLAP_POLICIES))
+    group.add_option('--cpu', dest='cpu', choices=job.CPU_TYPES[1:], help="CPU family %s" % job.CPU_TYPES[1:])
+    parser.add_option_group(group)
+
+    group = OptionGroup(parser, 'BSL')
+    group.add_option('-P', '--password', dest='password', metavar='FILE', help="password file")
+    group.add_option('--bslfile', dest='bslfile', metavar='FILE', help="replacement BSL file")
+    group.add_option('-U', '--unpatched', dest='unpatched', action='store_true', help="leave the BSL unpatched")
+    group.add_option('--ignore-answer', dest='ignoreanswer', action='store_true', help="ignore BSL responses")
+    group.add_option('--no-download-bsl', dest='nodownloadbsl', action='store_true', help="never download a BSL")
+    group.add_option('--force-bsl', dest='forcebsl', action='store_true', help="force a BSL download")
+    group.add_option('--blank-run', dest='blankrun', type='int', default=job.BLANK_RUN, metavar='N',
+        help="do not program runs of N or more 0xff bytes after an erase, 0 to program them (default %default)")
+    group.add_option('--framesize', dest='framesize', type='int', help="max. data bytes per frame, 0 to auto-tune")
+    group.add_option('--erasecycles', dest='erasecycles', type='int', help="number of mass erase cycles")
+    parser.add_option_group(group)
+
+    group = OptionGroup(parser, 'Actions')
+    group.add_option('-e', '--masserase', dest='masserase', action='store_true', help="erase all flash memory")
+    group.add_option('-m', '--mainerase', dest='mainerase', action='store_true', help="erase main flash memory")
+    group.add_option('--erase', dest='erase', metavar='ADDR[-ADDR]|auto', help="erase a segment or segment range, 'auto' to erase the segments of the file with the fastest strategy")
+    group.add_option('-E', '--erasecheck', dest='erasecheck', action='store_true', help="erase check by file")
+    group.add_option('-p', '--program', dest='program', action='store_true', help="program file")
+    group.add_option('-v', '--verify', dest='verify', action='store_true', help="verify by file")
+    group.add_option('--bsl-version', dest='bslversion', action='store_true', help="read the BSL version")
+    parser.add_option_group(group)
+
+    group = OptionGroup(parser, 'Upload')
+    group.add_option('-u', '--upload', dest='startaddr', metavar='ADDR', help="upload a block starting at ADDR")
+    group.add_option('--size', dest='size', metavar='BYTES', help="upload block size")
+    group.add_option('-f', '--format', dest='outputformat', choices=job.UPLOAD_FORMATS, help="upload format %s" % job.UPLOAD_FORMATS)
+    group.add_option('-o', '--upload-file', dest='uploadfile', metavar='FILE', help="save the upload to a file instead of stdout")
+    parser.add_option_group(group)
+
+    group = OptionGroup(parser, 'On Exit')
+    group.add_option('-g', '--go', dest='goaddr', metavar='ADDR', help="start execution at ADDR")
+    group.add_option('-r', '--reset', dest='reset', action='store_true', help="reset the device")
+    group.add_option('-w', '--wait', dest='wait', action='store_true', help="wait for <Enter> before closing the port")
+    parser.add_option_group(group)
+    return parser
+
+# options taking integers that may be given in hex or octal
+ADDRESS_OPTIONS = ['startaddr', 'size', 'goaddr']
+
+def get_options(argv=None):
+    """
+    Parses the command line and returns (options dict, cli values)
+    """
+    parser = make_parser()
+    values, args = parser.parse_args(argv)
+    options = {}
+    if values.config:
+        options.update(job.read_config(values.config))
+    for opt in job.BSL_DEFAULTS.keys():
+        val = getattr(values, opt, None)
+        if val is None:
+            continue
+        if opt in ADDRESS_OPTIONS:
+            try:
+                val = int(val, 0)
+            except ValueError:
+                parser.error("invalid number: %s" % val)
+        options[opt] = val
+    if values.binaddress is not None:
+        try:
+            values.binaddress = int(values.binaddress, 0)
+        except ValueError:
+            parser.error("invalid number: %s" % values.binaddress)
+    if args:
+        options['filename'] = args[0]
+    values.extrafiles = args[1:]
+    return options, values
+
+def write_metrics(filename, format, result):
+    f = open(filename, 'w')
+    try:
+        if format == 'prometheus':
+            f.write(result.metrics.prometheus({'port': result.port}))
+        else:
+            json.dump(result.metrics.as_dict(), f, sort_keys=True, indent=1)
+            f.write("\n")
+    finally:
+        f.close()
+
+def set_debug(level):
+    job.DEBUG = level
+    bsl.DEBUG = level
+    memory.DEBUG = level
+
+def main(argv=None):
+    try:
+        options, values = get_options(argv)
+    except job.JobError, err:
+        sys.stderr.write("%s" % err)
+        return job.EXIT_OPTIONS
+    set_debug(values.debug)
+    progress = None
+    if values.progress:
+        progress = TextProgress()
+    out = sys.stdout
+    if values.json:
+        out = StringIO()    # uploaded data is part of the JSON result
+    result = job.run_job(options, log=sys.stderr, out=out, progress=progress, wait=wait_for_enter,
+        trace=values.trace, timeline=values.timeline, blankrun=values.blankrun,
+        binaddress=values.binaddress, bintrim=values.bintrim, extrafiles=values.extrafiles, overlap=values.overlap)
+    if values.json:
+        sys.stdout.write(json.dumps(result.as_dict(), sort_keys=True) + "\n")
+    if values.metrics and result.metrics is not None:
+        write_metrics(values.metrics, values.metricsformat, result)
+    if result.error:
+        sys.stderr.write("Error: %s\n" % result.error)
+    return result.exitcode
+
+if __name__ == '__main__':
+    sys.exit(main())
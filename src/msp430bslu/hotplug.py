@@ -0,0 +1,119 @@
+#!/usr/bin/env python
+#
+# USB serial adapter hotplug monitoring
+#
+# (C) 2009-2010 Flying Camp Design
+#
+# All Rights Reserved.
+#
+# AUTHOR: Chris Wilson <cwilson@flyingcampdesign.com>
+#
+# Released under a BSD-style license (please see LICENSE)
+
+import os
+import sys
+import time
+import select
+import threading
+import sscan
+
+DEBUG = 0
+
+# inotify constants from linux/inotify.h
+IN_ATTRIB = 0x00000004
+IN_CREATE = 0x00000100
+IN_DELETE = 0x00000200
+
+def _inotify_init(path):
+    """
+    Returns an inotify file descriptor watching path or None if inotify
+    is not available
+    """
+    if not getattr(sscan, 'USE_SYSFS', False):
+        return None
+    try:
+        import ctypes
+        import ctypes.util
+        libc = ctypes.CDLL(ctypes.util.find_library('c') or 'libc.so.6', use_errno=True)
+        fd = libc.inotify_init()
+        if fd < 0:
+            return None
+        if libc.inotify_add_watch(fd, path, IN_CREATE | IN_DELETE | IN_ATTRIB) < 0:
+            os.close(fd)
+            return None
+        return fd
+    except (ImportError, OSError, AttributeError):
+        return None
+
+class HotplugMonitor(threading.Thread):
+    """
+    Watches for USB serial adapters being connected or removed.
+    callback(event, port) is called from the monitor thread with event
+    'add' or 'remove'.  Uses inotify on /dev where available and polls
+    the port list every interval seconds otherwise.  Adapters are only
+    reported after they have been present for settle seconds, so udev
+    has a chance to set up the device node.
+    """
+    def __init__(self, callback, interval=1.0, settle=0.5, watchdir='/dev'):
+        threading.Thread.__init__(self, name='hotplug')
+        self.setDaemon(True)
+        self.callback = callback
+        self.interval = interval
+        self.settle = settle
+        self.watchdir = watchdir
+        self._stopevent = threading.Event()
+        self.known = set(sscan.usb_ports()) # already connected adapters are not reported
+        self.uses_inotify = False
+
+    def stop(self):
+        self._stopevent.set()
+
+    def stopped(self):
+        return self._stopevent.isSet()
+
+    def rescan(self):
+        """
+        Compares the current adapter list with the known one and reports the changes
+        """
+        current = set(sscan.usb_ports())
+        for port in sorted(self.known - current):
+            if DEBUG: sys.stderr.write("hotplug: %s removed\n" % port)
+            self.callback('remove', port)
+        for port in sorted(current - self.known):
+            if DEBUG: sys.stderr.write("hotplug: %s added\n" % port)
+            self.callback('add', port)
+        self.known = current
+
+    def run(self):
+        fd = _inotify_init(self.watchdir)
+        self.uses_inotify = fd is not None
+        try:
+            while not self.stopped():
+                if fd is not None:
+                    ready = select.select([fd], [], [], self.interval)[0]
+                    if not ready:
+                        continue
+                    os.read(fd, 4096) # contents don't matter, the port list is read from sysfs
+                    # let the burst of events for one device pass
+                    self._stopevent.wait(self.settle)
+                    while select.select([fd], [], [], 0)[0]:
+                        os.read(fd, 4096)
+                else:
+                    self._stopevent.wait(self.interval)
+                if not self.stopped():
+                    self.rescan()
+        finally:
+            if fd is not None:
+                os.close(fd)
+
+if __name__ == '__main__':
+    def report(event, port):
+        print "%s %s" % (event, port)
+    monitor = HotplugMonitor(report)
+    monitor.start()
+    print "Waiting for USB serial adapters (Ctrl+C to quit)..."
+    try:
+        while monitor.isAlive():
+            time.sleep(0.5)
+    except KeyboardInterrupt:
+        monitor.stop()
@@ -0,0 +1,1286 @@
+#!/usr/bin/env python
+#
+# GUI independent BSL job logic
+#
+# (C) 2009-2010 Flying Camp Design
+#
+# All Rights Reserved.
+#
+# AUTHOR: Chris Wilson <cwilson@flyingcampdesign.com>
+#
+# Parts based on code from Chris Liechti <cliechti@gmx.net>:
+# http://mspgcc.cvs.sourceforge.net/viewvc/mspgcc/python/msp430-bsl.py
+#
+# Released under a BSD-style license (please see LICENSE)
+
+import os
+import sys
+import time
+import ast
+import threading
+import Queue
+import ConfigParser
+import serial
+from mspgcc.util import hexdump, makeihex
+from mspgcc import memory, bsl, ports
+from mspgcc.timeline import Timeline
+from mspgcc.autotune import FrameSizeTuner
+from mspgcc.devices import default_layout
+import jobplan
+
+DEBUG = 0
+
+INFO_OPTS = 'App Info'
+APP_OPTS = 'App Options'
+BSL_OPTS = 'BSL Options'
+
+BAUDS = [9600, 19200, 38400]
+FILE_TYPES = ['Auto Select', 'IntelHex', 'TI-Text', 'Binary', 'S-Record']
+CPU_TYPES = ['Auto Select', 'F1x', 'F4x']
+UPLOAD_FORMATS = ['hex', 'ihex', 'bin', 'srec']
+HEX = 0
+INTELHEX = 1
+BINARY = 2
+SREC = 3
+
+# BSL option defaults, the keys are shared with the GUI variables and config files
+BSL_DEFAULTS = {
+    'comport': None,
+    'password': None,
+    'filename': None,
+    'framesize': 224,
+    'erasecycles': 1,
+    'unpatched': False,
+    'filetype': 'Auto Select',
+    'timeout': 1,
+    'bslfile': None,
+    'speed': BAUDS[0],
+    'cpu': 'Auto Select',
+    'invertrst': False,
+    'inverttest': False,
+    'swapresettest': False,
+    'testontx': False,
+    'ignoreanswer': False,
+    'nodownloadbsl': False,
+    'forcebsl': False,
+    'slowmode': False,
+    'masserase': False,
+    'mainerase': False,
+    'erase': None,
+    'erasecheck': False,
+    'program': False,
+    'verify': False,
+    'bslversion': False,
+    'startaddr': None,
+    'size': 2,
+    'outputformat': 'hex',
+    'uploadfile': None,
+    'goaddr': None,
+    'reset': False,
+    'wait': False,
+}
+
+# Exit codes of run_job() results
+EXIT_OK = 0
+EXIT_FAILED = 1         # unexpected error, e.g. unreadable file
+EXIT_OPTIONS = 2        # invalid options
+EXIT_SERIAL = 3         # serial port could not be opened or used
+EXIT_BSL = 4            # BSL communication error
+EXIT_VERIFY = 5         # verify or erase check failed
+EXIT_CANCELLED = 6
+
+BLANK_RUN = 64 # shorter 0xff runs are programmed anyway, splitting the frame costs more
+
+SESSION_IDLE_TIMEOUT = 60 # seconds a BSL session is kept powered without jobs
+SESSION_CHECK_INTERVAL = 10 # seconds between health checking syncs of an idle session
+
+# BootStrapLoader attributes carried over to the next job of a session
+SESSION_STATE = ['bslVer', 'devId', 'cpu', 'layout', 'patchRequired', 'patchLoaded', 'BSLMemAccessWarning']
+SESSION_PINS = ['invertRST', 'invertTEST', 'swapResetTest', 'testOnTX', 'slowmode']
+
+def parse_config_value(val):
+    """
+    Converts an option value as written by the GUI's write_config
+    """
+    if val.startswith("'") and val.endswith("'"):
+        return val[1:-1]
+    return ast.literal_eval(val)
+
+def read_config(filename):
+    """
+    Returns a dict with the BSL options saved in a config file
+    """
+    cfg = ConfigParser.RawConfigParser()
+    if not cfg.read(filename):
+        raise JobError("Could not read config file %s\n" % filename)
+    if not cfg.has_section(BSL_OPTS):
+        raise JobError("No '%s' section in config file %s\n" % (BSL_OPTS, filename))
+    options = {}
+    for opt, val in cfg.items(BSL_OPTS):
+        if opt in BSL_DEFAULTS:
+            try:
+                options[opt] = parse_config_value(val)
+            except (ValueError, SyntaxError):
+                raise JobError("Invalid value for %s in config file %s: %s\n" % (opt, filename, val), opt)
+    return options
+
+class JobError(Exception):
+    """
+    Invalid job options. option names the offending option, if known
+    """
+    def __init__(self, message, option=None):
+        Exception.__init__(self, message)
+        self.option = option
+
+class JobCancelled(Exception):
+    """
+    The job was cancelled by the user
+    """
+
+class UpdatingBootStrapLoader(bsl.BootStrapLoader):
+    """
+    BootStrapLoader wrapper class that updates a progress object
+    and stops at the next progress update once cancelled is set
+    """
+    def __init__(self, progress_obj=None, cancelled=None, *args, **kwargs):
+        bsl.BootStrapLoader.__init__(self, *args, **kwargs)
+        self.progress_obj = progress_obj
+        self.cancelled = cancelled
+
+    def progress_update(self, count, total=100):
+        """
+        Overloads the bsl.progress_update method in bsl.BootStrapLoader
+        """
+        if self.cancelled is not None and self.cancelled.isSet():
+            raise JobCancelled('Cancelled')
+        if bsl.DEBUG:
+            pcnt = (100*count/total)
+            sys.stderr.write("  %d%%\n" % pcnt)
+            sys.stderr.flush()
+        if self.progress_obj != None:
+            self.progress_obj.set(count, total)
+
+
+class OutputRouter:
+    """
+    File-like object that sends writes to a per thread target.
+    Installed as sys.stderr/sys.stdout so that the messages bsl writes
+    there end up in the output of the job running in that thread.
+    """
+    def __init__(self, default):
+        self.default = default
+        self._local = threading.local()
+
+    def route(self, target):
+        """
+        Send writes from the calling thread to target (None: default)
+        """
+        self._local.target = target
+
+    def target(self):
+        return getattr(self._local, 'target', None) or self.default
+
+    def write(self, text):
+        self.target().write(text)
+
+    def writelines(self, lines):
+        for line in lines: self.write(line)
+
+    def flush(self):
+        self.target().flush()
+
+
+class QueueWriter:
+    """
+    File-like object that posts (kind, tag, text) tuples to a queue, so
+    another thread can display them. Lines are prefixed with prefix.
+    """
+    def __init__(self, queue, kind, tag=None, prefix=''):
+        self.queue = queue
+        self.kind = kind
+        self.tag = tag
+        self.prefix = prefix
+        self._newline = True
+
+    def write(self, text):
+        text = str(text)
+        if self.prefix:
+            lines = text.split('\n')
+            out = []
+            for i, line in enumerate(lines):
+                if i:
+                    out.append('\n')
+                    self._newline = True
+                if line:
+                    if self._newline:
+                        out.append(self.prefix)
+                    out.append(line)
+                    self._newline = False
+            text = ''.join(out)
+        self.queue.put((self.kind, self.tag, text))
+
+    def writelines(self, lines):
+        for line in lines: self.write(line)
+
+    def flush(self):
+        pass
+
+
+class JobResult:
+    """
+    Structured outcome of a job
+    """
+    def __init__(self, port=None):
+        self.port = port
+        self.exitcode = EXIT_OK
+        self.error = None
+        self.elapsed = None
+        self.dev_id = None
+        self.bslVer = None
+        self.cpu = None
+        self.bytes = 0          # bytes programmed
+        self.framesize = None   # data bytes per frame, the last tuned value if auto-tuned
+        self.upload = None      # (startaddr, data) if data was uploaded
+        self.metrics = None     # mspgcc.metrics.ProtocolMetrics of the session
+        self.eraseplan = None   # mspgcc.eraseplan.ErasePlan if erase was 'auto'
+        self.mismatches = []    # bsl.Mismatch ranges found by verify or erase check
+        self.overlaps = []      # memory.Overlap ranges of the composed firmware files
+        self.save_error = None  # why the timeline could not be saved, the job outcome is unaffected
+
+    def ok(self):
+        return self.exitcode == EXIT_OK
+
+    def as_dict(self):
+        """
+        Returns the result as a dict of plain values (e.g. for JSON)
+        """
+        d = {
+            'port': self.port,
+            'ok': self.ok(),
+            'exitcode': self.exitcode,
+            'error': self.error,
+            'elapsed': self.elapsed,
+            'dev_id': self.dev_id,
+            'bslVer': self.bslVer,
+            'cpu': self.cpu,
+            'bytes': self.bytes,
+            'framesize': self.framesize,
+        }
+        if self.upload is not None:
+            d['upload'] = {'address': self.upload[0], 'data': self.upload[1].encode('hex')}
+        if self.metrics is not None:
+            d['metrics'] = self.metrics.as_dict()
+        if self.eraseplan is not None:
+            d['eraseplan'] = self.eraseplan.as_dict()
+        if self.mismatches:
+            d['mismatches'] = [mismatch.as_dict() for mismatch in self.mismatches]
+        if self.overlaps:
+            d['overlaps'] = [overlap.as_dict() for overlap in self.overlaps]
+        if self.save_error is not None:
+            d['save_error'] = self.save_error
+        return d
+
+def exitcode_for(err):
+    """
+    Maps an exception raised by Job.run to an exit code
+    """
+    if isinstance(err, JobError):
+        return EXIT_OPTIONS
+    elif isinstance(err, JobCancelled):
+        return EXIT_CANCELLED
+    elif isinstance(err, serial.SerialException):
+        return EXIT_SERIAL
+    elif isinstance(err, bsl.BSLException):
+        if str(err) in (bsl.BootStrapLoader.ERR_VERIFY_FAILED, bsl.BootStrapLoader.ERR_ERASE_CHECK_FAILED):
+            return EXIT_VERIFY
+        return EXIT_BSL
+    return EXIT_FAILED
+
+
+class ProgressProxy:
+    """
+    Progress object for worker threads. Only the latest value is kept,
+    the GUI picks it up with take() at its own pace.
+    """
+    def __init__(self):
+        self._value = None
+
+    def set(self, count, total=100):
+        self._value = (count, total)   # single assignment, no lock needed
+
+    def take(self):
+        """
+        Returns the latest (count, total) once, None if unchanged
+        """
+        value, self._value = self._value, None
+        return value
+
+
+class BSLSession:
+    """
+    Keeps the serial port of one device open between jobs. After a job
+    that entered the BSL the device stays powered and unlocked at the
+    negotiated speed, so the next job can skip the entry sequence,
+    password, version read, patch download and baud rate change. The
+    device ID is read to check that the BSL still answers before the
+    session is resumed. (A bare sync can not be used, the BSL takes a
+    second sync character for the start of a frame.)
+    """
+    def __init__(self, port, idle_timeout=SESSION_IDLE_TIMEOUT, check_interval=SESSION_CHECK_INTERVAL):
+        self.port = port
+        self.idle_timeout = idle_timeout
+        self.check_interval = check_interval
+        self.serialport = None
+        self.state = None # dict of SESSION_STATE, speed and pins while the BSL is active
+        self.jobs = 0
+        self.resumed = 0
+        self.last_used = None
+        self.last_check = None
+        self.busy = False
+        self.lock = threading.Lock()
+        self.layout = None # of the device seen last, expected for the next job
+
+    def attach(self, bslobj, tracefile=None):
+        """
+        Connects bslobj to the port, opens it if needed. The traffic is
+        recorded to tracefile if given.
+        """
+        self.lock.acquire()
+        try:
+            self.busy = True
+        finally:
+            self.lock.release()
+        if self.serialport is not None:
+            bslobj.comInit(ports.open_port(self.serialport, tracefile)) # reuse the open port
+        else:
+            bslobj.comInit(ports.open_port(self.port, tracefile))
+            self.serialport = bslobj.serialport
+        self.jobs += 1
+
+    def resume(self, bslobj):
+        """
+        Continues the active BSL of the previous job in bslobj. Returns
+        False if there is none or it does not answer, the job has to
+        enter the BSL then.
+        """
+        state, self.state = self.state, None
+        if state is None:
+            return False
+        bslobj.serialport.setBaudrate(state['speed'])
+        if not self._alive(bslobj, state):
+            bslobj.serialport.setBaudrate(9600)
+            return False
+        for name in SESSION_STATE:
+            setattr(bslobj, name, state[name])
+        self.resumed += 1
+        return True
+
+    def release(self, bslobj, keep=False):
+        """
+        Disconnects bslobj. With keep the device stays powered and the
+        BSL state is saved for the next job, otherwise power is switched
+        off like comDone does, but the port stays open.
+        """
+        self.lock.acquire()
+        try:
+            if keep and self.idle_timeout > 0:
+                self.state = dict([(name, getattr(bslobj, name)) for name in SESSION_STATE + SESSION_PINS])
+                self.state['speed'] = bslobj.serialport.baudrate
+            else:
+                self.state = None
+                bslobj.SetRSTpin(0) # disable power
+                bslobj.SetTESTpin(0)
+            if bslobj.layout is not None:
+                self.layout = bslobj.layout
+            if bslobj.metrics is not None:
+                bslobj.metrics.stop()
+            self.last_used = self.last_check = time.time()
+            self.busy = False
+        finally:
+            self.lock.release()
+
+    def _alive(self, bslobj, state):
+        """
+        Returns True if the BSL answers with the device ID of the session
+        """
+        try:
+            return bslobj.readBSLInfo()[0] == state['devId']
+        except bsl.BSLException:
+            return False
+
+    def _lowlevel(self):
+        """
+        Returns a BootStrapLoader for the pins and checks of an idle session
+        """
+        lowlevel = bsl.BootStrapLoader()
+        lowlevel.serialport = self.serialport
+        lowlevel.metrics = None
+        for name in SESSION_PINS:
+            setattr(lowlevel, name, self.state[name])
+        return lowlevel
+
+    def poll(self):
+        """
+        Called periodically. Powers the device down after idle_timeout,
+        checks that the BSL answers every check_interval seconds. This
+        does serial I/O, call it from a worker thread. Returns why the
+        session ended ('idle' or 'lost'), None if it did not.
+        """
+        if not self.lock.acquire(False):
+            return None
+        try:
+            if self.busy or self.state is None:
+                return None
+            now = time.time()
+            if now - self.last_used > self.idle_timeout:
+                if DEBUG: sys.stderr.write("%s: BSL session idle, powering down\n" % self.port)
+                self.deactivate()
+                return 'idle'
+            elif now - self.last_check > self.check_interval:
+                self.last_check = now
+                try:
+                    alive = self._alive(self._lowlevel(), self.state)
+                except serial.SerialException:
+                    alive = False
+                if not alive:
+                    if DEBUG: sys.stderr.write("%s: BSL session lost\n" % self.port)
+                    self.deactivate()
+                    return 'lost'
+            return None
+        finally:
+            self.lock.release()
+
+    def deactivate(self):
+        """
+        Ends the active BSL: powers the device down, keeps the port open
+        """
+        if self.state is not None:
+            lowlevel = self._lowlevel()
+            self.state = None
+            try:
+                lowlevel.SetRSTpin(0)
+                lowlevel.SetTESTpin(0)
+                self.serialport.setBaudrate(9600)
+            except serial.SerialException:
+                self.close()
+
+    def is_active(self):
+        return self.state is not None
+
+    def close(self):
+        if self.serialport is not None:
+            if self.state is not None:
+                self.deactivate()
+            try:
+                self.serialport.close()
+            except serial.SerialException:
+                pass
+            self.serialport = None
+        self.state = None
+        self.busy = False
+
+    def is_open(self):
+        return self.serialport is not None
+
+
+class SessionManager:
+    """
+    BSL sessions by port name. start() checks the idle sessions in a
+    monitor thread, so that their serial I/O does not block the caller.
+    """
+    poll_interval = 1 # seconds between checks of the idle sessions
+
+    def __init__(self, idle_timeout=SESSION_IDLE_TIMEOUT):
+        self.idle_timeout = idle_timeout
+        self.sessions = {}
+        self.lock = threading.Lock()
+        self.monitor = None
+        self.stopped = threading.Event()
+        self.notify = None
+
+    def start(self, notify=None):
+        """
+        Starts the monitor thread. notify(port, reason) is called from it
+        when a session ends, see BSLSession.poll.
+        """
+        if self.monitor is None:
+            self.notify = notify
+            self.stopped.clear()
+            self.monitor = threading.Thread(target=self._monitor, name="BSL sessions")
+            self.monitor.setDaemon(True)
+            self.monitor.start()
+
+    def stop(self):
+        if self.monitor is not None:
+            self.stopped.set()
+            self.monitor.join(5)
+            self.monitor = None
+
+    def _monitor(self):
+        while not self.stopped.isSet():
+            self.stopped.wait(self.poll_interval)
+            if not self.stopped.isSet():
+                for port, reason in self.poll():
+                    if self.notify is not None:
+                        self.notify(port, reason)
+
+    def get(self, port):
+        self.lock.acquire()
+        try:
+            session = self.sessions.get(port)
+            if session is None:
+                session = self.sessions[port] = BSLSession(port, self.idle_timeout)
+            return session
+        finally:
+            self.lock.release()
+
+    def poll(self):
+        """
+        Polls all sessions, returns (port, reason) of those that ended
+        """
+        ended = []
+        for session in self.sessions.values():
+            try:
+                reason = session.poll()
+            except Exception:
+                session.close() # reopened by the next job
+                reason = 'lost'
+            if reason is not None:
+                ended.append((session.port, reason))
+        return ended
+
+    def close(self, port):
+        session = self.sessions.pop(port, None)
+        if session is not None:
+            session.close()
+
+    def close_all(self):
+        self.stop()
+        for port in self.sessions.keys():
+            self.close(port)
+
+
+def _route(stream, target):
+    if isinstance(stream, OutputRouter):
+        stream.route(target)
+
+class Job:
+    """
+    One BSL session (erase, program, verify, upload, ...) as selected by
+    a dict of options using the BSL_DEFAULTS keys
+    """
+    def __init__(self, options, log=None, out=None, progress=None, wait=None, trace=None, timeline=None, session=None,
+                 blankrun=BLANK_RUN, binaddress=None, bintrim=False, extrafiles=(), overlap=memory.OVERLAP_ERROR):
+        self.options = dict(BSL_DEFAULTS)
+        self.options.update(options)
+        self.log = log or sys.stderr
+        self.out = out or sys.stdout
+        self.progress = progress
+        self.wait_callback = wait
+        self.trace = trace # file to record the serial traffic to
+        self.timeline = timeline # file to save a Chrome trace event timeline to
+        self.session = session # BSLSession to keep the BSL active between jobs
+        self.blankrun = blankrun # 0xff runs not programmed after an erase, 0: off
+        self.binaddress = binaddress # start of a binary image, None: it ends at 0xffff
+        self.bintrim = bintrim # drop trailing 0xff of a binary image
+        self.extrafiles = list(extrafiles) # more firmware files composed with filename, FILE@ADDR for binaries
+        self.overlap = overlap # memory.OVERLAP_POLICIES entry for ranges the files define differently
+        self.keep_bsl = False # the BSL is active when the job ends
+        self.bslobj = None
+        self.result = JobResult(self.options['comport'])
+        self.cancelled = threading.Event()
+
+    def cancel(self):
+        """
+        Requests the job to stop at the next action or progress update
+        """
+        self.cancelled.set()
+
+    def check_cancelled(self):
+        if self.cancelled.isSet():
+            raise JobCancelled('Cancelled')
+
+    def parse_options(self):
+        """
+        Validates the options and converts them to the values used by the BSL
+        """
+        opts = self.options
+        self.wait = opts['wait']
+        self.maxData = opts['framesize']
+        self.meraseCycles = opts['erasecycles']
+        self.masserase = opts['masserase']
+        self.mainerase = opts['mainerase']
+        self.erasecheck = opts['erasecheck']
+        self.program = opts['program']
+        self.verify = opts['verify']
+        self.reset = opts['reset']
+        self.goaddr = opts['goaddr']
+        self.unpatched = opts['unpatched']
+        self.startaddr = opts['startaddr']
+        self.size = opts['size']
+        self.invertrst = opts['invertrst']
+        self.inverttest = opts['inverttest']
+        self.forcebsl = opts['forcebsl']
+        self.slowmode = opts['slowmode']
+        self.swapresettest = opts['swapresettest']
+        self.testontx = opts['testontx']
+        self.ignoreanswer = opts['ignoreanswer']
+        self.uploadfile = opts['uploadfile']
+        self.bslversion = opts['bslversion']
+
+        self.timeout = opts['timeout']
+        if not self.timeout:
+            self.timeout = 0
+
+        comPort = opts['comport']
+        if not comPort:
+            raise JobError('No serial port selected\n', 'comport')
+        if comPort.startswith('COM'):
+            try:
+                comPort = int(comPort.lstrip('COM'), 0) - 1
+            except ValueError:
+                raise JobError('Invalid COM port\n', 'comport')
+        self.comPort = comPort
+
+        password = opts['password']
+        if not password:
+            password = None
+        elif not os.path.isfile(password):
+            raise JobError('Invalid password file\n', 'password')
+        self.password = password
+
+        erase = opts['erase']
+        self.eraseauto = erase == 'auto'
+        try:
+            if self.eraseauto:
+                # segments and strategy are chosen by the erase planner
+                if not opts['filename']:
+                    raise JobError("Erase 'auto' needs a firmware file\n", 'erase')
+                self.adr1 = None
+                self.adr2 = None
+            elif erase:
+                if '-' in erase:
+                    str1, str2 = erase.split('-', 1)
+                    self.adr1 = int(str1, 0)
+                    self.adr2 = int(str2, 0)
+                else:
+                    self.adr1 = int(erase, 0)
+                    self.adr2 = None
+            else:
+                self.adr1 = None
+                self.adr2 = None
+        except ValueError:
+            raise JobError("Invalid erase range: %s\n" % erase, 'erase')
+
+        outputformat = opts['outputformat']
+        if outputformat == 'hex':
+            self.outputformat = HEX
+        elif outputformat == 'bin':
+            self.outputformat = BINARY
+        elif outputformat == 'ihex':
+            self.outputformat = INTELHEX
+        elif outputformat == 'srec':
+            self.outputformat = SREC
+        else:
+            raise JobError('Invalid output format\n', 'outputformat')
+
+        filetype = opts['filetype']
+        if filetype == 'Auto Select':
+            self.filetype = None
+        elif filetype == 'IntelHex':
+            self.filetype = 0
+        elif filetype == 'TI-Text':
+            self.filetype = 1
+        elif filetype == 'Binary':
+            self.filetype = 2
+        elif filetype == 'S-Record':
+            self.filetype = 3
+        else:
+            raise JobError('Invalid firmware file type\n', 'filetype')
+
+        bslfile = opts['bslfile']
+        if not bslfile:
+            bslfile = None
+        elif not os.path.isfile(bslfile):
+            raise JobError('Invalid BSL file\n', 'bslfile')
+        self.bslfile = bslfile
+
+        self.speed = opts['speed']
+        if self.speed not in BAUDS:
+            raise JobError("Unspported baud rate: %d\nSupported baud rates: %s" % (self.speed, BAUDS), 'speed')
+
+        cpu = opts['cpu']
+        if cpu == 'Auto Select':
+            self.cpu = None
+        elif cpu == 'F1x':
+            self.cpu = bsl.F1x
+        elif cpu == 'F4x':
+            self.cpu = bsl.F4x
+        else:
+            raise JobError('Invalid device type\n', 'cpu')
+
+        self.mayusebsl = not opts['nodownloadbsl']
+
+        filename = opts['filename']
+        if not filename:
+            filename = None
+        elif filename == '-': # FIXME
+            pass
+        elif self.program and not os.path.isfile(filename):
+            raise JobError('Invalid firmware input file\n', 'filename')
+        self.filename = filename
+        if self.extrafiles:
+            if filename is None:
+                raise JobError('Additional firmware files need a firmware file\n', 'filename')
+            for spec in self.extrafiles:
+                if not os.path.isfile(image_spec(spec)[0]):
+                    raise JobError('Invalid firmware input file %s\n' % spec, 'filename')
+        if self.overlap not in memory.OVERLAP_POLICIES:
+            raise JobError('Invalid overlap policy %s\n' % self.overlap)
+
+    def run(self):
+        """
+        Runs the job and fills in self.result. Errors are raised after
+        being recorded in the result. bsl output of the calling thread
+        goes to self.log if sys.stderr is an OutputRouter.
+        """
+        _route(sys.stderr, self.log)
+        _route(sys.stdout, self.out)
+        start = time.time()
+        try:
+            try:
+                self._run()
+            except Exception, err:
+                self.result.exitcode = exitcode_for(err)
+                self.result.error = str(err).strip()
+                raise
+        finally:
+            self.result.elapsed = time.time() - start
+            if self.bslobj is not None:
+                self.result.dev_id = self.bslobj.devId
+                self.result.bslVer = self.bslobj.bslVer or None
+                self.result.cpu = self.bslobj.cpu
+                self.result.bytes = self.bslobj.byteCtr
+                if self.bslobj.tuner is not None:
+                    self.result.framesize = self.bslobj.tuner.size()
+                else:
+                    self.result.framesize = self.bslobj.maxData
+                self.result.metrics = self.bslobj.metrics
+                self.result.eraseplan = self.bslobj.erasePlan
+                self.result.mismatches = self.bslobj.mismatches
+                if self.bslobj.tracer is not None:
+                    # a failed save must not hide the outcome of the job
+                    try:
+                        self.bslobj.tracer.save(self.timeline)
+                    except EnvironmentError, err:
+                        self.result.save_error = str(err)
+                        sys.stderr.write('Saving the timeline to %s failed: %s\n' % (self.timeline, err))
+            _route(sys.stderr, None)
+            _route(sys.stdout, None)
+
+    # Most of the bsl logic below is adapted from msp430-bsl.py by Chris Liechti
+    def _run(self):
+        self.parse_options()
+
+        bslobj = UpdatingBootStrapLoader(progress_obj=self.progress, cancelled=self.cancelled)
+        self.bslobj = bslobj
+        bslobj.showprogress = 1
+        if self.timeline:
+            bslobj.tracer = Timeline()
+        plan = jobplan.JobPlan(self.blankrun)
+
+        if self.timeout:
+            bslobj.timeout = self.timeout
+            if DEBUG: self.log.write("Timeout set to %d.\n" % self.timeout)
+
+        if self.password:
+            bslobj.passwd = memory.Memory(self.password).getMemrange(0xffe0, 0xffff)
+            if DEBUG: self.log.write("Using password file: %s.\n" % self.password)
+
+        # Make sure that conditions for maxData are met:
+        # ( >= 16 and == n*16 and <= MAX_DATA_BYTES!)
+        maxData = self.maxData
+        if not maxData: # 0 selects auto-tuning
+            maxData = bsl.BootStrapLoader.MAX_DATA_BYTES
+            bslobj.tuner = FrameSizeTuner(maxData - (maxData % 16))
+            if DEBUG: self.log.write("Frame size auto-tuning enabled.\n")
+        elif maxData > bsl.BootStrapLoader.MAX_DATA_BYTES:
+            maxData = bsl.BootStrapLoader.MAX_DATA_BYTES
+        elif maxData < 16:
+            maxData = 16
+        bslobj.maxData = maxData - (maxData % 16)
+        if DEBUG: self.log.write("Max. number of data bytes within one frame set to %d.\n" % maxData)
+
+        bslobj.meraseCycles = self.meraseCycles
+        if DEBUG: self.log.write("Number of mass erase cycles set to %d.\n" % self.meraseCycles)
+
+        if self.masserase:
+            plan.init.append(jobplan.masserase_step(bslobj)) # Erase entire Flash
+
+        if self.mainerase:
+            plan.init.append(jobplan.mainerase_step(bslobj)) # Erase main Flash
+
+        if self.eraseauto:
+            plan.init.append(jobplan.autoerase_step(bslobj, usepatch=not self.unpatched)) # Erase the segments of the file
+
+        if self.adr1:
+            # segment sizes come from the layout of the connected device
+            plan.init.append(jobplan.segmenterase_step(bslobj, self.adr1, self.adr2))
+
+        if self.erasecheck:
+            plan.init.append(jobplan.Step(jobplan.ERASECHECK, bslobj.actionEraseCheck)) # Erase Check (by file)
+
+        if self.program:
+            plan.work.append(jobplan.Step(jobplan.PROGRAM, bslobj.actionProgram)) # Program file
+
+        if self.verify:
+            plan.work.append(jobplan.Step(jobplan.VERIFY, bslobj.actionVerify)) # Verify file
+
+        if self.bslfile:
+            bslrepl = bsl.imageFile(self.bslfile) # File to program, parsed once per content
+        else:
+            bslrepl = None
+
+        if self.bslversion:
+            plan.work.append(jobplan.Step(jobplan.BSLVERSION, bslobj.actionReadBSLVersion)) # load replacement BSL as first item
+
+        if self.cpu:
+            bslobj.cpu = self.cpu
+
+        bslobj.invertRST = self.invertrst
+
+        bslobj.invertTEST = self.inverttest
+
+        bslobj.slowmode = self.slowmode
+
+        bslobj.swapResetTest = self.swapresettest
+
+        bslobj.testOnTX = self.testontx
+
+        bslobj.ignoreAnswer = self.ignoreanswer
+
+        # prepare data to download while the port is opened and the BSL invoked
+        loader = ImageLoader(self.load_image, bslobj.tuner is None and bslobj.maxData,
+            self.expected_layout().boundaries(), self.log, self.out)
+        loader.start()
+
+        self.check_cancelled()
+        self.open_port(bslobj) # init port
+        try:
+            if self.enters_bsl(plan, bslrepl):
+                bslobj.bslReset(1) # invoke the BSL, the plan goes on from there
+                plan.entered = 1
+            bslobj.data = loader.result()
+            if DEBUG > 3: self.log.write("File: %r" % self.filename)
+            for overlap in self.result.overlaps:
+                self.log.write("Overlap: %s\n" % overlap.describe(self.image_names()))
+
+            jobplan.optimize(plan, bslobj.data, bslobj)
+            for note in plan.notes:
+                self.log.write("Plan: %s\n" % note)
+            if DEBUG > 0:
+                # show a nice list of sheduled actions
+                for line in plan.describe():
+                    self.log.write("   %s\n" % line)
+
+            self._execute(bslobj, plan, bslrepl)
+        except:
+            self.keep_bsl = False
+            self.close_port(bslobj) # Release serial communication port
+            raise
+        self.close_port(bslobj) # Release serial communication port
+        if bslobj.tuner is not None:
+            self.log.write("Auto-tuned frame size: %d bytes\n" % bslobj.tuner.size())
+
+    def enters_bsl(self, plan, bslrepl):
+        """
+        True if executing the plan starts with invoking the BSL, i.e. it
+        has actions and can not resume the BSL of the session
+        """
+        if not (plan.init or plan.work or self.goaddr or self.startaddr):
+            return False
+        return not (self.session is not None and self.session.is_active()
+                    and not (plan.init or bslrepl or self.forcebsl))
+
+    def expected_layout(self):
+        """
+        Returns the memory layout of the device the job will most likely
+        find: the one seen last on the port of the session, else the
+        default layout
+        """
+        if self.session is not None and self.session.layout is not None:
+            return self.session.layout
+        return default_layout
+
+    def load_image(self):
+        """
+        Returns the firmware file as Memory object, an empty one if no
+        file is given. Override to share parsed images between jobs.
+        """
+        if not self.extrafiles:
+            return load_image(self.filename, self.filetype, self.binaddress, self.bintrim)
+        images = [load_image(self.filename, self.filetype, self.binaddress, self.bintrim)]
+        for spec in self.extrafiles:
+            images.append(load_image(*image_spec(spec)))
+        return self.compose(images)
+
+    def compose(self, images):
+        """
+        Combines the loaded firmware files, overlapping ranges are
+        recorded in the result
+        """
+        try:
+            data = memory.compose(images, self.overlap)
+        except memory.OverlapError, err:
+            self.result.overlaps = err.overlaps
+            raise
+        self.result.overlaps = data.overlaps
+        return data
+
+    def image_names(self):
+        """
+        Names of the composed firmware files, in the order of the image
+        indexes of memory.Overlap
+        """
+        return [self.filename] + self.extrafiles
+
+    def open_port(self, bslobj):
+        """
+        Connects bslobj to the serial port or the session
+        """
+        if self.session is not None:
+            self.session.attach(bslobj, self.trace)
+        else:
+            bslobj.comInit(ports.open_port(self.comPort, self.trace))
+
+    def close_port(self, bslobj):
+        if self.session is not None:
+            self.session.release(bslobj, self.keep_bsl)
+        else:
+            bslobj.comDone()
+
+    def _execute(self, bslobj, plan, bslrepl):
+        self.keep_bsl = False
+        # initialization list
+        if plan.init: # erase and erase check
+            if DEBUG: self.log.write('Preparing device ...\n')
+            for f in plan.init:
+                self.check_cancelled()
+                f()
+
+        if plan.work or self.goaddr or self.startaddr:
+            if DEBUG: self.log.write('Actions ...\n')
+            # continue the BSL of the previous job unless the device was reset
+            # or a different BSL is requested
+            if self.session is not None and not (plan.init or bslrepl or self.forcebsl) and self.session.resume(bslobj):
+                self.log.write("Resuming BSL session (version %x.%x, %d baud) ...\n" % (
+                    bslobj.bslVer >> 8, bslobj.bslVer & 0xff, bslobj.serialport.baudrate))
+                if self.speed != bslobj.serialport.baudrate:
+                    bslobj.actionChangeBaudrate(self.speed)
+            else:
+                # connect to the BSL
+                bslobj.actionStartBSL(
+                    usepatch=not self.unpatched,
+                    replacementBSL=bslrepl,
+                    forceBSL=self.forcebsl,
+                    mayuseBSL=self.mayusebsl,
+                    speed=self.speed,
+                    bslreset=plan.bslreset,
+                )
+            self.keep_bsl = self.session is not None
+
+        # work list
+        if plan.work:
+            for f in plan.work: # work through todo list
+                self.check_cancelled()
+                f()
+
+        if self.reset: # reset device first if desired
+            self.keep_bsl = False
+            bslobj.actionReset()
+
+        if self.goaddr is not None: # start user programm at specified address
+            self.keep_bsl = False
+            bslobj.actionRun(self.goaddr) # load PC and execute
+
+        # upload datablock and output
+        startaddr = self.startaddr
+        if startaddr is not None:
+            if self.goaddr: # if a program was started...
+                # don't restart BSL but wait for the device to enter it itself
+                if DEBUG: self.log.write('Waiting for device to reconnect for upload: ')
+                bslobj.txPasswd(bslobj.passwd, wait=1) # synchronize, try forever...
+                data = bslobj.uploadData(startaddr, self.size) # upload data
+            else:
+                data = bslobj.uploadData(startaddr, self.size) # upload data
+            self.result.upload = (startaddr, data)
+            self.write_upload(startaddr, data)
+
+        if self.wait: # wait at the end if desired
+            if self.wait_callback:
+                self.wait_callback()
+
+    def write_upload(self, startaddr, data):
+        """
+        Writes uploaded data to the upload file or to the output
+        """
+        uploadfile = self.uploadfile
+        if self.outputformat == HEX: # depending on output format
+            if uploadfile:
+                self.log.write("Uploading hex data to %s..." % uploadfile)
+                f = open(uploadfile, 'wb')
+                hexdump((startaddr, data), output=f)
+                f.close()
+                self.log.write('SUCCESS\n')
+            else:
+                if DEBUG: self.log.write('Uploading hex data to output window...')
+                hexdump((startaddr, data), output=self.out)
+                if DEBUG: self.log.write('SUCCESS\n')
+        elif self.outputformat == INTELHEX:
+            if uploadfile:
+                self.log.write("Uploading ihex data to %s..." % uploadfile)
+                f = open(uploadfile, 'wb')
+                makeihex((startaddr, data), output=f)
+                f.close()
+                self.log.write('SUCCESS\n')
+            else:
+                if DEBUG: self.log.write('Uploading ihex data to output window...')
+                makeihex((startaddr, data), output=self.out)
+                if DEBUG: self.log.write('SUCCESS\n')
+        elif self.outputformat == SREC:
+            image = memory.Memory()
+            image.append(memory.Segment(startaddr, data))
+            if uploadfile:
+                self.log.write("Uploading S-record data to %s..." % uploadfile)
+                f = open(uploadfile, 'wb')
+                image.saveSRec(f)
+                f.close()
+                self.log.write('SUCCESS\n')
+            else:
+                if DEBUG: self.log.write('Uploading S-record data to output window...')
+                image.saveSRec(self.out)
+                if DEBUG: self.log.write('SUCCESS\n')
+        else:
+            if uploadfile:
+                self.log.write("Uploading binary data to %s..." % uploadfile)
+                f = open(uploadfile, 'wb')
+                f.write(data)
+                f.close()
+                self.log.write('SUCCESS\n')
+            else:
+                if DEBUG: self.log.write('Uploading binary data to output window...')
+                self.out.write(data) #binary output w/o newline!
+                if DEBUG: self.log.write('SUCCESS\n')
+
+
+class ImageLoader(threading.Thread):
+    """
+    Calls load() in the background and compiles the image into frames of
+    maxData bytes (unless 0) that do not cross boundaries, so that parsing
+    overlaps with opening the port and the BSL entry sequence. Output of
+    the thread goes to log and out like that of the job.
+    """
+    def __init__(self, load, maxData=0, boundaries=(), log=None, out=None):
+        threading.Thread.__init__(self, name="image loader")
+        self.setDaemon(True)
+        self.load = load
+        self.maxData = maxData
+        self.boundaries = boundaries
+        self.log = log
+        self.out = out
+        self.image = None
+        self.exc_info = None
+
+    def run(self):
+        _route(sys.stderr, self.log)
+        _route(sys.stdout, self.out)
+        try:
+            image = memory.CompiledImage(self.load())
+            if self.maxData:
+                image.frames(self.maxData, self.boundaries)
+            self.image = image
+        except:
+            self.exc_info = sys.exc_info()
+
+    def result(self):
+        """
+        Waits for the image and returns it, errors of load() are raised
+        """
+        self.join()
+        if self.exc_info is not None:
+            raise self.exc_info[0], self.exc_info[1], self.exc_info[2]
+        return self.image
+
+
+def load_image(filename, filetype=None, binaddress=None, bintrim=False):
+    """
+    Loads a firmware file. filetype is 0 for Intel-Hex, 1 for TI-Text,
+    2 for a binary image at binaddress, 3 for Motorola S-records or None
+    to detect the format
+    (.bin files are binary images)
+    """
+    data = memory.Memory() # prepare downloaded data
+    if filename is not None: # if the filename is given...
+        if filetype is None and filename.lower().endswith('.bin'):
+            filetype = 2
+        file = open(filename, 'rb') # or from a file
+        try:
+            if filetype is not None:
+                if filetype == 0: # select load function
+                    data.loadIHex(file) # intel hex
+                elif filetype == 1:
+                    data.loadTIText(file) # TI's format
+                elif filetype == 2:
+                    data.loadBinary(file, binaddress, bintrim) # raw image, memory mapped
+                elif filetype == 3:
+                    data.loadSRec(file) # Motorola S19/S28/S37
+                else:
+                    raise ValueError('Illegal filetype specified')
+            else: # no filetype given...
+                data.loadFile(filename) # autodetect otherwise
+        finally:
+            file.close()
+    return data
+
+
+def image_spec(spec):
+    """
+    Splits a 'FILE@ADDR' firmware file argument into (FILE, 2, ADDR),
+    the arguments of load_image for a binary image at ADDR. Other names
+    give (FILE, None, None)
+    """
+    if '@' in spec and not os.path.exists(spec):
+        filename, address = spec.rsplit('@', 1)
+        try:
+            return filename, 2, int(address, 0)
+        except ValueError:
+            pass
+    return spec, None, None
+
+
+class JobThread(threading.Thread):
+    """
+    Runs a job in a worker thread. Log and output text is posted to queue
+    as ('log', tag, text) and ('out', tag, text), a request to wait for
+    the user as ('wait', tag, event) and the outcome as ('done', tag, None)
+    or ('error', tag, exception).
+    """
+    def __init__(self, options, queue, tag=None, prefix='', progress=None, session=None):
+        threading.Thread.__init__(self, name="job %s" % tag)
+        self.setDaemon(True)
+        self.queue = queue
+        self.tag = tag
+        self.progress = progress
+        self.job = Job(options,
+            log=QueueWriter(queue, 'log', tag, prefix),
+            out=QueueWriter(queue, 'out', tag, prefix),
+            progress=progress,
+            wait=self.wait_for_user,
+            session=session)
+
+    def wait_for_user(self):
+        """
+        Blocks until the thread handling the queue sets the posted event
+        """
+        event = threading.Event()
+        self.queue.put(('wait', self.tag, event))
+        while not event.isSet() and not self.job.cancelled.isSet():
+            event.wait(0.1)
+
+    def cancel(self):
+        self.job.cancel()
+
+    def run(self):
+        # the outcome is always posted, the owner waits for it to run the next job
+        outcome = ('error', self.tag, JobError('Job aborted\n'))
+        try:
+            try:
+                self.job.run()
+            except (JobError, JobCancelled, bsl.BSLException, memory.FileFormatError), err:
+                outcome = ('error', self.tag, err)
+            except Exception, err:
+                if self.job.session is not None:
+                    self.job.session.close() # port may be gone or in an unknown state, reopen for the next job
+                outcome = ('error', self.tag, err)
+            else:
+                outcome = ('done', self.tag, None)
+        finally:
+            self.queue.put(outcome)
+
+
+class JobExecutor:
+    """
+    Runs jobs in worker threads, one job per tag at a time. The owner
+    calls events() periodically (e.g. from a Tk after() callback) to get
+    the posted events. With a SessionManager, the BSL stays active
+    between the jobs of a port, sessions that end while idle are posted
+    as ('session', port, reason).
+    """
+    def __init__(self, sessions=None):
+        self.queue = Queue.Queue()
+        self.threads = {}
+        self.sessions = sessions
+        if sessions is not None:
+            sessions.start(lambda port, reason: self.queue.put(('session', port, reason)))
+
+    def submit(self, options, tag, prefix='', progress=None):
+        """
+        Starts a job, returns the JobThread. Raises JobError if a job
+        with the same tag is still running.
+        """
+        if tag in self.threads:
+            raise JobError("A job is already running for %s\n" % tag)
+        session = None
+        if self.sessions is not None and options.get('comport'):
+            session = self.sessions.get(options['comport'])
+            if session.busy:
+                raise JobError("A job is already running on %s\n" % options['comport'])
+        worker = JobThread(options, self.queue, tag=tag, prefix=prefix, progress=progress, session=session)
+        self.threads[tag] = worker
+        worker.start()
+        return worker
+
+    def running(self, tag):
+        return tag in self.threads
+
+    def cancel(self, tag):
+        if tag in self.threads:
+            self.threads[tag].cancel()
+
+    def cancel_all(self):
+        for worker in self.threads.values():
+            worker.cancel()
+
+    def post(self, *event):
+        """
+        Posts an event from another thread (e.g. the hotplug monitor)
+        """
+        self.queue.put(event)
+
+    def events(self):
+        """
+        Returns the list of pending events, forgets finished jobs
+        """
+        events = []
+        try:
+            while True:
+                event = self.queue.get_nowait()
+                if event[0] in ('done', 'error'):
+                    self.threads.pop(event[1], None)
+                events.append(event)
+        except Queue.Empty:
+            pass
+        return events
+
+
+def run_job(options, **kwargs):
+    """
+    Runs a job and returns its JobResult, errors are reported in the
+    result instead of being raised. Keyword arguments are passed to Job.
+    """
+    bsljob = Job(options, **kwargs)
+    try:
+        bsljob.run()
+    except Exception:
+        pass # recorded in the result by Job.run
+    return bsljob.result
@@ -0,0 +1,175 @@
+#!/usr/bin/env python
+#
+# Job plans: the actions of a BSL job as a list of steps that can be
+# optimized before they are executed
+#
+# (C) 2009-2010 Flying Camp Design
+#
+# All Rights Reserved.
+#
+# AUTHOR: Chris Wilson <cwilson@flyingcampdesign.com>
+#
+# Released under a BSD-style license (please see LICENSE)
+
+from mspgcc.devices import default_layout, INFO_END
+
+# step kinds
+ENTER = 'enter'
+MASSERASE = 'masserase'
+MAINERASE = 'mainerase'
+AUTOERASE = 'autoerase'
+SEGMENTERASE = 'segmenterase'
+ERASECHECK = 'erasecheck'
+PROGRAM = 'program'
+VERIFY = 'verify'
+PROGRAMVERIFY = 'program+verify'
+BSLVERSION = 'bslversion'
+
+# steps that invoke the BSL and unlock it themselves
+ENTERING = (ENTER, MASSERASE, AUTOERASE)
+
+FULL_RANGE = (0x0000, 0x10000)
+
+
+class Step:
+    """
+    One action of a plan. erased is a list of (start, end) address
+    ranges (end exclusive) that are known to be blank after the step.
+    """
+    def __init__(self, kind, action, erased=(), label=None):
+        self.kind = kind
+        self.action = action
+        self.erased = list(erased)
+        self.label = label or kind
+
+    def __call__(self):
+        return self.action()
+
+    def __repr__(self):
+        return self.label
+
+
+class JobPlan:
+    """
+    The steps of a job. init steps (erase, erase check) run before the
+    BSL is started, work steps (program, verify, ...) after it.
+    bslreset is passed to actionStartBSL, it is cleared if the init
+    steps already entered the BSL. Runs of blankrun or more 0xff bytes
+    are not programmed if the init steps erased the data range (0: off).
+    entered is set if the BSL was invoked before the plan runs, e.g.
+    while the image was loaded.
+    """
+    def __init__(self, blankrun=0):
+        self.init = []
+        self.work = []
+        self.bslreset = 1
+        self.blankrun = blankrun
+        self.entered = 0
+        self.notes = []     # what the optimizer changed
+
+    def describe(self):
+        """
+        Returns the plan as list of lines
+        """
+        lines = []
+        if self.init:
+            lines.append('init: %s' % ', '.join([repr(step) for step in self.init]))
+        if self.work:
+            if self.bslreset:
+                lines.append('start BSL')
+            else:
+                lines.append('start BSL (no reset)')
+            lines.append('work: %s' % ', '.join([repr(step) for step in self.work]))
+        return lines
+
+
+def covered(ranges, parts):
+    """
+    True if all (address, data) parts are within the (start, end) ranges
+    """
+    for address, data in parts:
+        end = address + len(data)
+        while address < end:
+            for start, stop in ranges:
+                if start <= address < stop:
+                    address = stop
+                    break
+            else:
+                return False
+    return True
+
+
+def optimize(plan, data, bslobj):
+    """
+    Transforms plan in place and returns it:
+    - erase checks of data that is provably blank after the preceding
+      erase steps are dropped
+    - program followed by verify becomes one program+verify pass, each
+      block is read back right after it is written
+    - init steps that need an unlocked BSL get one shared entry sequence
+      and actionStartBSL does not reset the device again afterwards
+    - programming skips runs of 0xff if the data range was erased
+    - if plan.entered, the first step does not invoke the BSL again
+    """
+    parts = []
+    if data is not None:
+        parts = [(seg.startaddress, seg.data) for seg in default_layout.flash(data)]
+
+    init = []
+    erased = []
+    for step in plan.init:
+        if step.kind == ERASECHECK and erased and covered(erased, parts):
+            plan.notes.append('erase check skipped, the data range was just erased')
+            continue
+        erased.extend(step.erased)
+        init.append(step)
+    if init and init[0].kind not in ENTERING:
+        init.insert(0, Step(ENTER, bslobj.actionEnterBSL))
+        plan.notes.append('BSL entered once for %s' % ', '.join([repr(step) for step in init[1:]]))
+    if init and plan.entered:
+        first = init[0]
+        init[0] = Step(first.kind, bind(first.action, bslreset=0), first.erased, first.label)
+    if init or plan.entered:
+        plan.bslreset = 0
+        if init and plan.work:
+            plan.notes.append('BSL started without a second reset')
+    plan.init = init
+
+    blankrun = 0
+    if plan.blankrun and erased and covered(erased, parts):
+        blankrun = plan.blankrun
+    work = []
+    for step in plan.work:
+        if step.kind == VERIFY and work and work[-1].kind == PROGRAM:
+            work[-1] = Step(PROGRAMVERIFY, bslobj.actionProgramVerify)
+            plan.notes.append('program and verify merged into one pass')
+            continue
+        work.append(step)
+    for i, step in enumerate(work):
+        if blankrun and step.kind in (PROGRAM, PROGRAMVERIFY):
+            work[i] = Step(step.kind, bind(step.action, blankRun=blankrun), label='%s (skip 0xff)' % step.kind)
+            plan.notes.append('runs of %d or more 0xff bytes are not programmed, the flash is erased' % blankrun)
+    plan.work = work
+    return plan
+
+
+def bind(action, **kwargs):
+    return lambda **more: action(**dict(kwargs, **more))
+
+
+def masserase_step(bslobj):
+    return Step(MASSERASE, bslobj.actionMassErase, [FULL_RANGE])
+
+def mainerase_step(bslobj):
+    return Step(MAINERASE, bslobj.actionMainErase, [(INFO_END, 0x10000)])
+
+def autoerase_step(bslobj, usepatch=1):
+    # the planner erases every segment the data touches
+    return Step(AUTOERASE, bind(bslobj.actionAutoErase, usepatch=usepatch), [FULL_RANGE])
+
+def segmenterase_step(bslobj, adr1, adr2=None):
+    if adr2 is None:
+        return Step(SEGMENTERASE, bslobj.makeActionSegmentErase(adr1), [(adr1, adr1 + 1)],
+                    'segmenterase 0x%04x' % adr1)
+    return Step(SEGMENTERASE, bslobj.makeActionEraseRange(adr1, adr2), [(adr1, adr2 + 1)],
+                'segmenterase 0x%04x-0x%04x' % (adr1, adr2))
@@ -0,0 +1,129 @@
+#!/usr/bin/env python
+#
+# Frame size auto-tuning for the bootstrap loader. The first blocks of a
+# session are sent with different frame sizes to find the one with the
+# best goodput, later the size is reduced after transmission errors and
+# grown again after a run of clean frames.
+#
+# (C) 2009-2010 Flying Camp Design
+#
+# All Rights Reserved.
+#
+# AUTHOR: Chris Wilson <cwilson@flyingcampdesign.com>
+#
+# Released under a BSD-style license (please see LICENSE)
+
+SIZES = (16, 32, 64, 128, 192, 240)     #candidate frame sizes, multiples of 16
+
+class SizeStats:
+    """measurements of one frame size"""
+    def __init__(self):
+        self.bytes = 0
+        self.seconds = 0.0
+        self.frames = 0
+        self.errors = 0
+
+    def goodput(self):
+        """bytes per second, the time lost in failed frames included"""
+        return self.seconds and self.bytes / self.seconds or 0.0
+
+    def error_rate(self):
+        total = self.frames + self.errors
+        return total and float(self.errors) / total or 0.0
+
+    def as_dict(self):
+        return {
+            'bytes': self.bytes,
+            'seconds': self.seconds,
+            'frames': self.frames,
+            'errors': self.errors,
+            'goodput': self.goodput(),
+            'error_rate': self.error_rate(),
+        }
+
+class FrameSizeTuner:
+    """chooses the number of data bytes per frame.
+    probe: blocks sent with each candidate size while probing
+    regrow: clean frames before the size is increased again
+    retries: failed attempts in a row before giving up"""
+    def __init__(self, maximum=240, sizes=SIZES, probe=2, regrow=8, retries=5):
+        self.sizes = [size for size in sizes if size < maximum] + [maximum]
+        self.probe = probe
+        self.regrow = regrow
+        self.retries = retries
+        self.stats = dict([(size, SizeStats()) for size in self.sizes])
+        self.probing = list(self.sizes)
+        self.probing.reverse()                  #largest first
+        self.index = len(self.sizes) - 1
+        self.best = None
+        self.clean = 0
+        self.failures = 0
+        self.shrinks = 0
+        self.grows = 0
+
+    def size(self):
+        """frame size to use for the next block"""
+        return self.sizes[self.index]
+
+    def success(self, size, length, seconds):
+        """a block of length bytes was transferred in seconds, size is
+        the frame size it was requested with"""
+        stats = self.stats[size]
+        stats.frames += 1
+        stats.bytes += length
+        stats.seconds += seconds
+        self.failures = 0
+        if self.probing:
+            if stats.frames >= self.probe:
+                self._probed()
+            return
+        self.best = self._best()
+        self.clean += 1
+        if self.clean >= self.regrow and self.sizes[self.index] < self.best:
+            self.index += 1
+            self.clean = 0
+            self.grows += 1
+
+    def failure(self, size, seconds=0.0):
+        """a block requested with size failed after seconds. returns true
+        if it should be retried (with the now smaller size)"""
+        stats = self.stats[size]
+        stats.errors += 1
+        stats.seconds += seconds
+        self.failures += 1
+        self.clean = 0
+        if self.probing:
+            self._probed()
+        if self.sizes[self.index] == size and self.index > 0:
+            self.index -= 1
+            self.shrinks += 1
+        return self.failures <= self.retries
+
+    def _probed(self):
+        """the current probe size is measured, go on with the next one
+        if it had errors or was the best so far"""
+        size = self.probing.pop(0)
+        best = self._best()
+        if self.probing and (best == size or self.stats[size].errors):
+            self.index = self.sizes.index(self.probing[0])
+        else:
+            self.probing = []
+            self.best = best
+            self.index = self.sizes.index(best)
+
+    def _best(self):
+        measured = [(stats.goodput(), size) for size, stats in self.stats.items() if stats.frames]
+        if not measured:
+            return self.sizes[0]
+        measured.sort()
+        return measured[-1][1]
+
+    def as_dict(self):
+        return {
+            'frame_size': self.size(),
+            'best': self.best,
+            'probing': bool(self.probing),
+            'shrinks': self.shrinks,
+            'grows': self.grows,
+            'sizes': dict([(str(size), stats.as_dict()) for size, stats in self.stats.items() if stats.frames or stats.errors]),
+        }
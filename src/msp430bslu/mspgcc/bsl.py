@@ -17,9 +17,13 @@
 # additional infos from slaa089a.pdf
 # $Id: bsl.py,v 1.2 2006/04/23 21:37:35 cliechti Exp $
 
-import sys, time, string, cStringIO, struct
+import sys, time, string, cStringIO, struct, threading, hashlib, re, itertools
 import serial
-from memory import Memory
+from memory import Memory, Segment, CompiledImage, checksum as imageChecksum
+from metrics import ProtocolMetrics, FRAME_OVERHEAD, command_name
+from timeline import traced
+from devices import F1x, F4x, layouts, layout_for
+import eraseplan
 
 DEBUG = 0
 
@@ -185,25 +189,115 @@ E2 B3 20 00 FD 23 92 42 70 01 72 01 92 52 04 02
 q
 """
 
-#cpu types for "change baudrate"
-#use strings as ID so that they can be used in outputs too
-F1x                     = "F1x family"
-F4x                     = "F4x family"
-
-#known device list
-deviceids = {
-    0x1132: F1x,
-    0x1232: F1x,
-    0xf112: F1x,
-    0xf123: F1x,
-    0xf149: F1x,
-    0xf169: F1x,
-    0xf16c: F1x,
-    0xf413: F4x,
-    0xf427: F4x,
-    0xf439: F4x,
-    0xf449: F4x,
-}
+#known device list, the families of the layouts in devices.py
+deviceids = dict([(dev_id, layout.family) for dev_id, layout in layouts.items()])
+
+#parsed images: the embedded ones by name, files by content hash
+compiledImages = {}
+compiledImagesUsed = {}                 #key -> use counter, the least recently used file is evicted
+compiledImagesTick = itertools.count(1)
+compiledImagesLock = threading.Lock()
+MAX_COMPILED_FILES = 16
+
+def compiledImage(key, loader):
+    """return the cached CompiledImage for key, loader() returns the
+    Memory object to compile if it is not yet cached"""
+    compiledImagesLock.acquire()
+    try:
+        image = compiledImages.get(key)
+        if image is None:
+            files = [k for k in compiledImages.keys() if k[0] == 'file']
+            if key[0] == 'file' and len(files) >= MAX_COMPILED_FILES:
+                oldest = min(files, key=lambda k: compiledImagesUsed[k])
+                del compiledImages[oldest]
+                del compiledImagesUsed[oldest]
+            image = compiledImages[key] = CompiledImage(loader())
+        compiledImagesUsed[key] = compiledImagesTick.next()
+        return image
+    finally:
+        compiledImagesLock.release()
+
+def builtinImage(name):
+    """CompiledImage of one of the embedded TI-Text images PATCH,
+    F1X_BSL or F4X_BSL, parsed on first use"""
+    def loader():
+        segments = Memory()
+        segments.loadTIText(cStringIO.StringIO(globals()[name]))
+        return segments
+    return compiledImage(('builtin', name), loader)
+
+def imageFile(filename):
+    """CompiledImage of a file, e.g. a replacement BSL. it is parsed
+    once per content, edited files are loaded again"""
+    f = open(filename, 'rb')
+    try:
+        contents = f.read()
+    finally:
+        f.close()
+    def loader():
+        segments = Memory()
+        segments.loadFile(filename, cStringIO.StringIO(contents))
+        return segments
+    return compiledImage(('file', hashlib.sha1(contents).hexdigest()), loader)
+
+MISMATCH_GAP = 8        #mismatch ranges closer than this are reported as one
+MISMATCH_REPORT = 10    #ranges printed after a failed verify
+
+def mismatchRanges(expected, actual, offset=0):
+    """list of (offset, length, count) of the differing bytes of two
+    strings of the same length, count bytes of the range differ. ranges
+    closer than MISMATCH_GAP are merged. equal halves are skipped with
+    one string compare, only short differing pieces are compared byte
+    by byte."""
+    if expected == actual:
+        return []
+    if len(expected) > 16:
+        half = len(expected) // 2
+        ranges = mismatchRanges(expected[:half], actual[:half], offset)
+        for start, length, count in mismatchRanges(expected[half:], actual[half:], offset + half):
+            if ranges and ranges[-1][0] + ranges[-1][1] + MISMATCH_GAP > start:
+                ranges[-1] = (ranges[-1][0], start + length - ranges[-1][0], ranges[-1][2] + count)
+            else:
+                ranges.append((start, length, count))
+        return ranges
+    ranges = []
+    for i in range(len(expected)):
+        if expected[i] != actual[i]:
+            if ranges and ranges[-1][0] + ranges[-1][1] + MISMATCH_GAP > offset + i:
+                ranges[-1] = (ranges[-1][0], offset + i + 1 - ranges[-1][0], ranges[-1][2] + 1)
+            else:
+                ranges.append((offset + i, 1, 1))
+    return ranges
+
+class Mismatch:
+    """a range of memory that differs from the expected contents. count
+    bytes differ, the others in the range are equal"""
+    def __init__(self, address, expected, actual, count=None):
+        self.address = address
+        self.expected = expected
+        self.actual = actual
+        if count is None:
+            count = len([i for i in range(len(expected)) if expected[i] != actual[i]])
+        self.count = count
+
+    def __repr__(self):
+        return "Mismatch(0x%04x, %d bytes, %d differ)" % (self.address, len(self.expected), self.count)
+
+    def describe(self, maxbytes=16):
+        """one line with the address range and the first bytes"""
+        more = len(self.expected) > maxbytes and '...' or ''
+        return "0x%04x-0x%04x (%d bytes differ): expected %s%s, read %s%s" % (
+            self.address, self.address + len(self.expected) - 1, self.count,
+            self.expected[:maxbytes].encode('hex'), more, self.actual[:maxbytes].encode('hex'), more)
+
+    def as_dict(self):
+        return {
+            'address': self.address,
+            'length': len(self.expected),
+            'differ': self.count,
+            'expected': self.expected.encode('hex'),
+            'actual': self.actual.encode('hex'),
+        }
 
 class BSLException(Exception):
     pass
@@ -286,6 +380,8 @@ class LowLevel:
         self.protocolMode = self.MODE_BSL
         self.BSLMemAccessWarning = 0            #Default: no warning.
         self.slowmode = 0                       #give a little more time when changing the control lines
+        self.metrics = ProtocolMetrics()        #set to None to disable the statistics
+        self.tracer = None                      #timeline.Timeline recording spans
 
     def comInit(self, port):
         """Tries to open the serial port given and
@@ -293,6 +389,8 @@ class LowLevel:
         The timeout and the number of allowed errors is multiplied by
         'aProlongFactor' after transmission of a command to give
         plenty of time to the micro controller to finish the command.
+        port can also be an open port like object, see
+        ports.open_port for simulated targets and trace files.
         Returns zero if the function is successful."""
         if DEBUG > 1: sys.stderr.write("* comInit()\n")
         self.seqNo = 0
@@ -300,13 +398,21 @@ class LowLevel:
         self.rxPtr = 0
         self.txPtr = 0
         # Startup-Baudrate: 9600,8,E,1, 1s timeout
-        self.serialport = serial.Serial(
-            port,
-            9600,
-            parity = serial.PARITY_EVEN,
-            timeout = self.timeout
-        )
+        if hasattr(port, 'read'):
+            #already open port like object, e.g. a simulated target
+            self.serialport = port
+            self.serialport.timeout = self.timeout
+            if self.serialport.baudrate != 9600:
+                self.serialport.setBaudrate(9600)
+        else:
+            self.serialport = serial.Serial(
+                port,
+                9600,
+                parity = serial.PARITY_EVEN,
+                timeout = self.timeout
+            )
         if DEBUG: sys.stderr.write("using serial port %r\n" % self.serialport.portstr)
+        if self.metrics is not None: self.metrics.start()
         self.SetRSTpin()                        #enable power
         self.SetTESTpin()                       #enable power
         self.serialport.flushInput()
@@ -322,6 +428,7 @@ class LowLevel:
         self.SetRSTpin(0)                       #disable power
         self.SetTESTpin(0)                      #disable power
         self.serialport.close()
+        if self.metrics is not None: self.metrics.stop()
 
     def comRxHeader(self):
         """receive header and split data"""
@@ -450,6 +557,7 @@ class LowLevel:
 
         raise BSLException("Unknown header 0x%02x\nAre you downloading to RAM into an old device that requires the patch? Try option -U" % rxHeader)
 
+    @traced(cat='pins')
     def SetRSTpin(self, level=1):
         """Controls RST/NMI pin (0: GND; 1: VCC; unless inverted flag is set)"""
         #invert signal if configured
@@ -466,6 +574,7 @@ class LowLevel:
         else:
             time.sleep(0.010)
 
+    @traced(cat='pins')
     def SetTESTpin(self, level=1):
         """Controls TEST pin (inverted on board: 0: VCC; 1: GND; unless inverted flag is set)"""
         #invert signal if configured
@@ -489,6 +598,7 @@ class LowLevel:
         else:
             time.sleep(0.010)
 
+    @traced()
     def bslReset(self, invokeBSL=0):
         """Applies BSL entry sequence on RST/NMI and TEST/VPP pins
         Parameters:
@@ -499,6 +609,7 @@ class LowLevel:
         TEST is inverted (only once)
         Need positive voltage on DTR, RTS for power-supply of hardware"""
         if DEBUG > 1: sys.stderr.write("* bslReset(invokeBSL=%s)\n" % invokeBSL)
+        start = time.time()
         self.SetRSTpin(1)       #power suply
         self.SetTESTpin(1)      #power suply
         if self.slowmode:
@@ -522,6 +633,7 @@ class LowLevel:
         time.sleep(0.250)       #give MSP430's oscillator time to stabilize
 
         self.serialport.flushInput()    #clear buffers
+        if self.metrics is not None: self.metrics.add_reset(time.time() - start)
 
     def bslSync(self,wait=0):
         """Transmits Synchronization character and expects to receive Acknowledge character
@@ -551,6 +663,7 @@ class LowLevel:
                             sys.stderr.write("  bslSync() timeout\n")
                 else:                                   #garbage
                     if DEBUG > 1: sys.stderr.write("  bslSync() failed (0x%02x), retry ...\n" % ord(c))
+                if self.metrics is not None and (wait or loopcnt): self.metrics.retry()
             raise BSLException(self.ERR_BSL_SYNC)       #Sync. failed
 
     def bslTxRx(self, cmd, addr, length = 0, blkout = None, wait=0):
@@ -592,8 +705,31 @@ class LowLevel:
         if blkout: #Copy data out of blkout into frame
             dataOut = dataOut + blkout
 
-        self.bslSync(wait)                          #synchronize BSL
-        rxFrame = self.comTxRx(cmd, dataOut, len(dataOut))  #Send frame
+        metrics = self.metrics
+        tracer = self.tracer
+        start = synced = time.time()
+        try:
+            self.bslSync(wait)                      #synchronize BSL
+            synced = time.time()
+            rxFrame = self.comTxRx(cmd, dataOut, len(dataOut))  #Send frame
+        except BSLException, e:
+            if metrics is not None: metrics.error(cmd, str(e))
+            if tracer is not None:
+                tracer.complete(command_name(cmd), 'frame', start, time.time(),
+                    {'addr': '0x%04x' % addr, 'length': length, 'error': str(e)})
+            raise
+        if tracer is not None:
+            tracer.complete('sync', 'sync', start, synced)
+            tracer.complete(command_name(cmd), 'frame', synced, time.time(),
+                {'addr': '0x%04x' % addr, 'length': length})
+        if metrics is not None:
+            if cmd in (self.BSL_TXBLK, self.BSL_RXBLK):
+                payload = length
+            else:
+                payload = 0
+            metrics.command(cmd, synced - start, time.time() - synced,
+                len(dataOut) + FRAME_OVERHEAD + (len(dataOut) % 2),
+                rxFrame and len(rxFrame) or 1, payload)
         if rxFrame:                                 #test answer
             return rxFrame[4:] #return only data w/o [hdr,null,len,len]
         else:
@@ -614,6 +750,10 @@ class BootStrapLoader(LowLevel):
     #( >= 16 and == n*16 and <= MAX_DATA_BYTES!)
     MAXDATA                 = 240-16
 
+    #transmission errors a block is retried after, when auto-tuning
+    RETRY_ERRORS            = (LowLevel.ERR_COM, LowLevel.ERR_RX_NAK, LowLevel.ERR_BSL_SYNC,
+                               LowLevel.ERR_FRAME_NUMBER, "Timeout")
+
 
     def __init__(self, *args, **kargs):
         LowLevel.__init__(self, *args, **kargs)
@@ -622,10 +762,17 @@ class BootStrapLoader(LowLevel):
         self.patchRequired  = 0
         self.patchLoaded    = 0
         self.bslVer         = 0
+        self.devId          = None
         self.passwd         = None
         self.data           = None
         self.maxData        = self.MAXDATA
+        self.tuner          = None          #autotune.FrameSizeTuner, replaces maxData if set
+        self.checkResident  = 1             #skip patch/BSL downloads if already in RAM
         self.cpu            = None
+        self.layout         = None          #devices.DeviceLayout, set by actionStartBSL
+        self.erasePlan      = None          #eraseplan.ErasePlan of actionAutoErase
+        self.mismatches     = []            #Mismatch objects of the last verify or erase check
+        self.verifyTail     = None          #(end address, expected, read) of the last checked block
         self.showprogress    = 0
         self.retrasnmitPasswd = 1
 
@@ -650,31 +797,64 @@ class BootStrapLoader(LowLevel):
 
 
     def verifyBlk(self, addr, blkout, action):
-        """Verify memory against data or 0xff"""
+        """Verify memory against data or 0xff. Differences are collected
+        in self.mismatches, see resetMismatches and checkMismatches"""
         if DEBUG > 1: sys.stderr.write("* verifyBlk()\n")
 
         if action & self.ACTION_VERIFY or action & self.ACTION_ERASE_CHECK:
             if DEBUG: sys.stderr.write("  Check starting at 0x%04x, %d bytes ... \n" % (addr, len(blkout)))
 
             self.preparePatch()
-            blkin = self.bslTxRx(self.BSL_RXBLK, addr, len(blkout))
+            skip = addr % 2                         #RXBLK is word aligned, see isResident
+            blkin = self.bslTxRx(self.BSL_RXBLK, addr - skip, len(blkout) + skip)[skip:skip + len(blkout)]
             self.postPatch()
 
-            for i in range(len(blkout)):
-                if action & self.ACTION_VERIFY:
-                    #Compare data in blkout and blkin
-                    if blkin[i] != blkout[i]:
-                        sys.stderr.write("Verification failed at 0x%04x (0x%02x, 0x%02x)\n" % (addr+i, ord(blkin[i]), ord(blkout[i])))
-                        sys.stderr.flush()
-                        raise BSLException(self.ERR_VERIFY_FAILED)      #Verify failed!
-                    continue
-                elif action & self.ACTION_ERASE_CHECK:
-                    #Compare data in blkin with erase pattern
-                    if blkin[i] != chr(0xff):
-                        sys.stderr.write("Erase Check failed at 0x%04x (0x%02x)\n" % (addr+i, ord(blkin[i])))
-                        sys.stderr.flush()
-                        raise BSLException(self.ERR_ERASE_CHECK_FAILED) #Erase Check failed!
-                    continue
+            if action & self.ACTION_VERIFY:
+                expected = blkout
+            else:
+                expected = chr(0xff) * len(blkout)      #erase pattern
+            tail = self.verifyTail
+            if tail is not None and tail[0] != addr:
+                tail = None                         #not contiguous with the previous block
+            for offset, length, count in mismatchRanges(expected, blkin):
+                address = addr + offset
+                last = self.mismatches and self.mismatches[-1]
+                gap = last and addr - (last.address + len(last.expected))
+                if tail is not None and last and 0 <= gap <= len(tail[1]) and address - MISMATCH_GAP < addr - gap:
+                    #continued from the previous blocks, the bytes in between are equal
+                    last.expected += tail[1][len(tail[1]) - gap:] + expected[:offset+length]
+                    last.actual += tail[2][len(tail[2]) - gap:] + blkin[:offset+length]
+                    last.count += count
+                else:
+                    self.mismatches.append(Mismatch(address, expected[offset:offset+length],
+                                                    blkin[offset:offset+length], count))
+            if tail is not None:                    #keep enough bytes for blocks shorter than the gap
+                expected, blkin = tail[1] + expected, tail[2] + blkin
+            self.verifyTail = (addr + len(blkout), expected[-MISMATCH_GAP:], blkin[-MISMATCH_GAP:])
+
+    def resetMismatches(self):
+        """Start a new verify or erase check pass"""
+        self.mismatches = []
+        self.verifyTail = None
+
+    def checkMismatches(self, action):
+        """Report the mismatches found since resetMismatches and raise
+        BSLException if there are any"""
+        found = self.mismatches
+        if not found:
+            return
+        if action & self.ACTION_VERIFY:
+            what, error = "Verification", self.ERR_VERIFY_FAILED
+        else:
+            what, error = "Erase Check", self.ERR_ERASE_CHECK_FAILED
+        sys.stderr.write("%s failed, %d bytes differ in %d ranges:\n" % (
+            what, sum([m.count for m in found]), len(found)))
+        for mismatch in found[:MISMATCH_REPORT]:
+            sys.stderr.write("  %s\n" % mismatch.describe())
+        if len(found) > MISMATCH_REPORT:
+            sys.stderr.write("  ... %d more\n" % (len(found) - MISMATCH_REPORT))
+        sys.stderr.flush()
+        raise BSLException(error)
 
     def programBlk(self, addr, blkout, action):
         """Programm a memory block"""
@@ -703,6 +883,7 @@ class BootStrapLoader(LowLevel):
         currentAddr = address
         pstart = 0
         count = 0
+        self.resetMismatches()
         total_length = len(data)
         while pstart < total_length:
             length = self.maxData
@@ -715,36 +896,88 @@ class BootStrapLoader(LowLevel):
             #~ count = count + length
             #~ if self.showprogress:
                 #~ self.progress_update(count, total)
+        self.checkMismatches(self.ACTION_VERIFY)
+
+    def transferBlk(self, remaining, transfer):
+        """Call transfer(length) for the next block of at most remaining
+        bytes. With a tuner, the length is chosen by it and blocks failing
+        with transmission errors are retried with smaller frames.
+        Returns the length and the result of transfer."""
+        tuner = self.tuner
+        if tuner is None:
+            length = min(self.maxData, remaining)
+            if self.metrics is not None: self.metrics.frame_size = self.maxData
+            return length, transfer(length)
+        while 1:
+            size = tuner.size()
+            length = min(size, remaining)
+            start = time.time()
+            try:
+                result = transfer(length)
+            except BSLException, e:
+                if str(e) not in self.RETRY_ERRORS or not tuner.failure(size, time.time() - start):
+                    raise
+                sys.stderr.write("%s, retrying with %d byte frames\n" % (e, tuner.size()))
+                sys.stderr.flush()
+                continue
+            tuner.success(size, length, time.time() - start)
+            if self.metrics is not None:
+                self.metrics.frame_size = tuner.size()
+                self.metrics.frame_tuning = tuner.as_dict()
+            return length, result
+
     #segments:
     #list of tuples or lists:
     #segements = [ (addr1, [d0,d1,d2,...]), (addr2, [e0,e1,e2,...])]
-    def programData(self, segments, action):
-        """Programm or verify data"""
+    def programData(self, segments, action, check=1):
+        """Programm or verify data. Verify and erase check go through all
+        data, then an exception is raised if anything differs (unless
+        check is false, then the caller resets and checks the mismatches,
+        see checkMismatches)"""
         if DEBUG > 1: sys.stderr.write("* programData()\n")
+        if check:
+            self.resetMismatches()
         #count length if progress updates have to be done
         if self.showprogress:
             total = 0
             for seg in segments:
                 total = total + len(seg.data)
         count = 0
-        for seg in segments:
-            currentAddr = seg.startaddress
-            pstart = 0
-            while pstart<len(seg.data):
+        boundaries = self.getLayout().boundaries()
+        if self.tuner is None and isinstance(segments, CompiledImage):
+            #blocks are split once per frame size
+            if self.metrics is not None: self.metrics.frame_size = self.maxData
+            for currentAddr, block in segments.frames(self.maxData, boundaries):
                 if self.showprogress:
                     self.progress_update(count, total)
-                length = self.maxData
-                if pstart+length > len(seg.data):
-                    length = len(seg.data) - pstart
-                self.programBlk(currentAddr, seg.data[pstart:pstart+length], action)
-                pstart = pstart + length
-                currentAddr = currentAddr + length
-                self.byteCtr = self.byteCtr + length #total sum
-                count = count + length
+                self.programBlk(currentAddr, block, action)
+                self.byteCtr = self.byteCtr + len(block)
+                count = count + len(block)
+        else:
+            for seg in segments:
+                currentAddr = seg.startaddress
+                pstart = 0
+                while pstart<len(seg.data):
+                    if self.showprogress:
+                        self.progress_update(count, total)
+                    #frames end at memory region boundaries
+                    remaining = len(seg.data) - pstart
+                    for limit in boundaries:
+                        if currentAddr < limit < currentAddr + remaining:
+                            remaining = limit - currentAddr
+                            break
+                    length, result = self.transferBlk(remaining,
+                        lambda length: self.programBlk(currentAddr, seg.data[pstart:pstart+length], action))
+                    pstart = pstart + length
+                    currentAddr = currentAddr + length
+                    self.byteCtr = self.byteCtr + length #total sum
+                    count = count + length
         if self.showprogress:
             self.progress_update(count, total)
         if DEBUG: sys.stderr.write("  Program finished.\n")
         sys.stderr.flush()
+        if check:
+            self.checkMismatches(action)
 
     def uploadData(self, startaddress, size, wait=0):
         """Upload a datablock"""
@@ -756,13 +989,12 @@ class BootStrapLoader(LowLevel):
         while pstart<size:
             if self.showprogress:
                 self.progress_update(count, total)
-            length = self.maxData
-            if pstart+length > size:
-                length = size - pstart
-            data = data + self.bslTxRx(self.BSL_RXBLK,
-                                       pstart+startaddress,
-                                       length,
-                                       wait=wait)[:-2] #cut away checksum
+            length, blkin = self.transferBlk(size - pstart,
+                lambda length: self.bslTxRx(self.BSL_RXBLK,
+                                            pstart+startaddress,
+                                            length,
+                                            wait=wait))
+            data = data + blkin[:-2] #cut away checksum
             pstart = pstart + length
             count = count + length
         if self.showprogress:
@@ -771,6 +1003,7 @@ class BootStrapLoader(LowLevel):
         sys.stderr.flush()
         return data
 
+    @traced()
     def txPasswd(self, passwd=None, wait=0):
         """Transmit password, default if None is given."""
         if DEBUG > 1: sys.stderr.write("* txPassword(%r)\n" % passwd)
@@ -796,11 +1029,14 @@ class BootStrapLoader(LowLevel):
 
     #-----------------------------------------------------------------
 
-    def actionMassErase(self):
-        """Erase the flash memory completely (with mass erase command)"""
+    @traced()
+    def actionMassErase(self, bslreset=1):
+        """Erase the flash memory completely (with mass erase command).
+        bslreset=0 if the BSL was just invoked."""
         sys.stderr.write("Mass Erase...\n")
         sys.stderr.flush()
-        self.bslReset(1)                            #Invoke the boot loader.
+        if bslreset:
+            self.bslReset(1)                        #Invoke the boot loader.
         for i in range(self.meraseCycles):
             if i == 1: sys.stderr.write("Additional Mass Erase Cycles...\n")
             self.bslTxRx(self.BSL_MERAS,            #Command: Mass Erase
@@ -811,6 +1047,7 @@ class BootStrapLoader(LowLevel):
         #Transmit password to get access to protected BSL functions.
         self.txPasswd()
 
+    @traced()
     def actionMainErase(self):
         """Erase the main flash memory only"""
         sys.stderr.write("Main Erase...\n")
@@ -820,6 +1057,7 @@ class BootStrapLoader(LowLevel):
                             0xa504)                 #Required setting for main erase!
         self.passwd = None                          #Password gets erased
 
+    @traced()
     def actionSegmentErase(self, address):
         """Erase the memory segemnts. Address parameter is an address within the
         segment to be erased"""
@@ -841,6 +1079,118 @@ class BootStrapLoader(LowLevel):
                 return "Erase Segment @ 0x%04x" % inner_self.address
         return SegmentEraser(address)
 
+    def makeActionEraseRange(self, start, end):
+        """Erase the flash segments touching the address range start..end
+        (inclusive), each one once. The segments are taken from the
+        device layout when the returned object is called."""
+        class RangeEraser:
+            def __call__(inner_self):
+                layout = self.getLayout(identify=1)
+                for address in layout.segments(start, end):
+                    sys.stderr.write("Erase Segment @ 0x%04x...\n" % address)
+                    sys.stderr.flush()
+                    self.actionSegmentErase(address)
+            def __repr__(inner_self):
+                return "Erase Segments @ 0x%04x-0x%04x" % (start, end)
+        return RangeEraser()
+
+    @traced()
+    def actionAutoErase(self, preserve_info=1, bslreset=1, usepatch=1):
+        """Erase the flash segments touched by the data with the cheapest
+        strategy, see eraseplan.plan_erase. The BSL is entered with the
+        password to identify the device, without a valid password only a
+        mass erase is possible. usepatch as for actionStartBSL, needed to
+        restore info segments with an old BSL."""
+        if self.data is None:
+            raise BSLException, "cannot plan an erase without knowing the actual data"
+        sys.stderr.write("Planning erase ...\n")
+        sys.stderr.flush()
+        if bslreset:
+            self.bslReset(1)                        #Invoke the boot loader.
+        access = 1
+        try:
+            self.txPasswd(self.passwd)
+        except BSLException, e:
+            sys.stderr.write("Password not accepted (%s), only a mass erase is possible.\n" % e)
+            sys.stderr.flush()
+            access = 0
+        plan = eraseplan.plan_erase(self.data, self.getLayout(identify=access),
+            baudrate=self.serialport.baudrate, access=access, preserve_info=preserve_info,
+            maxData=self.maxData, erasecycles=self.meraseCycles)
+        self.erasePlan = plan
+        sys.stderr.write("Erase plan: %s\n" % plan.describe())
+        sys.stderr.flush()
+        self.actionErasePlan(plan, usepatch)
+
+    @traced()
+    def actionErasePlan(self, plan, usepatch=1):
+        """Execute an eraseplan.ErasePlan. The BSL must be entered with
+        the password. Saved info segments are restored after the mass
+        erase with the SP adjusted and the patch loaded if the BSL
+        version needs them."""
+        layout = self.getLayout()
+        if plan.strategy == eraseplan.MASS:
+            saved = Memory()
+            for address in plan.restore:
+                start, end = layout.segment(address)
+                sys.stderr.write("Save Segment @ 0x%04x...\n" % start)
+                sys.stderr.flush()
+                data = self.uploadData(start, end - start)
+                if data != chr(0xff) * len(data):   #nothing to restore if blank
+                    saved.append(Segment(start, data))
+            self.actionMassErase(bslreset=0)        #BSL is already running
+            if len(saved):
+                self.devId, self.bslVer = self.readBSLInfo()
+                self.BSLMemAccessWarning = self.bslVer <= 0x0110
+                self.adjustSP()
+                self.loadPatch(usepatch)
+                sys.stderr.write("Restore %d info segments ...\n" % len(saved))
+                sys.stderr.flush()
+                self.programData(saved, self.ACTION_PROGRAM | self.ACTION_VERIFY)
+        elif plan.strategy == eraseplan.MAIN:
+            self.actionMainErase()
+        for address in plan.erase:
+            sys.stderr.write("Erase Segment @ 0x%04x...\n" % address)
+            sys.stderr.flush()
+            self.actionSegmentErase(address)
+            if layout.segment(address) == layout.segment(0xffe0):
+                self.passwd = None                  #Password gets erased
+
+    def getLayout(self, identify=0):
+        """Memory layout of the connected device. If it is not known yet
+        and identify is true, the device ID is read from the BSL, else
+        the layout of the forced CPU type or a default one is used."""
+        if self.layout is None and self.devId is None and identify:
+            try:
+                self.devId = self.readBSLInfo()[0]
+            except BSLException, e:
+                sys.stderr.write("Reading device ID failed (%s), using default memory layout.\n" % e)
+                sys.stderr.flush()
+        if self.layout is not None:
+            return self.layout
+        return layout_for(self.devId, self.cpu)
+
+    @traced()
+    def readBSLInfo(self):
+        """Read the device ID and the ROM BSL version from 0x0ff0.
+        Returns a tuple (dev_id, bslVer)."""
+        blkin = self.bslTxRx(self.BSL_RXBLK,        #Command: Read/Receive Block
+                          0x0ff0,                   #Start address
+                          16)                       #No. of bytes to read
+        dev_id, bslVerHi, bslVerLo = struct.unpack(">H8xBB4x", blkin[:-2]) #cut away checksum and extract data
+        return dev_id, (bslVerHi << 8) | bslVerLo
+
+    @traced()
+    def actionEnterBSL(self, bslreset=1):
+        """Invoke the BSL and transmit the password, for actions that need
+        the protected commands before actionStartBSL."""
+        sys.stderr.write("Invoking BSL...\n")
+        sys.stderr.flush()
+        if bslreset:
+            self.bslReset(1)                        #Invoke the boot loader.
+        self.txPasswd(self.passwd)                  #transmit password
+
+    @traced()
     def actionStartBSL(self, usepatch=1, adjsp=1, replacementBSL=None, forceBSL=0, mayuseBSL=0, speed=None, bslreset=1):
         """Start BSL, download patch if desired and needed, adjust SP if desired, download
         replacement BSL, change baudrate."""
@@ -852,10 +1202,9 @@ class BootStrapLoader(LowLevel):
 
         #Read actual bootstrap loader version.
         sys.stderr.write("Reading BSL version ...\n")
-        blkin = self.bslTxRx(self.BSL_RXBLK,        #Command: Read/Receive Block
-                          0x0ff0,                   #Start address
-                          16)                       #No. of bytes to read
-        dev_id, bslVerHi, bslVerLo = struct.unpack(">H8xBB4x", blkin[:-2]) #cut away checksum and extract data
+        dev_id, self.bslVer = self.readBSLInfo()
+        self.devId = dev_id
+        bslVerHi, bslVerLo = self.bslVer >> 8, self.bslVer & 0xff
 
         if self.cpu is None:                        #cpy type forced?
             if deviceids.has_key(dev_id):
@@ -865,44 +1214,37 @@ class BootStrapLoader(LowLevel):
             else:
                 sys.stderr.write("Autodetect failed! Unknown ID: %04x. Trying to continue anyway.\n" % dev_id)
                 self.cpu = F1x                      #assume something and try anyway..
+        self.layout = layout_for(dev_id, self.cpu)
 
         sys.stderr.write("Current bootstrap loader version: %x.%x (Device ID: %04x)\n" % (bslVerHi, bslVerLo, dev_id))
         sys.stderr.flush()
-        self.bslVer = (bslVerHi << 8) | bslVerLo
 
         if self.bslVer <= 0x0110:                   #check if patch is needed
             self.BSLMemAccessWarning = 1
         else:
             self.BSLMemAccessWarning = 0 #Fixed in newer versions of BSL.
 
-        if self.bslVer <= 0x0130 and adjsp:
-            #only do this on BSL where it's needed to prevent
-            #malfunction with F4xx devices/ newer ROM-BSLs
-            
-            #Execute function within bootstrap loader
-            #to prepare stack pointer for the following patch.
-            #This function will lock the protected functions again.
-            sys.stderr.write("Adjust SP. Load PC with 0x0C22 ...\n")
-            self.bslTxRx(self.BSL_LOADPC,           #Command: Load PC
-                                0x0C22)             #Address to load into PC
-            #Re-send password to re-gain access to protected functions.
-            self.txPasswd(self.passwd)
+        if adjsp:
+            self.adjustSP()
 
         #get internal BSL replacement if needed or forced by the user
         #required if speed is set but an old BSL is in the device
         #if a BSL is given by the user, that one is used and not the internal one
+        if mayuseBSL and speed and self.bslVer < 0x0150 and not forceBSL and not self.layout.can_download_bsl():
+            sys.stderr.write("%s has too little RAM for the BSL replacement, keeping the ROM BSL.\n" % self.layout.name)
+            sys.stderr.flush()
+            mayuseBSL = 0
         if ((mayuseBSL and speed and self.bslVer < 0x0150) or forceBSL) and replacementBSL is None:
-            replacementBSL = Memory() #File to program
             if self.cpu == F4x:
                 if DEBUG:
                     sys.stderr.write("Using built in BSL replacement for F4x devices\n")
                     sys.stderr.flush()
-                replacementBSL.loadTIText(cStringIO.StringIO(F4X_BSL))  #parse embedded BSL
+                replacementBSL = builtinImage('F4X_BSL')    #embedded BSL, parsed once
             else:
                 if DEBUG:
                     sys.stderr.write("Using built in BSL replacement for F1x devices\n")
                     sys.stderr.flush()
-                replacementBSL.loadTIText(cStringIO.StringIO(F1X_BSL))  #parse embedded BSL
+                replacementBSL = builtinImage('F1X_BSL')    #embedded BSL, parsed once
     
         #now download the new BSL, if allowed and needed (version lower than the
         #the replacement) or forced
@@ -915,36 +1257,89 @@ class BootStrapLoader(LowLevel):
             sys.stderr.flush()
 
         #now apply workarounds or patches if BSL in use requires that
+        self.loadPatch(usepatch)
+
+        #should the baudrate be changed?
+        if speed is not None:
+            self.actionChangeBaudrate(speed)            #change baudrate
+
+    def adjustSP(self):
+        """Prepare the stack pointer for the patch on BSL versions up to
+        1.30, the password is sent again afterwards."""
+        if self.bslVer <= 0x0130:
+            #only do this on BSL where it's needed to prevent
+            #malfunction with F4xx devices/ newer ROM-BSLs
+            
+            #Execute function within bootstrap loader
+            #to prepare stack pointer for the following patch.
+            #This function will lock the protected functions again.
+            sys.stderr.write("Adjust SP. Load PC with 0x0C22 ...\n")
+            self.bslTxRx(self.BSL_LOADPC,           #Command: Load PC
+                                0x0C22)             #Address to load into PC
+            #Re-send password to re-gain access to protected functions.
+            self.txPasswd(self.passwd)
+
+    def loadPatch(self, usepatch=1):
+        """Download the flash programming patch if the BSL version needs
+        it and usepatch is true."""
         if self.bslVer <= 0x0110:                   #check if patch is needed
             if usepatch:                            #test if patch is desired
                 sys.stderr.write("Patch for flash programming required!\n")
                 self.patchRequired = 1
 
-                sys.stderr.write("Load and verify patch ...\n")
-                sys.stderr.flush()
-                #Programming and verification is done in one pass.
-                #The patch file is only read and parsed once.
-                segments = Memory()                     #data to program
-                segments.loadTIText(cStringIO.StringIO(PATCH))  #parse embedded patch
-                #program patch
-                self.programData(segments, self.ACTION_PROGRAM | self.ACTION_VERIFY)
+                #The patch file is only read and parsed once per process.
+                segments = builtinImage('PATCH')        #data to program
+                if self.checkResident and self.isResident(segments):
+                    sys.stderr.write("Patch already loaded.\n")
+                    sys.stderr.flush()
+                else:
+                    sys.stderr.write("Load and verify patch ...\n")
+                    sys.stderr.flush()
+                    #Programming and verification is done in one pass.
+                    if self.tracer is not None: token = self.tracer.begin('patch')
+                    self.programData(segments, self.ACTION_PROGRAM | self.ACTION_VERIFY)
+                    if self.tracer is not None: self.tracer.end(token)
                 self.patchLoaded = 1
             else:
                 if DEBUG:
                     sys.stderr.write("Device needs patch, but not applied (usepatch is false).\n")    #message if not patched
 
-        #should the baudrate be changed?
-        if speed is not None:
-            self.actionChangeBaudrate(speed)            #change baudrate
-
+    @traced()
+    def isResident(self, segments):
+        """Check if an image is already in memory, e.g. in RAM after a
+        re-entry without power cycle. A few short blocks are compared
+        first (see CompiledImage.signature) so that most misses are found
+        quickly, then each segment is read back and its checksum compared
+        with the precomputed one. That is one read pass instead of the
+        program and verify passes of a download."""
+        if not isinstance(segments, CompiledImage):
+            segments = CompiledImage(segments)
+        for address, data in segments.signature():
+            start = address - (address % 2)     #RXBLK is word aligned
+            blkin = self.bslTxRx(self.BSL_RXBLK, start, len(data) + address - start)
+            if blkin[address - start:address - start + len(data)] != data:
+                return 0
+        for address, length, expected in segments.checksums:
+            start = address - (address % 2)
+            size = length + address - start
+            data = self.uploadData(start, size + size % 2)
+            if imageChecksum(data[address - start:address - start + length]) != expected:
+                return 0
+        return 1
+
+    @traced()
     def actionDownloadBSL(self, bslsegments):
         """Download and start a new BSL (Devices with 2kB RAM only)"""
-        sys.stderr.write("Load new BSL into RAM...\n")
-        sys.stderr.flush()
-        self.programData(bslsegments, self.ACTION_PROGRAM)
-        sys.stderr.write("Verify new BSL...\n")
-        sys.stderr.flush()
-        self.programData(bslsegments, self.ACTION_VERIFY) #File to verify
+        if self.checkResident and self.isResident(bslsegments):
+            sys.stderr.write("New BSL already in RAM, skipping download\n")
+            sys.stderr.flush()
+        else:
+            sys.stderr.write("Load new BSL into RAM...\n")
+            sys.stderr.flush()
+            self.programData(bslsegments, self.ACTION_PROGRAM)
+            sys.stderr.write("Verify new BSL...\n")
+            sys.stderr.flush()
+            self.programData(bslsegments, self.ACTION_VERIFY) #File to verify
 
         #Read startvector of bootstrap loader
         #blkin = self.bslTxRx(self.BSL_RXBLK, 0x0300, 2)
@@ -971,26 +1366,89 @@ class BootStrapLoader(LowLevel):
         #that the patches are not applied if the user d/ls one
         self.bslVer = 0x0150
 
+    @traced()
     def actionEraseCheck(self):
         """Check the erasure of required flash cells."""
         sys.stderr.write("Erase Check by file ...\n")
         sys.stderr.flush()
         if self.data is not None:
-            self.programData(self.data, self.ACTION_ERASE_CHECK)
+            #only flash cells are erased, RAM contents in the file are skipped
+            self.programData(self.getLayout().flash(self.data), self.ACTION_ERASE_CHECK)
         else:
             raise BSLException, "cannot do erase check against data with not knowing the actual data"
 
-    def actionProgram(self):
-        """Program data into flash memory."""
+    def splitBlank(self, segments, minimum):
+        """Split segments into the data to program and the runs of at
+        least minimum 0xff bytes in flash, which an erased device already
+        contains. Returns two Memory objects (data, blank). The runs are
+        shrunk to even addresses, so no block is padded into a run."""
+        layout = self.getLayout()
+        run = re.compile('\xff{%d,}' % minimum)
+        data, blank = Memory(), Memory()
+        for seg in segments:
+            pstart = 0
+            for match in run.finditer(seg.data):
+                start = seg.startaddress + match.start()
+                end = seg.startaddress + match.end()
+                start, end = start + start % 2, end - end % 2
+                if end <= start or not layout.is_flash(start) or layout.region_end(start) < end:
+                    continue                        #too short, RAM or crossing into another region
+                bstart, bend = start - seg.startaddress, end - seg.startaddress
+                if bstart > pstart:
+                    data.append(Segment(seg.startaddress + pstart, seg.data[pstart:bstart]))
+                blank.append(Segment(start, seg.data[bstart:bend]))
+                pstart = bend
+            if pstart < len(seg.data):
+                data.append(Segment(seg.startaddress + pstart, seg.data[pstart:]))
+        return data, blank
+
+    def programBlank(self, action, blankRun):
+        """programData of self.data, runs of blankRun or more 0xff bytes
+        are not sent when programming as the flash is known to be erased.
+        They are still read back if action includes verify."""
+        if not blankRun:
+            self.programData(self.data, action)
+            return
+        data, blank = self.splitBlank(self.data, blankRun)
+        skipped = sum([len(seg.data) for seg in blank])
+        self.resetMismatches()
+        self.programData(data, action, check=0)
+        if skipped:
+            sys.stderr.write("%i bytes of 0xff skipped.\n" % skipped)
+            sys.stderr.flush()
+            if action & self.ACTION_VERIFY:
+                byteCtr = self.byteCtr              #count programmed bytes only
+                self.programData(blank, self.ACTION_VERIFY, check=0)
+                self.byteCtr = byteCtr
+        self.checkMismatches(action)
+
+    @traced()
+    def actionProgram(self, blankRun=0):
+        """Program data into flash memory. Use blankRun only if the flash
+        is known to be erased, see programBlank."""
         if self.data is not None:
             sys.stderr.write("Program ...\n")
             sys.stderr.flush()
-            self.programData(self.data, self.ACTION_PROGRAM)
+            self.programBlank(self.ACTION_PROGRAM, blankRun)
+            sys.stderr.write("%i bytes programmed.\n" % self.byteCtr)
+            sys.stderr.flush()
+        else:
+            raise BSLException, "programming without data not possible"
+
+    @traced()
+    def actionProgramVerify(self, blankRun=0):
+        """Program data into flash memory, each block is verified right
+        after it is written."""
+        if self.data is not None:
+            sys.stderr.write("Program and verify ...\n")
+            sys.stderr.flush()
+            self.programBlank(self.ACTION_PROGRAM | self.ACTION_VERIFY, blankRun)
             sys.stderr.write("%i bytes programmed.\n" % self.byteCtr)
             sys.stderr.flush()
         else:
             raise BSLException, "programming without data not possible"
 
+    @traced()
     def actionVerify(self):
         """Verify programmed data"""
         if self.data is not None:
@@ -1000,12 +1458,14 @@ class BootStrapLoader(LowLevel):
         else:
             raise BSLException, "verify without data not possible"
 
+    @traced()
     def actionReset(self):
         """Perform a reset, start user programm"""
         sys.stderr.write("Reset device ...\n")
         sys.stderr.flush()
         self.bslReset(0) #only reset
 
+    @traced()
     def actionRun(self, address=0x220):
         """Start program at specified address"""
         sys.stderr.write("Load PC with 0x%04x ...\n" % address)
@@ -1030,6 +1490,7 @@ class BootStrapLoader(LowLevel):
            115200:[0x0000, 0x0004],     #nonstandard XXX BSL dummy BCSCTL settings!
         },
     }
+    @traced()
     def actionChangeBaudrate(self, baudrate=9600):
         """Change baudrate. The command is sent first, then the comm
         port is reprogrammed. Only possible with newer MSP430-BSL versions.
@@ -1052,6 +1513,7 @@ class BootStrapLoader(LowLevel):
         time.sleep(0.010)                   #recomended delay
         self.serialport.setBaudrate(baudrate)
 
+    @traced()
     def actionReadBSLVersion(self):
         """Informational output of BSL version number.
         (newer MSP430-BSLs only)"""
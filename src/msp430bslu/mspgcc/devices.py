@@ -0,0 +1,132 @@
+#!/usr/bin/env python
+#
+# Memory layouts of the devices supported by the ROM bootstrap loader,
+# keyed by the device ID read from 0x0ff0. Each family entry describes
+# its largest member, smaller parts have less flash and RAM.
+#
+# (C) 2009-2010 Flying Camp Design
+#
+# All Rights Reserved.
+#
+# AUTHOR: Chris Wilson <cwilson@flyingcampdesign.com>
+#
+# Released under a BSD-style license (please see LICENSE)
+
+from memory import Memory, Segment
+
+#cpu types for "change baudrate"
+#use strings as ID so that they can be used in outputs too
+F1x                     = "F1x family"
+F4x                     = "F4x family"
+
+INFO_START      = 0x1000
+INFO_END        = 0x1100    #exclusive
+INFO_SEGMENT    = 128
+MAIN_SEGMENT    = 512
+
+class DeviceLayout:
+    """memory map and BSL capabilities of a device (family).
+    ranges are (start, end) tuples with an exclusive end."""
+    def __init__(self, name, family, main, ram, info=(INFO_START, INFO_END),
+                 info_segment=INFO_SEGMENT, main_segment=MAIN_SEGMENT):
+        self.name = name
+        self.family = family
+        self.main = main
+        self.info = info
+        self.ram = ram
+        self.info_segment = info_segment
+        self.main_segment = main_segment
+
+    def __repr__(self):
+        return "DeviceLayout(%r, main=0x%04x-0x%04x, ram=0x%04x-0x%04x)" % (
+            self.name, self.main[0], self.main[1] - 1, self.ram[0], self.ram[1] - 1)
+
+    def can_download_bsl(self):
+        """replacement BSLs need 2kB of RAM"""
+        return self.ram[1] - self.ram[0] >= 2048
+
+    def is_flash(self, address):
+        return self.info[0] <= address < self.info[1] or self.main[0] <= address < self.main[1]
+
+    def segment(self, address):
+        """(start, end) of the flash segment containing address, None
+        outside the flash. segments are aligned to their size, the first
+        one of a region may be shorter (e.g. 0x1100-0x11ff on the F149)"""
+        for start, end, size in ((self.info[0], self.info[1], self.info_segment),
+                                 (self.main[0], self.main[1], self.main_segment)):
+            if start <= address < end:
+                segstart = address - address % size
+                return max(segstart, start), min(segstart + size, end)
+        return None
+
+    def segments(self, start, end):
+        """start addresses of the flash segments touching the inclusive
+        address range start..end, each segment once"""
+        result = []
+        address = start
+        while address <= end:
+            segment = self.segment(address)
+            if segment is None:             #not flash, go on with the next region
+                starts = [region[0] for region in (self.info, self.main) if region[0] > address]
+                if not starts:
+                    break
+                address = min(starts)
+                continue
+            result.append(segment[0])
+            address = segment[1]
+        return result
+
+    def region_end(self, address):
+        """end of the memory region (RAM, info or main flash) containing
+        address, None if it is in none of them"""
+        for start, end in (self.ram, self.info, self.main):
+            if start <= address < end:
+                return end
+        return None
+
+    def boundaries(self):
+        """sorted tuple of the region start and end addresses, frames
+        should not cross them"""
+        limits = {}
+        for start, end in (self.ram, self.info, self.main):
+            limits[start] = limits[end] = 1
+        limits = limits.keys()
+        limits.sort()
+        return tuple(limits)
+
+    def flash(self, segments):
+        """Memory object with the parts of segments that are in flash"""
+        mem = Memory()
+        for seg in segments:
+            segend = seg.startaddress + len(seg.data)
+            for start, end in (self.info, self.main):
+                lo, hi = max(seg.startaddress, start), min(segend, end)
+                if lo < hi:
+                    mem.append(Segment(lo, seg.data[lo - seg.startaddress:hi - seg.startaddress]))
+        return mem
+
+#known device list, one layout per ID read from 0x0ff0
+layouts = {
+    0xf112: DeviceLayout('MSP430F11x',      F1x, main=(0xf000, 0x10000), ram=(0x0200, 0x0300)),
+    0x1132: DeviceLayout('MSP430F11x1',     F1x, main=(0xe000, 0x10000), ram=(0x0200, 0x0300)),
+    0x1232: DeviceLayout('MSP430F12x2',     F1x, main=(0xe000, 0x10000), ram=(0x0200, 0x0300)),
+    0xf123: DeviceLayout('MSP430F12x',      F1x, main=(0xe000, 0x10000), ram=(0x0200, 0x0300)),
+    0xf149: DeviceLayout('MSP430F13x/F14x', F1x, main=(0x1100, 0x10000), ram=(0x0200, 0x0a00)),
+    0xf169: DeviceLayout('MSP430F15x/F16x', F1x, main=(0x1100, 0x10000), ram=(0x0200, 0x0a00)),
+    0xf16c: DeviceLayout('MSP430F161x',     F1x, main=(0x4000, 0x10000), ram=(0x1100, 0x3900)),
+    0xf413: DeviceLayout('MSP430F41x',      F4x, main=(0xe000, 0x10000), ram=(0x0200, 0x0300)),
+    0xf427: DeviceLayout('MSP430FE42x',     F4x, main=(0x8000, 0x10000), ram=(0x0200, 0x0600)),
+    0xf439: DeviceLayout('MSP430F43x',      F4x, main=(0x1100, 0x10000), ram=(0x0200, 0x0a00)),
+    0xf449: DeviceLayout('MSP430F44x',      F4x, main=(0x1100, 0x10000), ram=(0x0200, 0x0a00)),
+}
+
+#used when the device is not known (yet), covers the largest parts
+default_layout = DeviceLayout('unknown', None, main=(0x1100, 0x10000), ram=(0x0200, 0x0a00))
+
+def layout_for(dev_id=None, family=None):
+    """layout of a device ID. unknown IDs get the default layout with
+    the family, if given"""
+    layout = layouts.get(dev_id)
+    if layout is None:
+        layout = DeviceLayout(default_layout.name, family, default_layout.main, default_layout.ram)
+    return layout
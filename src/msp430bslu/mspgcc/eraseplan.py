@@ -0,0 +1,156 @@
+#!/usr/bin/env python
+#
+# Erase planner: finds the flash segments a Memory image touches and
+# picks the cheapest way to erase them with the bootstrap loader,
+# segment erases, a main erase or a mass erase that restores the info
+# segments the image does not cover.
+#
+# (C) 2009-2010 Flying Camp Design
+#
+# All Rights Reserved.
+#
+# AUTHOR: Chris Wilson <cwilson@flyingcampdesign.com>
+#
+# Released under a BSD-style license (please see LICENSE)
+
+SEGMENT = 'segment'
+MAIN = 'main'
+MASS = 'mass'
+
+#bytes on the line for a command without data: sync, ack, header,
+#address, length, checksum and the answer
+COMMAND_BYTES = 13
+LATENCY = 0.005             #turnaround per command, adapter and BSL
+#erase times with the flash timing generator at 257kHz (worst case)
+SEGMENT_ERASE_TIME = 0.019
+MASS_ERASE_TIME = 0.021
+RESET_TIME = 0.5            #bslReset and the password after a mass erase
+
+class ErasePlan:
+    """how to erase the segments of an image.
+    segments: start addresses of the touched segments
+    erase: segment addresses erased one by one (all of segments for
+    SEGMENT, the info ones for MAIN, none for MASS)
+    restore: info segment addresses read before and written back after
+    a mass erase
+    cost: estimated seconds
+    lost, lost_main: info and main segment addresses outside the image
+    that a mass erase wipes without restore"""
+    def __init__(self, strategy, segments, erase=(), restore=(), cost=0.0):
+        self.strategy = strategy
+        self.segments = tuple(segments)
+        self.erase = tuple(erase)
+        self.restore = tuple(restore)
+        self.cost = cost
+        self.lost = ()              #info segments erased without restore
+        self.lost_main = ()         #main segments outside the image erased by a mass erase
+        self.alternatives = {}      #strategy -> estimated seconds of the valid ones
+
+    def __repr__(self):
+        return "ErasePlan(%r, %d segments, %.3f s)" % (self.strategy, len(self.segments), self.cost)
+
+    def describe(self):
+        """readable description of the plan"""
+        if self.strategy == SEGMENT:
+            text = "erase %d segments" % len(self.erase)
+        elif self.strategy == MAIN:
+            text = "main erase"
+            if self.erase:
+                text += " and %d info segments" % len(self.erase)
+        else:
+            text = "mass erase"
+            if self.restore:
+                text += ", restore %d info segments" % len(self.restore)
+            if self.lost_main:
+                text += ", %d main segments outside the image are erased" % len(self.lost_main)
+            if self.lost:
+                text += ", %d info segments are lost" % len(self.lost)
+        others = ['%s %.3f s' % (strategy, cost) for strategy, cost in sorted(self.alternatives.items())
+                  if strategy != self.strategy]
+        text = "%s (%d segments touched, estimated %.3f s" % (text, len(self.segments), self.cost)
+        if others:
+            text += "; %s" % ', '.join(others)
+        return text + ")"
+
+    def as_dict(self):
+        return {
+            'strategy': self.strategy,
+            'segments': list(self.segments),
+            'erase': list(self.erase),
+            'restore': list(self.restore),
+            'lost': list(self.lost),
+            'lost_main': list(self.lost_main),
+            'cost': self.cost,
+            'alternatives': self.alternatives,
+        }
+
+def transfer_time(baudrate, length=0, latency=LATENCY):
+    """seconds for one command with length data bytes"""
+    return (COMMAND_BYTES + length) * 11.0 / baudrate + latency
+
+def touched_segments(segments, layout):
+    """sorted start addresses of the flash segments that contain data
+    of the Memory object segments"""
+    touched = {}
+    for seg in segments:
+        if seg.data:
+            for address in layout.segments(seg.startaddress, seg.startaddress + len(seg.data) - 1):
+                touched[address] = 1
+    touched = touched.keys()
+    touched.sort()
+    return touched
+
+def plan_erase(segments, layout, baudrate=9600, access=1, preserve_info=1, preserve_main=1,
+               maxData=240, erasecycles=1, latency=LATENCY):
+    """choose the cheapest valid strategy to erase the segments touched by
+    the Memory object segments on a device with the given layout.
+    access: the BSL password is known, needed for segment and main erase
+    and to read the info segments before a mass erase
+    preserve_info: info segments not in the image must keep their contents
+    preserve_main: the same for main segments, main and mass erase are
+    only used if the image covers the whole main flash"""
+    touched = touched_segments(segments, layout)
+    info = layout.segments(layout.info[0], layout.info[1] - 1)
+    touched_info = [address for address in touched if address in info]
+    touched_main = [address for address in touched if address not in info]
+    main = layout.segments(layout.main[0], layout.main[1] - 1)
+    whole_main = len(touched_main) == len(main)
+    untouched_main = [address for address in main if address not in touched_main]
+    command = transfer_time(baudrate, 0, latency)
+
+    plans = []
+    if access:
+        plans.append(ErasePlan(SEGMENT, touched, erase=touched,
+            cost=len(touched) * (command + SEGMENT_ERASE_TIME)))
+        if touched_main and (whole_main or not preserve_main):
+            plans.append(ErasePlan(MAIN, touched, erase=touched_info,
+                cost=command + MASS_ERASE_TIME + len(touched_info) * (command + SEGMENT_ERASE_TIME)))
+    restore = []
+    if preserve_info:
+        restore = [address for address in info if address not in touched_info]
+    cost = RESET_TIME + erasecycles * (command + MASS_ERASE_TIME)
+    if access and preserve_main and not whole_main:
+        pass                        #a mass erase would destroy main segments
+    elif access:
+        for address in restore:
+            start, end = layout.segment(address)
+            frames = (end - start + maxData - 1) // maxData
+            #read before the erase, program and verify afterwards
+            cost += 3 * (frames * transfer_time(baudrate, 0, latency) + (end - start) * 11.0 / baudrate)
+        plan = ErasePlan(MASS, touched, restore=restore, cost=cost)
+        plan.lost_main = tuple(untouched_main)
+        plans.append(plan)
+    else:
+        #no password: a mass erase is the only way in, the main and
+        #info segments outside the image are lost
+        plan = ErasePlan(MASS, touched, cost=cost)
+        plan.lost = tuple(restore)
+        plan.lost_main = tuple(untouched_main)
+        plans.append(plan)
+
+    best = plans[0]
+    for plan in plans[1:]:
+        if plan.cost < best.cost:
+            best = plan
+    best.alternatives = dict([(plan.strategy, plan.cost) for plan in plans])
+    return best
@@ -0,0 +1,58 @@
+#!/usr/bin/env python
+#
+# Static interval tree: finds the address ranges overlapping a query
+# range in O(log n + k) for n stored and k reported ranges.
+#
+# (C) 2009-2010 Flying Camp Design
+#
+# All Rights Reserved.
+#
+# AUTHOR: Chris Wilson <cwilson@flyingcampdesign.com>
+#
+# Released under a BSD-style license (please see LICENSE)
+
+class IntervalTree:
+    """ranges are (start, end, value) tuples with an exclusive end. the
+    tree is built once: a balanced binary tree over the ranges sorted by
+    start, each node knows the largest end in its subtree, so subtrees
+    that end before the query range are skipped"""
+    def __init__(self, ranges=()):
+        self.ranges = [r for r in ranges if r[0] < r[1]]
+        self.ranges.sort(key=lambda r: (r[0], r[1]))
+        #implicit tree over the sorted list: the node of the slice
+        #lo:hi is its middle element, maxend[mid] covers the slice
+        self.maxend = [0] * len(self.ranges)
+        self._build(0, len(self.ranges))
+
+    def _build(self, lo, hi):
+        if lo >= hi:
+            return 0
+        mid = (lo + hi) // 2
+        self.maxend[mid] = max(self.ranges[mid][1], self._build(lo, mid), self._build(mid + 1, hi))
+        return self.maxend[mid]
+
+    def __len__(self):
+        return len(self.ranges)
+
+    def __iter__(self):
+        return iter(self.ranges)
+
+    def overlaps(self, start, end):
+        """ranges overlapping start..end (exclusive), sorted by start"""
+        result = []
+        stack = [(0, len(self.ranges))]
+        while stack:
+            lo, hi = stack.pop()
+            if lo >= hi:
+                continue
+            mid = (lo + hi) // 2
+            if self.maxend[mid] <= start:
+                continue                #everything below ends before the query
+            r = self.ranges[mid]
+            if r[0] < end:
+                if start < r[1]:
+                    result.append(r)
+                stack.append((mid + 1, hi))
+            stack.append((lo, mid))     #left side starts earlier, may still overlap
+        result.sort(key=lambda r: (r[0], r[1]))
+        return result
@@ -1,12 +1,55 @@
 # $Id: memory.py,v 1.4 2008/05/22 16:20:02 cliechti Exp $
+import os
 import sys
+import mmap
+import struct
 import elf
+from intervals import IntervalTree
 
 DEBUG = 0
 
 class FileFormatError(IOError):
     """file is not in the expected format"""
 
+#what compose does with ranges that several images define differently
+OVERLAP_ERROR   = 'error'       #raise OverlapError
+FIRST_WINS      = 'first'       #the earlier image is kept
+LAST_WINS       = 'last'        #the later image overwrites
+OVERLAP_POLICIES = (OVERLAP_ERROR, FIRST_WINS, LAST_WINS)
+
+class OverlapError(FileFormatError):
+    """images to compose define an address range differently.
+    overlaps is the list of Overlap objects"""
+    def __init__(self, message, overlaps):
+        FileFormatError.__init__(self, message)
+        self.overlaps = overlaps
+
+SNIFF_SIZE = 64         #bytes read to detect the file format
+
+FORMAT_NAMES = {
+    'elf': 'ELF',
+    'ihex': 'Intel-Hex',
+    'titext': 'TI-Text',
+    'srec': 'S-record',
+}
+
+def sniff(head):
+    """file format from the first bytes of a file: 'elf', 'ihex',
+    'titext', 'srec' or None if unknown"""
+    if head.startswith('\x7fELF'):
+        return 'elf'
+    text = head
+    if text.startswith('\xef\xbb\xbf'):   #UTF-8 BOM of some editors
+        text = text[3:]
+    text = text.lstrip()
+    if text.startswith(':'):
+        return 'ihex'
+    if text.startswith('@'):
+        return 'titext'
+    if text[:1] == 'S' and text[1:2].isdigit():
+        return 'srec'
+    return None
+
 
 class Segment:
     """store a string with memory contents along with its startaddress"""
@@ -53,15 +96,19 @@ class Memory:
         segmentdata = []
         currentAddr = 0
         startAddr   = 0
-        lines = file.readlines()
-        for l in lines:
-            if not l.strip(): continue  #skip empty lines
-            if l[0] != ':': raise FileFormatError("line not valid intel hex data: '%s...'" % l[0:10])
+        for l in file:                  #parsed line by line
             l = l.strip()               #fix CR-LF issues...
-            length  = int(l[1:3],16)
-            address = int(l[3:7],16)
-            type    = int(l[7:9],16)
-            check   = int(l[-2:],16)
+            if not l: continue          #skip empty lines
+            if l[0] != ':': raise FileFormatError("line not valid intel hex data: '%s...'" % l[0:10])
+            try:
+                length  = int(l[1:3],16)
+                address = int(l[3:7],16)
+                type    = int(l[7:9],16)
+                check   = int(l[-2:],16)
+            except ValueError:
+                raise FileFormatError("line not valid intel hex data: '%s...'" % l[0:10])
+            if len(l) < 11 + 2*length:
+                raise FileFormatError("intel hex line too short: '%s...'" % l[0:10])
             if type == 0x00:
                 if currentAddr != address:
                     if segmentdata:
@@ -86,12 +133,16 @@ class Memory:
         for line in file:       #Read one line
             if not line: break #EOF
             l = line.strip()
+            if not l: continue          #skip empty lines
             if l[0] == 'q': break
             elif l[0] == '@':        #if @ => new address => send frame and set new addr.
                 #create a new segment
                 if segmentdata:
                     self.segments.append( Segment(startAddr, ''.join(segmentdata)) )
-                startAddr = int(l[1:],16)
+                try:
+                    startAddr = int(l[1:],16)
+                except ValueError:
+                    raise FileFormatError("invalid TI-Text address: '%s'" % l[:10])
                 segmentdata = []
             else:
                 for i in l.split():
@@ -102,49 +153,122 @@ class Memory:
         if segmentdata:
             self.segments.append( Segment(startAddr, ''.join(segmentdata)) )
 
+    def loadSRec(self, file):
+        """load data from a (opened) file in Motorola S-record format
+        (S19, S28 or S37). checksums are verified"""
+        segmentdata = []
+        currentAddr = 0
+        startAddr   = 0
+        for l in file:                  #parsed line by line
+            l = l.strip()
+            if not l: continue          #skip empty lines
+            if l[0] != 'S' or len(l) < 4:
+                raise FileFormatError("line not valid S-record data: '%s...'" % l[0:10])
+            type = l[1]
+            try:
+                record = [int(l[i:i+2], 16) for i in range(2, len(l), 2)]
+            except ValueError:
+                raise FileFormatError("line not valid S-record data: '%s...'" % l[0:10])
+            if len(l) % 2 or record[0] != len(record) - 1:
+                raise FileFormatError("S-record length mismatch: '%s...'" % l[0:10])
+            if sum(record) & 0xff != 0xff:
+                raise FileFormatError("S-record checksum error: '%s...'" % l[0:10])
+            if type in '123':
+                addrlen = int(type) + 1 #S1: 16 bit, S2: 24 bit, S3: 32 bit addresses
+                address = 0
+                for b in record[1:1+addrlen]:
+                    address = (address << 8) | b
+                if currentAddr != address:
+                    if segmentdata:
+                        self.segments.append( Segment(startAddr, ''.join(segmentdata)) )
+                    startAddr = currentAddr = address
+                    segmentdata = []
+                data = l[2+2*(1+addrlen):-2].decode('hex')
+                segmentdata.append(data)
+                currentAddr = currentAddr + len(data)
+            elif type in '056789':
+                pass                    #header, record count and start address
+            else:
+                raise FileFormatError("unknown S-record type S%s" % type)
+        if segmentdata:
+            self.segments.append( Segment(startAddr, ''.join(segmentdata)) )
+
     def loadELF(self, file):
         """load data from a (opened) file in ELF object format.
         File must be seekable"""
         obj = elf.ELFObject()
-        obj.fromFile(file)
+        try:
+            obj.fromFile(file)
+        except struct.error:
+            raise FileFormatError("ELF file is truncated")
         if obj.e_type != elf.ELFObject.ET_EXEC:
-            raise Exception("No executable")
+            raise FileFormatError("ELF file is no executable")
         for section in obj.getSections():
             if DEBUG:
                 sys.stderr.write("ELF section %s at 0x%04x %d bytes\n" % (section.name, section.lma, len(section.data)))
             if len(section.data):
                 self.segments.append( Segment(section.lma, section.data) )
         
+    def loadBinary(self, file, address=None, trim=0):
+        """load a raw binary image that starts at address. without address
+        the image ends at 0xffff, the interrupt vectors. with trim, trailing
+        0xff bytes are dropped. files are memory mapped and the segment
+        refers to the mapping instead of a copy"""
+        try:
+            data = mmap.mmap(file.fileno(), 0, access=mmap.ACCESS_READ)
+        except (AttributeError, EnvironmentError, ValueError):
+            data = file.read()      #file like object or empty file
+        size = len(data)
+        if address is None:
+            address = 0x10000 - size
+        if address < 0 or address + size > 0x10000:
+            raise FileFormatError('binary image of %d bytes does not fit at 0x%04x' % (size, max(address, 0)))
+        if trim:
+            end = size
+            while end:
+                start = max(end - 4096, 0)
+                chunk = data[start:end].rstrip('\xff')
+                end = start + len(chunk)
+                if chunk:
+                    break
+            size = end
+        if DEBUG:
+            sys.stderr.write("binary image at 0x%04x %d bytes\n" % (address, size))
+        if size:
+            self.segments.append( Segment(address, buffer(data, 0, size)) )
+
     def loadFile(self, filename, fileobj=None):
-        """fill memory with the contents of a file. file type is determined from extension"""
+        """fill memory with the contents of a file. the format is detected
+        from the first bytes, .bin files are raw binary images. filename
+        may be None if fileobj is given, the format is detected then"""
         close = 0
         if fileobj is None:
             fileobj = open(filename, "rb")
             close = 1
         try:
-            #first check extension
-            try:
-                if filename[-4:].lower() == '.txt':
-                    self.loadTIText(fileobj)
-                    return
-                elif filename[-4:].lower() in ('.a43', '.hex'):
-                    self.loadIHex(fileobj)
-                    return
-            except FileFormatError:
-                pass #do contents based detection below
-            #then do a contents based detection
+            if os.path.splitext(filename or '')[1].lower() == '.bin':
+                self.loadBinary(fileobj)    #no magic bytes to look at
+                return
+            head = fileobj.read(SNIFF_SIZE)
+            fileobj.seek(0)
+            format = sniff(head)
+            if not head:
+                raise FileFormatError('%s is empty' % (filename or 'file'))
+            elif format is None:
+                raise FileFormatError('%s could not be loaded (not ELF, Intel-Hex, TI-Text or S-record)' % (filename or 'file'))
+            if DEBUG:
+                sys.stderr.write("loading %s as %s\n" % (filename, FORMAT_NAMES[format]))
             try:
-                self.loadELF(fileobj)
-            except elf.ELFException:
-                fileobj.seek(0)
-                try:
+                if format == 'elf':
+                    self.loadELF(fileobj)
+                elif format == 'ihex':
                     self.loadIHex(fileobj)
-                except FileFormatError:
-                    fileobj.seek(0)
-                    try:
-                        self.loadTIText(fileobj)
-                    except FileFormatError:
-                        raise FileFormatError('file could not be loaded (not ELF, Intel-Hex, or TI-Text)')
+                elif format == 'srec':
+                    self.loadSRec(fileobj)
+                else:
+                    self.loadTIText(fileobj)
+            except (FileFormatError, elf.ELFException), e:
+                raise FileFormatError('%s is no valid %s file: %s' % (filename or 'file', FORMAT_NAMES[format], e))
         finally:
             if close:
                 fileobj.close()
@@ -187,6 +311,36 @@ class Memory:
             for i in range(0, len(segment.data), 16):
                 filelike.write("%s\n" % " ".join(["%02x" % ord(x) for x in segment.data[i:i+16]]))
         filelike.write("q\n")
+
+    def saveSRec(self, filelike):
+        """output Motorola S-records to given file object. S1 records are
+        used for 16 bit addresses, S2 or S3 for larger ones"""
+        end = max([seg.startaddress + len(seg.data) for seg in self.segments] + [0])
+        if end <= 0x10000:
+            type, addrlen = 1, 2
+        elif end <= 0x1000000:
+            type, addrlen = 2, 3
+        else:
+            type, addrlen = 3, 4
+        filelike.write(self._srecline(0, 0, 2, 'HDR'))
+        count = 0
+        for seg in self.segments:
+            for i in range(0, len(seg.data), 16):
+                filelike.write(self._srecline(type, seg.startaddress + i, addrlen, seg.data[i:i+16]))
+                count = count + 1
+        if count <= 0xffff:
+            filelike.write(self._srecline(5, count, 2, ''))
+        else:
+            filelike.write(self._srecline(6, count, 3, ''))
+        filelike.write(self._srecline(10 - type, 0, addrlen, ''))  #S9, S8 or S7 end record
+
+    def _srecline(self, type, address, addrlen, data):
+        record = [len(data) + addrlen + 1]
+        record.extend([(address >> (8 * i)) & 0xff for i in range(addrlen - 1, -1, -1)])
+        record.extend([ord(x) for x in data])
+        record.append(0xff - (sum(record) & 0xff))
+        return 'S%d%s\n' % (type, ''.join(['%02X' % b for b in record]))
+
     # - - - - - - - - - - - - - - - - - - - - - - - - - - - - - - - - - - - - -
     
     def getMemrange(self, fromadr, toadr):
@@ -244,3 +398,169 @@ class Memory:
                 if not contents: return         #stop if done
                 address += length
         raise ValueError("could not write all data")
+
+
+class Overlap:
+    """address range start..end (exclusive) defined by the images with
+    the indexes first and second. same is true if both have the same
+    contents there"""
+    def __init__(self, start, end, first, second, same):
+        self.start = start
+        self.end = end
+        self.first = first
+        self.second = second
+        self.same = same
+
+    def __repr__(self):
+        return "Overlap(0x%04x-0x%04x, %d, %d, same=%r)" % (self.start, self.end - 1, self.first, self.second, self.same)
+
+    def describe(self, names=None):
+        """readable description, names are used for the image indexes"""
+        first, second = self.first, self.second
+        if names:
+            first, second = names[first], names[second]
+        if self.same:
+            return "0x%04x-0x%04x in %s and %s (same data)" % (self.start, self.end - 1, first, second)
+        return "0x%04x-0x%04x in %s and %s (different data)" % (self.start, self.end - 1, first, second)
+
+    def as_dict(self):
+        return {'start': self.start, 'end': self.end - 1, 'images': [self.first, self.second], 'same': self.same}
+
+def compose(images, policy=OVERLAP_ERROR):
+    """combine the Memory objects images into a new one. overlapping
+    ranges with the same contents are kept once, different ones are
+    resolved by policy: OVERLAP_ERROR raises OverlapError, FIRST_WINS
+    keeps the earlier image and LAST_WINS the later one. within one
+    image later segments overwrite earlier ones. the result has an
+    overlaps attribute with the Overlap objects between images"""
+    if policy not in OVERLAP_POLICIES:
+        raise ValueError("unknown overlap policy %r" % (policy,))
+    ranges = []
+    for index, mem in enumerate(images):
+        for seg in mem:
+            #rank decides which range is kept, larger ranks win
+            if policy == FIRST_WINS:
+                rank = (-index, len(ranges))
+            else:
+                rank = (index, len(ranges))
+            ranges.append((seg.startaddress, seg.startaddress + len(seg.data), (rank, index, seg)))
+    tree = IntervalTree(ranges)
+
+    overlaps = []
+    pieces = []
+    for start, end, (rank, index, seg) in tree:
+        keep = [(start, end)]
+        for ostart, oend, (orank, oindex, oseg) in tree.overlaps(start, end):
+            if orank == rank:
+                continue
+            lo, hi = max(start, ostart), min(end, oend)
+            if oindex != index and orank > rank:    #each pair once
+                same = seg.data[lo - start:hi - start] == oseg.data[lo - ostart:hi - ostart]
+                overlaps.append(Overlap(lo, hi, min(index, oindex), max(index, oindex), same))
+            if orank > rank:                        #cut out what the other range wins
+                keep = _subtract(keep, lo, hi)
+        for a, b in keep:
+            if a == start and b == end:
+                pieces.append((a, seg.data))
+            else:
+                pieces.append((a, seg.data[a - start:b - start]))
+    overlaps.sort(key=lambda o: (o.start, o.first, o.second))
+    conflicts = [o for o in overlaps if not o.same]
+    if conflicts and policy == OVERLAP_ERROR:
+        raise OverlapError("%d overlapping ranges with different data, first at 0x%04x" % (
+            len(conflicts), conflicts[0].start), conflicts)
+
+    pieces.sort(key=lambda p: p[0])
+    result = Memory()
+    run = []
+    for address, data in pieces:
+        if run and run[-1][0] + len(run[-1][1]) != address:
+            result.append(_joined(run))
+            run = []
+        run.append((address, data))
+    if run:
+        result.append(_joined(run))
+    result.overlaps = overlaps
+    return result
+
+def _subtract(ranges, lo, hi):
+    """(start, end) ranges without lo..hi"""
+    result = []
+    for a, b in ranges:
+        if a < lo:
+            result.append((a, min(b, lo)))
+        if b > hi:
+            result.append((max(a, hi), b))
+    return result
+
+def _joined(run):
+    """Segment of contiguous (address, data) pieces"""
+    if len(run) == 1:
+        return Segment(run[0][0], run[0][1])
+    return Segment(run[0][0], ''.join([str(data) for address, data in run]))
+
+
+def checksum(data):
+    """inverted xor of the little endian words of data, as the BSL frame
+    checksum. an odd last byte is padded with 0xff"""
+    if len(data) % 2:
+        data = data + '\xff'
+    words = struct.unpack('<%dH' % (len(data) / 2), data)
+    result = 0
+    for word in words:
+        result = result ^ word
+    return result ^ 0xffff
+
+
+class CompiledImage:
+    """read only copy of memory contents that is split into frames once
+    per frame size. for images that are downloaded again and again"""
+    def __init__(self, mem):
+        self.segments = tuple([Segment(seg.startaddress, seg.data) for seg in mem])
+        #(address, length, checksum) of each segment, see checksum()
+        self.checksums = tuple([(seg.startaddress, len(seg.data), checksum(str(seg.data)))
+                                for seg in self.segments])
+        self._frames = {}
+
+    def __getitem__(self, index):
+        return self.segments[index]
+
+    def __len__(self):
+        return len(self.segments)
+
+    def __repr__(self):
+        return "CompiledImage:\n%s" % ('\n'.join([repr(seg) for seg in self.segments]),)
+
+    def signature(self, size=16):
+        """a few (address, data) blocks from the start, middle and end of
+        each segment, for a quick check if the image is in memory"""
+        blocks = []
+        for seg in self.segments:
+            for offset in (0, (len(seg.data) - size) / 2, len(seg.data) - size):
+                offset = max(offset, 0)
+                block = (seg.startaddress + offset, seg.data[offset:offset+size])
+                if block not in blocks:
+                    blocks.append(block)
+        return tuple(blocks)
+
+    def frames(self, size, boundaries=()):
+        """tuple of (address, data) blocks with at most size bytes. blocks
+        do not cross the addresses in boundaries"""
+        key = (size, boundaries)
+        frames = self._frames.get(key)
+        if frames is None:
+            frames = []
+            for seg in self.segments:
+                address = seg.startaddress
+                end = seg.startaddress + len(seg.data)
+                while address < end:
+                    length = min(size, end - address)
+                    for limit in boundaries:
+                        if address < limit < address + length:
+                            length = limit - address
+                            break
+                    offset = address - seg.startaddress
+                    frames.append( (address, seg.data[offset:offset+length]) )
+                    address = address + length
+            frames = self._frames[key] = tuple(frames)
+        return frames
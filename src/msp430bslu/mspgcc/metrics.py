@@ -0,0 +1,286 @@
+#!/usr/bin/env python
+#
+# Protocol metrics for the bootstrap loader: per command counts, bytes,
+# latency histograms, sync retries and throughput. LowLevel keeps one
+# ProtocolMetrics object per connection, the overhead is a few dict
+# updates per frame.
+#
+# (C) 2009-2010 Flying Camp Design
+#
+# All Rights Reserved.
+#
+# AUTHOR: Chris Wilson <cwilson@flyingcampdesign.com>
+#
+# Released under a BSD-style license (please see LICENSE)
+
+import time
+
+#upper bounds of the latency histogram buckets in seconds
+BUCKETS = (0.001, 0.002, 0.005, 0.01, 0.02, 0.05, 0.1, 0.2, 0.5, 1.0, 2.0, 5.0)
+
+FRAME_OVERHEAD = 6      #header, command, 2 length bytes and the checksum
+
+PREFIX = 'msp430bsl'
+
+#command codes, see bsl.LowLevel
+COMMAND_NAMES = {
+    0x10: 'TXPWORD',
+    0x12: 'TXBLK',
+    0x14: 'RXBLK',
+    0x16: 'ERASE',
+    0x18: 'MERAS',
+    0x1A: 'LOADPC',
+    0x1E: 'TXVERSION',
+    0x20: 'CHANGEBAUD',
+}
+
+def command_name(cmd):
+    return COMMAND_NAMES.get(cmd, '0x%02x' % cmd)
+
+class Histogram:
+    """latency histogram with fixed buckets"""
+    def __init__(self, buckets=BUCKETS):
+        self.buckets = buckets
+        self.counts = [0] * (len(buckets) + 1)  #last one is +Inf
+        self.sum = 0.0
+        self.count = 0
+        self.max = 0.0
+
+    def add(self, value):
+        i = 0
+        for bound in self.buckets:
+            if value <= bound:
+                break
+            i += 1
+        self.counts[i] += 1
+        self.sum += value
+        self.count += 1
+        if value > self.max:
+            self.max = value
+
+    def merge(self, other):
+        for i in range(len(self.counts)):
+            self.counts[i] += other.counts[i]
+        self.sum += other.sum
+        self.count += other.count
+        self.max = max(self.max, other.max)
+
+    def mean(self):
+        return self.count and self.sum / self.count or 0.0
+
+    def as_dict(self):
+        return {
+            'buckets': dict([(str(bound), count) for bound, count in zip(self.buckets, self.counts)] + [('+Inf', self.counts[-1])]),
+            'sum': self.sum,
+            'count': self.count,
+            'mean': self.mean(),
+            'max': self.max,
+        }
+
+class CommandStats:
+    """counters of one BSL command"""
+    def __init__(self):
+        self.count = 0
+        self.tx_bytes = 0
+        self.rx_bytes = 0
+        self.payload = 0
+        self.errors = {}
+        self.latency = Histogram()
+
+    def merge(self, other):
+        self.count += other.count
+        self.tx_bytes += other.tx_bytes
+        self.rx_bytes += other.rx_bytes
+        self.payload += other.payload
+        for error, count in other.errors.items():
+            self.errors[error] = self.errors.get(error, 0) + count
+        self.latency.merge(other.latency)
+
+    def as_dict(self):
+        return {
+            'count': self.count,
+            'tx_bytes': self.tx_bytes,
+            'rx_bytes': self.rx_bytes,
+            'payload': self.payload,
+            'errors': dict(self.errors),
+            'latency': self.latency.as_dict(),
+        }
+
+class ProtocolMetrics:
+    """metrics of one or more BSL sessions"""
+    def __init__(self):
+        self.reset()
+
+    def reset(self):
+        self.commands = {}
+        self.sync = Histogram()
+        self.sync_retries = 0
+        self.reset_time = 0.0
+        self.resets = 0
+        self.session_time = 0.0
+        self.sessions = 0
+        self.frame_size = None          #data bytes per frame in use
+        self.frame_tuning = None        #autotune.FrameSizeTuner.as_dict() when auto-tuned
+        self._started = None
+
+    def start(self):
+        """a connection was opened"""
+        self._started = time.time()
+
+    def stop(self):
+        """the connection was closed"""
+        if self._started is not None:
+            self.session_time += time.time() - self._started
+            self.sessions += 1
+            self._started = None
+
+    def _stats(self, cmd):
+        name = command_name(cmd)
+        stats = self.commands.get(name)
+        if stats is None:
+            stats = self.commands[name] = CommandStats()
+        return stats
+
+    def command(self, cmd, synctime, latency, txlen, rxlen, payload=0):
+        """record a completed command. synctime and latency are the
+        seconds for the sync and for the frame turnaround, txlen and
+        rxlen the bytes on the line, payload the memory bytes moved"""
+        self.sync.add(synctime)
+        stats = self._stats(cmd)
+        stats.count += 1
+        stats.tx_bytes += txlen + 1             #+ sync character
+        stats.rx_bytes += rxlen + 1             #+ sync answer
+        stats.payload += payload
+        stats.latency.add(latency)
+
+    def error(self, cmd, message):
+        """record a failed command"""
+        stats = self._stats(cmd)
+        stats.errors[message] = stats.errors.get(message, 0) + 1
+
+    def retry(self):
+        """record a repeated sync character"""
+        self.sync_retries += 1
+
+    def add_reset(self, seconds):
+        self.resets += 1
+        self.reset_time += seconds
+
+    def merge(self, other):
+        """add the counters of another ProtocolMetrics object"""
+        for name, stats in other.commands.items():
+            if name not in self.commands:
+                self.commands[name] = CommandStats()
+            self.commands[name].merge(stats)
+        self.sync.merge(other.sync)
+        self.sync_retries += other.sync_retries
+        self.reset_time += other.reset_time
+        self.resets += other.resets
+        self.session_time += other.session_time
+        self.sessions += other.sessions
+        if other.frame_size is not None:
+            self.frame_size = other.frame_size
+            self.frame_tuning = other.frame_tuning
+
+    def payload(self):
+        """memory bytes written and read"""
+        return sum([stats.payload for stats in self.commands.values()])
+
+    def busy_time(self):
+        """seconds spent in sync and command turnaround"""
+        return self.sync.sum + sum([stats.latency.sum for stats in self.commands.values()])
+
+    def throughput(self):
+        """effective memory bytes per second of protocol time"""
+        busy = self.busy_time()
+        return busy and self.payload() / busy or 0.0
+
+    def as_dict(self):
+        return {
+            'commands': dict([(name, stats.as_dict()) for name, stats in self.commands.items()]),
+            'sync': self.sync.as_dict(),
+            'sync_retries': self.sync_retries,
+            'resets': self.resets,
+            'reset_time': self.reset_time,
+            'sessions': self.sessions,
+            'session_time': self.session_time,
+            'busy_time': self.busy_time(),
+            'payload': self.payload(),
+            'throughput': self.throughput(),
+            'frame_size': self.frame_size,
+            'frame_tuning': self.frame_tuning,
+        }
+
+    def prometheus(self, labels=None):
+        """return the metrics in the Prometheus text exposition format.
+        labels is a dict of labels added to every sample"""
+        return prometheus_text([(labels or {}, self)])
+
+def _escape(value):
+    return str(value).replace('\\', '\\\\').replace('"', '\\"').replace('\n', '\\n')
+
+def prometheus_text(sources):
+    """Prometheus text exposition of several metrics objects, sources
+    is a list of (labels dict, ProtocolMetrics) tuples"""
+    lines = []
+    def header(name, kind, text):
+        lines.append('# HELP %s_%s %s' % (PREFIX, name, text))
+        lines.append('# TYPE %s_%s %s' % (PREFIX, name, kind))
+    def sample(name, labels, value, extra=()):
+        items = sorted(labels.items()) + list(extra)
+        if items:
+            lines.append('%s_%s{%s} %r' % (PREFIX, name, ','.join(['%s="%s"' % (k, _escape(v)) for k, v in items]), value))
+        else:
+            lines.append('%s_%s %r' % (PREFIX, name, value))
+    def histogram(name, labels, hist, extra=()):
+        total = 0
+        for bound, count in zip(hist.buckets, hist.counts):
+            total += count
+            sample(name + '_bucket', labels, total, list(extra) + [('le', bound)])
+        sample(name + '_bucket', labels, hist.count, list(extra) + [('le', '+Inf')])
+        sample(name + '_sum', labels, hist.sum, extra)
+        sample(name + '_count', labels, hist.count, extra)
+
+    header('commands_total', 'counter', 'BSL commands completed')
+    for labels, m in sources:
+        for name in sorted(m.commands.keys()):
+            sample('commands_total', labels, m.commands[name].count, [('command', name)])
+    header('command_errors_total', 'counter', 'BSL commands failed')
+    for labels, m in sources:
+        for name in sorted(m.commands.keys()):
+            for error, count in sorted(m.commands[name].errors.items()):
+                sample('command_errors_total', labels, count, [('command', name), ('error', error)])
+    header('line_bytes_total', 'counter', 'bytes on the serial line')
+    for labels, m in sources:
+        for name in sorted(m.commands.keys()):
+            sample('line_bytes_total', labels, m.commands[name].tx_bytes, [('command', name), ('direction', 'tx')])
+            sample('line_bytes_total', labels, m.commands[name].rx_bytes, [('command', name), ('direction', 'rx')])
+    header('payload_bytes_total', 'counter', 'memory bytes written or read')
+    for labels, m in sources:
+        for name in sorted(m.commands.keys()):
+            sample('payload_bytes_total', labels, m.commands[name].payload, [('command', name)])
+    header('command_latency_seconds', 'histogram', 'frame turnaround time')
+    for labels, m in sources:
+        for name in sorted(m.commands.keys()):
+            histogram('command_latency_seconds', labels, m.commands[name].latency, [('command', name)])
+    header('sync_latency_seconds', 'histogram', 'time to synchronize before a command')
+    for labels, m in sources:
+        histogram('sync_latency_seconds', labels, m.sync)
+    for name, kind, text, attr in (
+            ('sync_retries_total', 'counter', 'repeated sync characters', 'sync_retries'),
+            ('resets_total', 'counter', 'reset and BSL entry sequences', 'resets'),
+            ('reset_seconds_total', 'counter', 'time spent in reset and BSL entry sequences', 'reset_time'),
+            ('sessions_total', 'counter', 'connections', 'sessions'),
+            ('session_seconds_total', 'counter', 'time the port was connected', 'session_time'),
+        ):
+        header(name, kind, text)
+        for labels, m in sources:
+            sample(name, labels, getattr(m, attr))
+    header('throughput_bytes_per_second', 'gauge', 'memory bytes per second of protocol time')
+    for labels, m in sources:
+        sample('throughput_bytes_per_second', labels, m.throughput())
+    header('frame_size_bytes', 'gauge', 'data bytes per frame in use')
+    for labels, m in sources:
+        if m.frame_size is not None:
+            sample('frame_size_bytes', labels, m.frame_size)
+    return '\n'.join(lines) + '\n'
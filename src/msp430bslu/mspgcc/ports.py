@@ -0,0 +1,33 @@
+#!/usr/bin/env python
+#
+# Port factory: turns the port names accepted by the command line, the
+# station and the GUI into port like objects for LowLevel.comInit().
+# Simulated targets and trace files are handled here so the protocol
+# module does not depend on them.
+#
+# (C) 2009-2010 Flying Camp Design
+#
+# All Rights Reserved.
+#
+# AUTHOR: Chris Wilson <cwilson@flyingcampdesign.com>
+#
+# Released under a BSD-style license (please see LICENSE)
+
+import serial
+import simulator
+import serialtrace
+
+def open_port(port, tracefile=None, timeout=1):
+    """port like object for port: the simulated target for "sim:..."
+    names, a replay of the trace file for "replay:..." names, else port
+    itself, comInit opens serial port names. with tracefile the traffic
+    is recorded, a serial port is opened here for that."""
+    if simulator.is_simulated(port):
+        port = simulator.get_target(port)
+    elif serialtrace.is_replay(port):
+        port = serialtrace.TraceReplay(port[len(serialtrace.REPLAY_PREFIX):])
+    if tracefile and not isinstance(port, serialtrace.TraceRecorder):
+        if not hasattr(port, 'read'):
+            port = serial.Serial(port, 9600, parity=serial.PARITY_EVEN, timeout=timeout)
+        port = serialtrace.TraceRecorder(port, tracefile)
+    return port
@@ -0,0 +1,232 @@
+#!/usr/bin/env python
+#
+# Serial protocol trace recording and replay.
+#
+# TraceRecorder wraps the serial port used by LowLevel and writes every
+# write, read, control line change and flush with a timestamp to a
+# binary trace file. TraceReplay is a port like object that answers an
+# unmodified BootStrapLoader with the reads of such a file.
+#
+# File format: header "BSLT", version byte, reserved byte, start time
+# (little endian double), followed by records of type byte,
+# microseconds since start (uint32), data length (uint16) and data.
+#
+# (C) 2009-2010 Flying Camp Design
+#
+# All Rights Reserved.
+#
+# AUTHOR: Chris Wilson <cwilson@flyingcampdesign.com>
+#
+# Released under a BSD-style license (please see LICENSE)
+
+import sys, time, struct
+import serial
+
+MAGIC = 'BSLT'
+VERSION = 1
+HEADER = '<4sBBd'
+RECORD = '<cIH'
+
+REPLAY_PREFIX = 'replay:'   #port names starting with this replay a trace file
+
+#record types
+WRITE       = 'W'
+READ        = 'R'
+DTR         = 'D'
+RTS         = 'T'
+BREAK       = 'B'
+FLUSH_IN    = 'I'
+FLUSH_OUT   = 'O'
+BAUDRATE    = 'S'
+CLOSE       = 'C'
+
+NAMES = {
+    WRITE: 'write', READ: 'read', DTR: 'DTR', RTS: 'RTS', BREAK: 'break',
+    FLUSH_IN: 'flushInput', FLUSH_OUT: 'flushOutput', BAUDRATE: 'baudrate', CLOSE: 'close',
+}
+
+class TraceError(serial.SerialException):
+    """trace file can't be read or the replay does not match it"""
+
+class TraceRecorder(object):
+    """serial port wrapper that records all traffic to a trace file"""
+    def __init__(self, port, filename):
+        self.port = port
+        self.file = open(filename, 'wb')
+        self.start = time.time()
+        self.last = 0
+        self.file.write(struct.pack(HEADER, MAGIC, VERSION, 0, self.start))
+
+    def _record(self, kind, data=''):
+        #time.time() can step backwards, keep the timestamps monotonic
+        now = max(int((time.time() - self.start) * 1e6), self.last)
+        self.last = now
+        self.file.write(struct.pack(RECORD, kind, now & 0xffffffff, len(data)) + data)
+
+    def _get_timeout(self):
+        return self.port.timeout
+    def _set_timeout(self, timeout):
+        self.port.timeout = timeout
+    timeout = property(_get_timeout, _set_timeout)
+
+    def __getattr__(self, name):
+        return getattr(self.port, name)
+
+    def write(self, data):
+        self._record(WRITE, data)
+        return self.port.write(data)
+
+    def read(self, size=1):
+        data = self.port.read(size)
+        self._record(READ, data)
+        return data
+
+    def setDTR(self, level=1):
+        self._record(DTR, chr(level and 1 or 0))
+        self.port.setDTR(level)
+
+    def setRTS(self, level=1):
+        self._record(RTS, chr(level and 1 or 0))
+        self.port.setRTS(level)
+
+    def setBreak(self, level=1):
+        self._record(BREAK, chr(level and 1 or 0))
+        self.port.setBreak(level)
+
+    def flushInput(self):
+        self._record(FLUSH_IN)
+        self.port.flushInput()
+
+    def flushOutput(self):
+        self._record(FLUSH_OUT)
+        self.port.flushOutput()
+
+    def setBaudrate(self, baudrate):
+        self._record(BAUDRATE, struct.pack('<I', baudrate))
+        self.port.setBaudrate(baudrate)
+
+    def close(self):
+        if not self.file.closed:
+            self._record(CLOSE)
+            self.file.close()
+        self.port.close()
+
+def load(filename):
+    """read a trace file, return (start time, list of (type, seconds, data))"""
+    f = open(filename, 'rb')
+    try:
+        raw = f.read()
+    finally:
+        f.close()
+    hsize = struct.calcsize(HEADER)
+    rsize = struct.calcsize(RECORD)
+    if len(raw) < hsize:
+        raise TraceError("%s: not a trace file" % filename)
+    magic, version, reserved, start = struct.unpack(HEADER, raw[:hsize])
+    if magic != MAGIC or version != VERSION:
+        raise TraceError("%s: not a trace file or unsupported version" % filename)
+    records = []
+    pos = hsize
+    while pos + rsize <= len(raw):
+        kind, usec, length = struct.unpack(RECORD, raw[pos:pos+rsize])
+        pos += rsize
+        records.append((kind, usec / 1e6, raw[pos:pos+length]))
+        pos += length
+    return start, records
+
+class TraceReplay:
+    """port like object that plays back a trace file. reads return the
+    recorded data, everything else is checked against the recording if
+    strict is set. with realtime set, reads are delayed like in the
+    recording."""
+    def __init__(self, filename, strict=1, realtime=0):
+        self.portstr = REPLAY_PREFIX + filename
+        self.filename = filename
+        self.recorded_start, self.records = load(filename)
+        self.strict = strict
+        self.realtime = realtime
+        self.pos = 0
+        self.timeout = None
+        self.baudrate = 9600
+        self.start = time.time()
+        self.isOpen = 1
+
+    def _next(self, kind, data=None):
+        """consume the next record of the given type"""
+        while self.pos < len(self.records):
+            rkind, stamp, rdata = self.records[self.pos]
+            self.pos += 1
+            if rkind == kind:
+                if self.strict and data is not None and rdata != data:
+                    raise TraceError("replay mismatch at record %d: %s %r, recorded %r" % (self.pos - 1, NAMES[kind], data, rdata))
+                if self.realtime:
+                    delay = self.start + stamp - time.time()
+                    if delay > 0:
+                        time.sleep(delay)
+                return rdata
+            if self.strict:
+                raise TraceError("replay mismatch at record %d: %s, recorded %s" % (self.pos - 1, NAMES[kind], NAMES.get(rkind, rkind)))
+        if self.strict and kind != READ:
+            raise TraceError("replay past the end of the trace: %s" % NAMES[kind])
+        return ''
+
+    def write(self, data):
+        self._next(WRITE, data)
+        return len(data)
+
+    def read(self, size=1):
+        return self._next(READ)
+
+    def setDTR(self, level=1):
+        self._next(DTR, chr(level and 1 or 0))
+
+    def setRTS(self, level=1):
+        self._next(RTS, chr(level and 1 or 0))
+
+    def setBreak(self, level=1):
+        self._next(BREAK, chr(level and 1 or 0))
+
+    def flushInput(self):
+        self._next(FLUSH_IN)
+
+    def flushOutput(self):
+        self._next(FLUSH_OUT)
+
+    def setBaudrate(self, baudrate):
+        self.baudrate = baudrate
+        self._next(BAUDRATE, struct.pack('<I', baudrate))
+
+    def inWaiting(self):
+        return 0
+
+    def close(self):
+        if self.pos < len(self.records) and self.records[self.pos][0] == CLOSE:
+            self.pos += 1
+        self.isOpen = 0
+
+def is_replay(port):
+    """true if port names a trace file to replay"""
+    return isinstance(port, basestring) and port.startswith(REPLAY_PREFIX)
+
+def dump(filename, output=sys.stdout):
+    """print a trace file in readable form"""
+    start, records = load(filename)
+    output.write("trace started %s\n" % time.strftime("%Y-%m-%d %H:%M:%S", time.localtime(start)))
+    last = 0.0
+    for kind, stamp, data in records:
+        if kind == BAUDRATE:
+            text = str(struct.unpack('<I', data)[0])
+        elif kind in (DTR, RTS, BREAK):
+            text = str(ord(data))
+        else:
+            text = ' '.join(['%02x' % ord(c) for c in data])
+            if kind == READ and not data:
+                text = '(timeout)'
+        output.write("%10.6f %+9.6f %-11s %s\n" % (stamp, stamp - last, NAMES.get(kind, kind), text))
+        last = stamp
+
+if __name__ == '__main__':
+    if len(sys.argv) != 2:
+        sys.stderr.write("usage: %s TRACEFILE\n" % sys.argv[0])
+        sys.exit(2)
+    dump(sys.argv[1])
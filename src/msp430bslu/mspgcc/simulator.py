@@ -0,0 +1,291 @@
+#!/usr/bin/env python
+#
+# Simulated MSP430 target with a ROM bootstrap loader. SimulatedTarget
+# behaves like an open pyserial port and can be passed to
+# LowLevel.comInit() in place of a port name.
+#
+# (C) 2009-2010 Flying Camp Design
+#
+# All Rights Reserved.
+#
+# AUTHOR: Chris Wilson <cwilson@flyingcampdesign.com>
+#
+# Released under a BSD-style license (please see LICENSE)
+
+import sys, time, struct, array, threading, random
+
+DEBUG = 0
+
+PORT_PREFIX = 'sim:'    #port names starting with this select a simulated target
+
+#protocol constants, see bsl.LowLevel
+BSL_SYNC        = 0x80
+BSL_TXPWORD     = 0x10
+BSL_TXBLK       = 0x12
+BSL_RXBLK       = 0x14
+BSL_ERASE       = 0x16
+BSL_MERAS       = 0x18
+BSL_LOADPC      = 0x1A
+BSL_TXVERSION   = 0x1E
+BSL_CHANGEBAUD  = 0x20
+
+CMD_FAILED      = 0x70
+DATA_FRAME      = 0x80
+DATA_ACK        = 0x90
+DATA_NAK        = 0xA0
+
+#erase modes coded in the length field
+ERASE_SEGMENT   = 0xa502
+ERASE_MAIN      = 0xa504
+
+#memory map of a F149
+RAM_START       = 0x0200
+RAM_END         = 0x0a00
+BSL_INFO        = 0x0ff0    #device id and BSL version in the boot ROM
+ADJUST_SP       = 0x0c22    #ROM routine that relocks the BSL
+INFO_START      = 0x1000
+MAIN_START      = 0x1100
+INFO_SEGMENT    = 128
+MAIN_SEGMENT    = 512
+
+def checksum(data):
+    """BSL checksum over a string of even length"""
+    crc = 0
+    for i in range(0, len(data), 2):
+        crc = crc ^ (ord(data[i]) | (ord(data[i+1]) << 8))
+    return 0xffff & (crc ^ 0xffff)
+
+class SimulatedTarget:
+    """serial port like object emulating a MSP430F1x with the ROM BSL.
+    the standard BSL hardware wiring is assumed: DTR drives RST/NMI and
+    RTS (inverted) drives TEST. the BSL is entered when TEST is pulsed
+    while RST is low, any other reset starts the user program which
+    does not answer.
+    with realtime set, the time to transfer the frames at the current
+    baudrate (8E1) is spent too. errors is the probability of a received
+    byte being corrupted, frames with errors are answered with a NAK."""
+
+    def __init__(self, name='sim', dev_id=0xf149, bslVer=0x0160, latency=0.0, realtime=0, errors=0.0, seed=None):
+        self.portstr = name
+        self.baudrate = 9600
+        self.timeout = None
+        self.latency = latency          #seconds added to each answer, e.g. flash timing
+        self.realtime = realtime
+        self.errors = errors
+        self.random = random.Random(seed)
+        self.memory = array.array('B', [0xff]) * 0x10000
+        self.memory[BSL_INFO:BSL_INFO+16] = array.array('B', struct.pack(">H8xH4x", dev_id, bslVer))
+        self.dev_id = dev_id
+        self.bslVer = bslVer
+        self.inBSL = 0
+        self.unlocked = 0
+        self.rst = 0
+        self.test = 0
+        self.testEdges = 0
+        self.rxbuf = ''                 #bytes from the host
+        self.txbuf = ''                 #bytes to the host
+        self.synced = 0
+        self.isOpen = 1
+        self.stats = {'frames': 0, 'bytes_in': 0, 'bytes_out': 0, 'corrupted': 0}
+
+    # - - - - - - - - - - - - - - - - - - - - - - - - - - - - - - - - - - - - -
+    # pyserial interface
+
+    def open(self):
+        self.isOpen = 1
+
+    def close(self):
+        self.isOpen = 0
+
+    def setBaudrate(self, baudrate):
+        self.baudrate = baudrate
+
+    def flushInput(self):
+        self.txbuf = ''
+
+    def flushOutput(self):
+        pass
+
+    def inWaiting(self):
+        return len(self.txbuf)
+
+    def setDTR(self, level=1):
+        level = level and 1 or 0
+        if level and not self.rst:      #leaving reset
+            self.inBSL = self.testEdges >= 2
+            self.unlocked = 0
+            self.synced = 0
+            self.rxbuf = ''
+            if DEBUG: sys.stderr.write("sim: reset -> %s\n" % (self.inBSL and 'BSL' or 'user program'))
+        elif not level:
+            self.testEdges = 0
+        self.rst = level
+
+    def setRTS(self, level=1):
+        level = level and 1 or 0
+        if level != self.test and not self.rst:
+            self.testEdges += 1
+        self.test = level
+
+    def write(self, data):
+        self.stats['bytes_in'] += len(data)
+        if self.inBSL:
+            self.rxbuf = self.rxbuf + data
+            self._process()
+        return len(data)
+
+    def read(self, size=1):
+        if len(self.txbuf) < size and self.timeout:
+            time.sleep(self.timeout)    #a real port would wait that long for data
+        data, self.txbuf = self.txbuf[:size], self.txbuf[size:]
+        self.stats['bytes_out'] += len(data)
+        return data
+
+    # - - - - - - - - - - - - - - - - - - - - - - - - - - - - - - - - - - - - -
+    # target side
+
+    def load(self, mem):
+        """preset the target memory with the segments of a Memory object"""
+        for seg in mem:
+            self.memory[seg.startaddress:seg.startaddress+len(seg.data)] = array.array('B', seg.data)
+
+    def dump(self, address, size):
+        """return a string with the target memory contents"""
+        return self.memory[address:address+size].tostring()
+
+    def _linetime(self, count):
+        if self.realtime:
+            time.sleep(count * 11.0 / self.baudrate)   #start, 8 data, parity and stop bit
+
+    def _answer(self, data):
+        if self.latency:
+            time.sleep(self.latency)
+        self._linetime(len(data))
+        self.txbuf = self.txbuf + data
+
+    def _process(self):
+        while self.rxbuf:
+            if not self.synced:
+                c, self.rxbuf = self.rxbuf[0], self.rxbuf[1:]
+                if ord(c) == BSL_SYNC:
+                    self._linetime(1)
+                    self.synced = 1
+                    self._answer(chr(DATA_ACK))
+                continue
+            if ord(self.rxbuf[0]) != DATA_FRAME:
+                self.rxbuf = self.rxbuf[1:]     #garbage, wait for the next sync
+                self.synced = 0
+                continue
+            if len(self.rxbuf) < 4:
+                return
+            length = ord(self.rxbuf[2])
+            if len(self.rxbuf) < length + 6:
+                return
+            frame, self.rxbuf = self.rxbuf[:length+6], self.rxbuf[length+6:]
+            self.synced = 0
+            self.stats['frames'] += 1
+            self._linetime(len(frame))
+            if self.errors and self.random.random() < 1.0 - (1.0 - self.errors) ** len(frame):
+                self.stats['corrupted'] += 1
+                self._answer(chr(DATA_NAK))
+            elif frame[2] != frame[3] or struct.unpack("<H", frame[-2:])[0] != checksum(frame[:-2]):
+                self._answer(chr(DATA_NAK))
+            else:
+                self._command(ord(frame[1]), frame[4:-2])
+
+    def _frame(self, data):
+        frame = struct.pack("BBBB", DATA_FRAME, 0, len(data), len(data)) + data
+        return frame + struct.pack("<H", checksum(frame))
+
+    def _isflash(self, address):
+        return address >= INFO_START
+
+    def _erase(self, start, end):
+        for address in range(max(start, INFO_START), min(end, 0x10000)):
+            self.memory[address] = 0xff
+
+    def _command(self, cmd, data):
+        address, length = struct.unpack("<HH", data[:4])
+        payload = data[4:]
+        if DEBUG > 1: sys.stderr.write("sim: cmd 0x%02x addr 0x%04x len 0x%04x\n" % (cmd, address, length))
+        if cmd == BSL_TXPWORD:
+            if payload[:32] == self.dump(0xffe0, 32):
+                self.unlocked = 1
+                self._answer(chr(DATA_ACK))
+            else:
+                self.unlocked = 0
+                self._answer(chr(DATA_NAK))
+        elif cmd == BSL_MERAS:                      #not password protected
+            self._erase(INFO_START, 0x10000)
+            self._answer(chr(DATA_ACK))
+        elif not self.unlocked:
+            self._answer(chr(DATA_NAK))
+        elif cmd == BSL_TXBLK:
+            for i in range(len(payload)):
+                if self._isflash(address + i):      #flash bits can only be cleared
+                    self.memory[address + i] &= ord(payload[i])
+                elif RAM_START <= address + i < RAM_END:
+                    self.memory[address + i] = ord(payload[i])
+            self._answer(chr(DATA_ACK))
+        elif cmd == BSL_RXBLK:
+            self._answer(self._frame(self.dump(address, length)))
+        elif cmd == BSL_ERASE:
+            if length == ERASE_MAIN:
+                self._erase(MAIN_START, 0x10000)
+            elif length == ERASE_SEGMENT:
+                if address < MAIN_START:
+                    size = INFO_SEGMENT
+                else:
+                    size = MAIN_SEGMENT
+                start = address - (address % size)
+                self._erase(start, start + size)
+            else:
+                self._answer(chr(CMD_FAILED))
+                return
+            self._answer(chr(DATA_ACK))
+        elif cmd == BSL_LOADPC:
+            self._answer(chr(DATA_ACK))
+            if address == ADJUST_SP:
+                self.unlocked = 0
+            elif address >= INFO_START:             #user program, leaves the BSL
+                self.inBSL = 0
+            #code in RAM (patch, replacement BSL) is assumed to behave like the BSL
+        elif cmd == BSL_CHANGEBAUD:
+            self._answer(chr(DATA_ACK))
+        elif cmd == BSL_TXVERSION and self.bslVer >= 0x0160:
+            self._answer(self._frame(self.dump(BSL_INFO, 16)))
+        else:
+            self._answer(chr(CMD_FAILED))
+
+_targets = {}
+_lock = threading.Lock()
+
+def is_simulated(port):
+    """true if port names a simulated target"""
+    return isinstance(port, basestring) and port.startswith(PORT_PREFIX)
+
+def get_target(port, **kwargs):
+    """return the simulated target for a port name. targets are kept per
+    name, so memory contents persist over several connections."""
+    _lock.acquire()
+    try:
+        if port not in _targets:
+            _targets[port] = SimulatedTarget(port, **kwargs)
+        target = _targets[port]
+        target.open()
+        return target
+    finally:
+        _lock.release()
+
+if __name__ == '__main__':
+    import bsl
+    from memory import Memory, Segment
+    bslobj = bsl.BootStrapLoader()
+    bslobj.comInit(get_target(PORT_PREFIX + 'demo'))
+    bslobj.actionMassErase()
+    bslobj.actionStartBSL()
+    bslobj.data = Memory()
+    bslobj.data.append(Segment(0xf000, ''.join([chr(i & 0xff) for i in range(1024)])))
+    bslobj.actionProgram()
+    bslobj.actionVerify()
+    bslobj.comDone()
@@ -0,0 +1,152 @@
+#!/usr/bin/env python
+#
+# Tests of the bootstrap loader against the simulated target
+#
+# (C) 2009-2010 Flying Camp Design
+#
+# All Rights Reserved.
+#
+# AUTHOR: Chris Wilson <cwilson@flyingcampdesign.com>
+#
+# Released under a BSD-style license (please see LICENSE)
+
+import sys
+import unittest
+from cStringIO import StringIO
+
+from msp430bslu.mspgcc import bsl, simulator
+from msp430bslu.mspgcc.memory import Memory, Segment, CompiledImage
+
+def image(*segments):
+    mem = Memory()
+    for address, data in segments:
+        mem.append(Segment(address, data))
+    return mem
+
+class SimulatedTestCase(unittest.TestCase):
+    """a BSL connected to a fresh, mass erased simulated target. the
+    progress messages on sys.stderr are collected in self.log"""
+    def setUp(self):
+        self.stderr = sys.stderr
+        sys.stderr = self.log = StringIO()
+        self.target = self.make_target()
+        self.bslobj = bsl.BootStrapLoader()
+        self.bslobj.comInit(self.target)
+        self.bslobj.actionMassErase()
+        self.bslobj.actionStartBSL()
+
+    def make_target(self):
+        return simulator.SimulatedTarget('sim:test')
+
+    def tearDown(self):
+        self.bslobj.comDone()
+        sys.stderr = self.stderr
+
+
+class ProgramTest(SimulatedTestCase):
+    def test_program_verify(self):
+        data = ''.join([chr(i & 0xff) for i in range(1000)])
+        self.bslobj.data = image((0xf000, data))
+        self.bslobj.actionProgramVerify()
+        self.assertEqual(self.target.dump(0xf000, len(data)), data)
+
+    def test_odd_address(self):
+        self.bslobj.data = image((0xf201, '\x55\x66\x77'))
+        self.bslobj.actionProgram()
+        self.bslobj.actionVerify()
+        self.assertEqual(self.target.dump(0xf200, 5), '\xff\x55\x66\x77\xff')
+
+    def test_blank_run_at_odd_address(self):
+        data = '\x11' + '\xff' * 101 + '\x22\x33\x44'
+        self.bslobj.data = image((0xf000, data))
+        self.bslobj.actionProgramVerify(blankRun=64)
+        self.assertEqual(self.target.dump(0xf000, len(data)), data)
+        self.bslobj.actionVerify()
+
+    def test_split_blank_even(self):
+        data, blank = self.bslobj.splitBlank(image((0xf000, '\x11' + '\xff' * 101 + '\x22')), 64)
+        self.assertEqual([(seg.startaddress, len(seg.data)) for seg in blank], [(0xf002, 100)])
+        self.assertEqual([(seg.startaddress, seg.data) for seg in data],
+                         [(0xf000, '\x11\xff'), (0xf066, '\x22')])
+
+    def test_verify_failure(self):
+        self.bslobj.data = image((0xf000, 'abcd'))
+        self.bslobj.actionProgram()
+        self.bslobj.data = image((0xf000, 'abXd'))
+        self.assertRaises(bsl.BSLException, self.bslobj.actionVerify)
+        self.assertEqual([(m.address, m.expected, m.actual) for m in self.bslobj.mismatches],
+                         [(0xf002, 'X', 'c')])
+
+
+class MismatchTest(SimulatedTestCase):
+    def test_ranges(self):
+        expected = 'a' * 28
+        actual = 'aXaaXaaaaaaaaaaaaaaaaaaaaaaX'
+        self.assertEqual(bsl.mismatchRanges(expected, actual), [(1, 4, 2), (27, 1, 1)])
+
+    def program(self, data):
+        self.bslobj.data = image((0xf000, data))
+        self.bslobj.actionProgram()
+
+    def test_merged_across_blocks(self):
+        self.bslobj.maxData = 16
+        self.program('a' * 64)
+        self.bslobj.data = image((0xf000, 'a' * 14 + 'Xaaa' + 'Y' + 'a' * 21 + 'Z' + 'a' * 23))
+        self.assertRaises(bsl.BSLException, self.bslobj.actionVerify)
+        self.assertEqual([(m.address, m.expected, m.actual, m.count) for m in self.bslobj.mismatches],
+                         [(0xf00e, 'XaaaY', 'aaaaa', 2), (0xf028, 'Z', 'a', 1)])
+        self.assertTrue('3 bytes differ in 2 ranges' in self.log.getvalue())
+
+    def test_reset_per_pass(self):
+        self.program('abcd')
+        self.bslobj.data = image((0xf004, 'X'))
+        self.assertRaises(bsl.BSLException, self.bslobj.actionVerify)
+        self.bslobj.data = image((0xf000, 'abcdX'))
+        self.assertRaises(bsl.BSLException, self.bslobj.actionVerify)
+        self.assertEqual([(m.address, m.count) for m in self.bslobj.mismatches], [(0xf004, 1)])
+        self.bslobj.data = image((0xf000, 'abcd'))
+        self.bslobj.actionVerify()
+        self.assertEqual(self.bslobj.mismatches, [])
+
+
+class ResidentTest(SimulatedTestCase):
+    def test_resident(self):
+        loader = CompiledImage(image((0x0220, ''.join([chr(i & 0xff) for i in range(301)]))))
+        self.assertFalse(self.bslobj.isResident(loader))
+        self.target.load(loader)
+        self.assertTrue(self.bslobj.isResident(loader))
+
+    def test_overwritten_middle(self):
+        # bytes outside the signature blocks are covered by the checksum
+        loader = CompiledImage(image((0x0220, ''.join([chr(i & 0xff) for i in range(301)]))))
+        self.target.load(loader)
+        self.target.memory[0x0220 + 60] ^= 0x01
+        self.assertFalse(self.bslobj.isResident(loader))
+
+
+class CompiledImageCacheTest(unittest.TestCase):
+    def setUp(self):
+        self.maxfiles = bsl.MAX_COMPILED_FILES
+        bsl.MAX_COMPILED_FILES = 2
+
+    def tearDown(self):
+        bsl.MAX_COMPILED_FILES = self.maxfiles
+        for key in [k for k in bsl.compiledImages.keys() if k[0] == 'file']:
+            del bsl.compiledImages[key]
+            del bsl.compiledImagesUsed[key]
+
+    def compile(self, name):
+        return bsl.compiledImage(('file', name), lambda: image((0x0220, name)))
+
+    def test_least_recently_used(self):
+        # the image used last stays, the one unused for longest is evicted
+        hot = self.compile('hot')
+        self.compile('cold')
+        self.assertTrue(self.compile('hot') is hot)
+        self.compile('new')
+        self.assertEqual(sorted([k[1] for k in bsl.compiledImages.keys() if k[0] == 'file']), ['hot', 'new'])
+        self.assertTrue(self.compile('hot') is hot)
+
+
+if __name__ == '__main__':
+    unittest.main()
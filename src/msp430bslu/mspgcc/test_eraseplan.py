@@ -0,0 +1,78 @@
+#!/usr/bin/env python
+#
+# Tests of the erase planner and of executing its plans on the
+# simulated target
+#
+# (C) 2009-2010 Flying Camp Design
+#
+# All Rights Reserved.
+#
+# AUTHOR: Chris Wilson <cwilson@flyingcampdesign.com>
+#
+# Released under a BSD-style license (please see LICENSE)
+
+import sys
+import unittest
+from cStringIO import StringIO
+
+from msp430bslu.mspgcc import eraseplan, simulator
+from msp430bslu.mspgcc.devices import layout_for
+from msp430bslu.mspgcc.test_bsl import image, SimulatedTestCase
+
+LAYOUT = layout_for(0xf149, None)
+
+class PlanTest(unittest.TestCase):
+    def test_segments(self):
+        plan = eraseplan.plan_erase(image((0xf000, 'x' * 600)), LAYOUT)
+        self.assertEqual(plan.strategy, eraseplan.SEGMENT)
+        self.assertEqual(plan.erase, (0xf000, 0xf200))
+        self.assertEqual(plan.lost_main, ())
+
+    def test_whole_main(self):
+        plan = eraseplan.plan_erase(image((0x1100, 'x' * (0x10000 - 0x1100))), LAYOUT)
+        self.assertEqual(plan.strategy, eraseplan.MAIN)
+        self.assertTrue(eraseplan.SEGMENT in plan.alternatives)
+
+    def test_mass_keeps_main(self):
+        # with the password a mass erase is only valid if the image covers
+        # the whole main flash or main need not be preserved
+        plan = eraseplan.plan_erase(image((0xf000, 'x' * 16)), LAYOUT)
+        self.assertFalse(eraseplan.MASS in plan.alternatives)
+        plan = eraseplan.plan_erase(image((0xf000, 'x' * 16)), LAYOUT, preserve_main=0)
+        self.assertTrue(eraseplan.MASS in plan.alternatives)
+
+    def test_no_access(self):
+        # without the password only a mass erase is possible, the user
+        # must learn that flash outside the image is wiped too
+        plan = eraseplan.plan_erase(image((0xf000, 'x' * 16)), LAYOUT, access=0)
+        self.assertEqual(plan.strategy, eraseplan.MASS)
+        self.assertEqual(plan.lost, (0x1000, 0x1080))
+        self.assertEqual(len(plan.lost_main), len(LAYOUT.segments(0x1100, 0xffff)) - 1)
+        self.assertTrue('main segments outside the image are erased' in plan.describe())
+        self.assertTrue('2 info segments are lost' in plan.describe())
+        self.assertEqual(plan.as_dict()['lost_main'], list(plan.lost_main))
+
+
+class ExecuteTest(SimulatedTestCase):
+    def make_target(self):
+        return simulator.SimulatedTarget('sim:eraseplan', bslVer=0x0110)
+
+    def test_mass_erase_restore(self):
+        # an old BSL gets the patch before the info segments are restored,
+        # the BSL is not reset again for the mass erase
+        self.target.load(image((0x1000, 'info' * 32), (0xf000, 'old')))
+        resets = []
+        self.bslobj.bslReset = lambda *args: resets.append(args)
+        self.bslobj.data = image((0xf000, 'new'))
+        sys.stderr = self.log = StringIO()
+        plan = eraseplan.ErasePlan(eraseplan.MASS, [0xf000], restore=[0x1000, 0x1080])
+        self.bslobj.actionErasePlan(plan)
+        self.assertEqual(resets, [])
+        log = self.log.getvalue()
+        self.assertTrue(0 <= log.find('Patch for flash programming required') < log.find('Restore 1 info segments'))
+        self.assertEqual(self.target.dump(0x1000, 128), 'info' * 32)
+        self.assertEqual(self.target.dump(0xf000, 3), '\xff' * 3)
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,46 @@
+#!/usr/bin/env python
+#
+# Tests of the static interval tree
+#
+# (C) 2009-2010 Flying Camp Design
+#
+# All Rights Reserved.
+#
+# AUTHOR: Chris Wilson <cwilson@flyingcampdesign.com>
+#
+# Released under a BSD-style license (please see LICENSE)
+
+import random
+import unittest
+
+from msp430bslu.mspgcc.intervals import IntervalTree
+
+class IntervalTreeTest(unittest.TestCase):
+    def test_empty(self):
+        tree = IntervalTree([(5, 5, 'empty')])
+        self.assertEqual(len(tree), 0)
+        self.assertEqual(tree.overlaps(0, 10), [])
+
+    def test_exclusive_ends(self):
+        tree = IntervalTree([(0, 10, 'a'), (10, 20, 'b')])
+        self.assertEqual(tree.overlaps(10, 11), [(10, 20, 'b')])
+        self.assertEqual(tree.overlaps(9, 10), [(0, 10, 'a')])
+
+    def test_against_scan(self):
+        rnd = random.Random(1)
+        ranges = []
+        for i in range(200):
+            start = rnd.randrange(0, 0x10000)
+            ranges.append((start, start + rnd.randrange(1, 0x400), i))
+        tree = IntervalTree(ranges)
+        for i in range(200):
+            start = rnd.randrange(0, 0x10000)
+            end = start + rnd.randrange(1, 0x800)
+            expected = [r for r in ranges if r[0] < end and start < r[1]]
+            found = tree.overlaps(start, end)
+            self.assertEqual([r[:2] for r in found], sorted([r[:2] for r in expected]))
+            self.assertEqual(sorted(found), sorted(expected))
+
+
+if __name__ == '__main__':
+    unittest.main()
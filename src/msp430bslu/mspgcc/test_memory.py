@@ -0,0 +1,141 @@
+#!/usr/bin/env python
+#
+# Tests of the memory images and the file formats
+#
+# (C) 2009-2010 Flying Camp Design
+#
+# All Rights Reserved.
+#
+# AUTHOR: Chris Wilson <cwilson@flyingcampdesign.com>
+#
+# Released under a BSD-style license (please see LICENSE)
+
+import os
+import shutil
+import tempfile
+import unittest
+from cStringIO import StringIO
+
+from msp430bslu.mspgcc import memory
+from msp430bslu.mspgcc.memory import Memory, Segment, FileFormatError
+
+def image(*segments):
+    mem = Memory()
+    for address, data in segments:
+        mem.append(Segment(address, data))
+    return mem
+
+def contents(mem):
+    return [(seg.startaddress, str(seg.data)) for seg in mem]
+
+class LoadFileTest(unittest.TestCase):
+    def setUp(self):
+        self.tmpdir = tempfile.mkdtemp()
+
+    def tearDown(self):
+        shutil.rmtree(self.tmpdir)
+
+    def test_fileobj_without_name(self):
+        f = StringIO()
+        image((0xf000, 'abc')).saveIHex(f)
+        mem = Memory()
+        mem.loadFile(None, StringIO(f.getvalue()))
+        self.assertEqual(contents(mem), [(0xf000, 'abc')])
+        self.assertRaises(FileFormatError, Memory().loadFile, None, StringIO(''))
+
+    def test_binary_by_name(self):
+        filename = os.path.join(self.tmpdir, 'image.BIN')
+        f = open(filename, 'wb')
+        f.write(':\xff')
+        f.close()
+        mem = Memory()
+        mem.loadFile(filename)
+        self.assertEqual(contents(mem), [(0xfffe, ':\xff')])
+
+
+
+class SRecTest(unittest.TestCase):
+    def roundtrip(self, mem):
+        f = StringIO()
+        mem.saveSRec(f)
+        loaded = Memory()
+        loaded.loadFile(None, StringIO(f.getvalue()))
+        return f.getvalue().splitlines(), loaded
+
+    def test_roundtrip(self):
+        data = ''.join([chr(i & 0xff) for i in range(40)])
+        lines, loaded = self.roundtrip(image((0x1000, 'info'), (0xf000, data)))
+        self.assertEqual(contents(loaded), [(0x1000, 'info'), (0xf000, data)])
+        self.assertEqual(lines[0], 'S00600004844521B')
+        self.assertEqual([line[:2] for line in lines[1:]], ['S1', 'S1', 'S1', 'S1', 'S5', 'S9'])
+        self.assertEqual(lines[-2], 'S5030004F8')
+
+    def test_wide_addresses(self):
+        lines, loaded = self.roundtrip(image((0x10000, 'abc')))
+        self.assertEqual(contents(loaded), [(0x10000, 'abc')])
+        self.assertEqual([line[:2] for line in lines[1:]], ['S2', 'S5', 'S8'])
+
+    def test_errors(self):
+        for text in ('S1060000616263D4\n',     #checksum
+                     'S1070000616263D3\n',     #length
+                     'S1060000616Z63D3\n',     #no hex
+                     'S4030000FC\n'):          #type
+            mem = Memory()
+            self.assertRaises(FileFormatError, mem.loadSRec, StringIO(text))
+        mem = Memory()
+        mem.loadSRec(StringIO('S1060000616263D3\n'))
+        self.assertEqual(contents(mem), [(0, 'abc')])
+
+    def test_sniff(self):
+        self.assertEqual(memory.sniff('\xef\xbb\xbfS00600004844521B'), 'srec')
+        self.assertEqual(memory.sniff(':00000001FF'), 'ihex')
+        self.assertEqual(memory.sniff('Some text'), None)
+
+
+
+class ComposeTest(unittest.TestCase):
+    def compose(self, policy, *images):
+        return memory.compose([image(*segments) for segments in images], policy)
+
+    def test_contiguous(self):
+        mem = self.compose(memory.OVERLAP_ERROR, [(0xf000, 'ab')], [(0xf002, 'cd')])
+        self.assertEqual(contents(mem), [(0xf000, 'abcd')])
+        self.assertEqual(mem.overlaps, [])
+
+    def test_same_data(self):
+        mem = self.compose(memory.OVERLAP_ERROR, [(0xf000, 'abcd')], [(0xf002, 'cdef')])
+        self.assertEqual(contents(mem), [(0xf000, 'abcdef')])
+        self.assertEqual([(o.start, o.end, o.first, o.second, o.same) for o in mem.overlaps],
+                         [(0xf002, 0xf004, 0, 1, True)])
+
+    def test_conflict(self):
+        images = ([(0xf000, 'abcd')], [(0x1000, 'info'), (0xf002, 'XYef')])
+        try:
+            self.compose(memory.OVERLAP_ERROR, *images)
+        except memory.OverlapError, err:
+            self.assertEqual([(o.start, o.end, o.same) for o in err.overlaps], [(0xf002, 0xf004, False)])
+        else:
+            self.fail('conflict accepted')
+        mem = self.compose(memory.FIRST_WINS, *images)
+        self.assertEqual(contents(mem), [(0x1000, 'info'), (0xf000, 'abcdef')])
+        mem = self.compose(memory.LAST_WINS, *images)
+        self.assertEqual(contents(mem), [(0x1000, 'info'), (0xf000, 'abXYef')])
+        self.assertEqual(len(mem.overlaps), 1)
+
+    def test_three_images(self):
+        # the middle image is covered on both sides, only its gap is kept
+        images = ([(0xf000, 'aa')], [(0xf000, 'bbbbbb')], [(0xf004, 'cc')])
+        mem = self.compose(memory.FIRST_WINS, *images)
+        self.assertEqual(contents(mem), [(0xf000, 'aabbbb')])
+        mem = self.compose(memory.LAST_WINS, *images)
+        self.assertEqual(contents(mem), [(0xf000, 'bbbbcc')])
+        self.assertEqual([(o.first, o.second) for o in mem.overlaps], [(0, 1), (1, 2)])
+
+    def test_within_image(self):
+        mem = self.compose(memory.OVERLAP_ERROR, [(0xf000, 'abcd'), (0xf001, 'X')])
+        self.assertEqual(contents(mem), [(0xf000, 'aXcd')])
+        self.assertEqual(mem.overlaps, [])
+
+
+if __name__ == '__main__':
+    unittest.main()
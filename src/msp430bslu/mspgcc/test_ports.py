@@ -0,0 +1,53 @@
+#!/usr/bin/env python
+#
+# Tests of the port factory
+#
+# (C) 2009-2010 Flying Camp Design
+#
+# All Rights Reserved.
+#
+# AUTHOR: Chris Wilson <cwilson@flyingcampdesign.com>
+#
+# Released under a BSD-style license (please see LICENSE)
+
+import os
+import shutil
+import tempfile
+import unittest
+
+from msp430bslu.mspgcc import bsl, ports, serialtrace, simulator
+
+class OpenPortTest(unittest.TestCase):
+    def setUp(self):
+        self.tmpdir = tempfile.mkdtemp()
+
+    def tearDown(self):
+        shutil.rmtree(self.tmpdir)
+
+    def read_info(self, port):
+        bslobj = bsl.BootStrapLoader()
+        bslobj.comInit(port)
+        bslobj.bslReset(1)
+        bslobj.txPasswd()
+        info = bslobj.readBSLInfo()
+        bslobj.comDone()
+        return info
+
+    def test_names(self):
+        self.assertTrue(ports.open_port('sim:ports') is simulator.get_target('sim:ports'))
+        target = simulator.SimulatedTarget('sim:other')
+        self.assertTrue(ports.open_port(target) is target)
+        self.assertEqual(ports.open_port('/dev/ttyS0'), '/dev/ttyS0')
+
+    def test_record_replay(self):
+        filename = os.path.join(self.tmpdir, 'bsl.trace')
+        simulator.get_target('sim:ports-trace', dev_id=0xf413)
+        port = ports.open_port('sim:ports-trace', filename)
+        self.assertTrue(isinstance(port, serialtrace.TraceRecorder))
+        self.assertEqual(self.read_info(port), (0xf413, 0x0160))
+        port = ports.open_port(serialtrace.REPLAY_PREFIX + filename)
+        self.assertEqual(self.read_info(port), (0xf413, 0x0160))
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,100 @@
+#!/usr/bin/env python
+#
+# Span tracer writing the Chrome/Perfetto trace event format. Load the
+# saved file in chrome://tracing or ui.perfetto.dev to see a session as
+# a timeline.
+#
+# (C) 2009-2010 Flying Camp Design
+#
+# All Rights Reserved.
+#
+# AUTHOR: Chris Wilson <cwilson@flyingcampdesign.com>
+#
+# Released under a BSD-style license (please see LICENSE)
+
+import time, json, thread, threading, os
+
+class Timeline:
+    """collects spans ("complete" events) and instant events"""
+    def __init__(self, process_name='msp430-bsl'):
+        self.start = time.time()
+        self.pid = os.getpid()
+        self.events = [{
+            'name': 'process_name', 'ph': 'M', 'pid': self.pid, 'tid': 0,
+            'args': {'name': process_name},
+        }]
+        self.threads = {}
+
+    def _us(self, t):
+        return int((t - self.start) * 1e6)
+
+    def _tid(self):
+        tid = thread.get_ident()
+        if tid not in self.threads:
+            self.threads[tid] = 1
+            self.events.append({
+                'name': 'thread_name', 'ph': 'M', 'pid': self.pid, 'tid': tid,
+                'args': {'name': threading.currentThread().getName()},
+            })
+        return tid
+
+    def begin(self, name, cat='action', args=None):
+        """start a span, returns the token to pass to end()"""
+        return (name, cat, time.time(), args)
+
+    def end(self, token, args=None):
+        """finish a span started with begin()"""
+        name, cat, start, startargs = token
+        if startargs and args:
+            args = dict(startargs, **args)
+        self.complete(name, cat, start, time.time(), args or startargs)
+
+    def complete(self, name, cat, start, end, args=None):
+        """add a span with known start and end time (time.time() values)"""
+        event = {
+            'name': name, 'cat': cat, 'ph': 'X', 'pid': self.pid, 'tid': self._tid(),
+            'ts': self._us(start), 'dur': max(self._us(end) - self._us(start), 0),
+        }
+        if args:
+            event['args'] = args
+        self.events.append(event)
+
+    def instant(self, name, cat='event', args=None):
+        event = {
+            'name': name, 'cat': cat, 'ph': 'i', 's': 't', 'pid': self.pid, 'tid': self._tid(),
+            'ts': self._us(time.time()),
+        }
+        if args:
+            event['args'] = args
+        self.events.append(event)
+
+    def as_dict(self):
+        return {'traceEvents': list(self.events), 'displayTimeUnit': 'ms'}
+
+    def save(self, filename):
+        f = open(filename, 'w')
+        try:
+            json.dump(self.as_dict(), f)
+        finally:
+            f.close()
+
+def traced(name=None, cat='action'):
+    """method decorator recording a span on self.tracer, if set"""
+    def decorate(method):
+        spanname = name or method.__name__
+        def wrapper(self, *args, **kwargs):
+            tracer = self.tracer
+            if tracer is None:
+                return method(self, *args, **kwargs)
+            token = tracer.begin(spanname, cat)
+            try:
+                result = method(self, *args, **kwargs)
+            except Exception, e:
+                tracer.end(token, {'error': str(e)})
+                raise
+            tracer.end(token)
+            return result
+        wrapper.__name__ = method.__name__
+        wrapper.__doc__ = method.__doc__
+        return wrapper
+    return decorate
@@ -0,0 +1,120 @@
+#!/usr/bin/env python
+#
+# Concurrent BSL presence probing
+#
+# (C) 2009-2010 Flying Camp Design
+#
+# All Rights Reserved.
+#
+# AUTHOR: Chris Wilson <cwilson@flyingcampdesign.com>
+#
+# Released under a BSD-style license (please see LICENSE)
+
+import sys
+import time
+import threading
+from mspgcc import bsl
+from mspgcc.ports import open_port
+
+DEFAULT_TIMEOUT = 0.2 # serial read timeout while probing, in seconds
+
+class ProbeResult:
+    """
+    Outcome of probing one serial port for a BSL
+    """
+    def __init__(self, port):
+        self.port = port
+        self.present = False    # a BSL answered
+        self.locked = False     # BSL answered but refused the read (password)
+        self.dev_id = None
+        self.bslVer = None
+        self.cpu = None
+        self.latency = None     # seconds for SYNC + 16 byte read
+        self.elapsed = None     # seconds for the whole probe, including entry sequence
+        self.error = None
+
+    def __repr__(self):
+        if self.dev_id is not None:
+            return "ProbeResult(%r, dev_id=0x%04x, bslVer=0x%04x, latency=%.3f)" % (self.port, self.dev_id, self.bslVer, self.latency)
+        return "ProbeResult(%r, present=%r, locked=%r, error=%r)" % (self.port, self.present, self.locked, self.error)
+
+
+def probe(port, timeout=DEFAULT_TIMEOUT, passwd=None, invertRST=0, invertTEST=0, swapResetTest=0, slowmode=0):
+    """
+    Probe a single port: BSL entry sequence, SYNC and a read of the
+    device ID/BSL version block at 0x0ff0.  The password is only sent
+    if one is given.  Never raises, errors are stored in the result.
+    """
+    result = ProbeResult(port)
+    bslobj = bsl.BootStrapLoader(aTimeout=timeout)
+    bslobj.invertRST = invertRST
+    bslobj.invertTEST = invertTEST
+    bslobj.swapResetTest = swapResetTest
+    bslobj.slowmode = slowmode
+    start = time.time()
+    try:
+        bslobj.comInit(open_port(port))
+    except Exception, err:                  #serial, termios, driver errors
+        result.error = str(err)
+        result.elapsed = time.time() - start
+        return result
+    try:
+        try:
+            bslobj.bslReset(1)
+            if passwd is not None:
+                bslobj.txPasswd(passwd)
+            t0 = time.time()
+            result.dev_id, result.bslVer = bslobj.readBSLInfo()   #includes the SYNC
+            result.latency = time.time() - t0
+            result.present = True
+            result.cpu = bsl.deviceids.get(result.dev_id)
+        except bsl.BSLException, err:
+            #anything but a failed SYNC means a BSL answered
+            result.present = str(err) != bsl.BootStrapLoader.ERR_BSL_SYNC
+            result.locked = str(err) == bsl.BootStrapLoader.ERR_RX_NAK
+            result.error = str(err)
+        except Exception, err:              #e.g. IOError of a vanished adapter
+            result.error = str(err)
+    finally:
+        try:
+            bslobj.comDone()
+        except Exception:
+            pass
+    result.elapsed = time.time() - start
+    return result
+
+def probe_ports(ports, timeout=DEFAULT_TIMEOUT, **kwargs):
+    """
+    Probe several ports in parallel, one thread per port.  Keyword
+    arguments are passed to probe().  Returns a list of ProbeResults in
+    the order of ports.
+    """
+    results = {}
+    def worker(port):
+        try:
+            results[port] = probe(port, timeout=timeout, **kwargs)
+        except Exception, err:
+            #every port gets a result, even if probe itself failed
+            result = ProbeResult(port)
+            result.error = str(err)
+            results[port] = result
+    threads = []
+    for port in ports:
+        t = threading.Thread(target=worker, args=(port,), name="probe %s" % port)
+        t.setDaemon(True)
+        t.start()
+        threads.append(t)
+    for t in threads:
+        t.join()
+    return [results[port] for port in ports]
+
+if __name__ == '__main__':
+    import sscan
+    ports = sys.argv[1:] or sscan.scan()
+    for result in probe_ports(ports):
+        if result.dev_id is not None:
+            print "%-16s device %04x  BSL %x.%02x  %.1f ms" % (result.port, result.dev_id, result.bslVer >> 8, result.bslVer & 0xff, 1000*result.latency)
+        elif result.locked:
+            print "%-16s BSL present, locked (password required)" % result.port
+        else:
+            print "%-16s no BSL (%s)" % (result.port, result.error)
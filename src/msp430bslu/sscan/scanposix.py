@@ -12,21 +12,125 @@
 #
 # Released under a BSD-style license (please see LICENSE)
 
+import os
 import sys
 import platform
 import serial
 import glob
 
+SYSFS_TTY = '/sys/class/tty'
+UART_TYPE_UNKNOWN = '0' # PORT_UNKNOWN in linux/serial_core.h, no UART behind the node
+
 PLATFORM = platform.platform()
 if PLATFORM.lower().startswith('linux'):         # Linux
     portlist = glob.glob('/dev/ttyS*') + glob.glob('/dev/ttyUSB*') # usb <-> serial support
+    usbpatterns = ['/dev/ttyUSB*', '/dev/ttyACM*']
+    USE_SYSFS = os.path.isdir(SYSFS_TTY)
 elif PLATFORM.lower().startswith('darwin'):      # OS X
     portlist = glob.glob('/dev/cuad*') + glob.glob('/dev/tty.usbserial*') # usb <-> serial support
+    usbpatterns = ['/dev/tty.usbserial*', '/dev/tty.usbmodem*']
+    USE_SYSFS = False
 else:
     raise Exception("Platform %s not supported" % PLATFORM)
 
+# scan() only has to open ports if it can't ask the kernel about them
+OPENS_PORTS = not USE_SYSFS
+
+class PortInfo:
+    """serial port details read from sysfs"""
+    def __init__(self, device, driver=None):
+        self.device = device
+        self.driver = driver
+        self.vid = None
+        self.pid = None
+        self.serial_number = None
+        self.manufacturer = None
+        self.product = None
+        self.interface = None
+        self.location = None
+
+    def is_usb(self):
+        return self.vid is not None
+
+    def description(self):
+        """one line human readable summary"""
+        if self.is_usb():
+            desc = "USB VID:PID=%04x:%04x" % (self.vid, self.pid)
+            if self.serial_number:
+                desc += " SER=%s" % self.serial_number
+            if self.interface is not None:
+                desc += " IF=%d" % self.interface
+            if self.product:
+                desc += " (%s)" % self.product
+            return desc
+        return self.driver or 'n/a'
+
+    def __repr__(self):
+        return "PortInfo(%r, driver=%r, vid=%r, pid=%r, serial_number=%r, interface=%r)" % (
+            self.device, self.driver, self.vid, self.pid, self.serial_number, self.interface)
+
+def _read_attr(path, name):
+    """return the stripped contents of a sysfs attribute or None"""
+    try:
+        f = open(os.path.join(path, name))
+        try:
+            return f.read().strip()
+        finally:
+            f.close()
+    except IOError:
+        return None
+
+def _find_usb_interface(path):
+    """walk up the device path to the usb interface directory, if any"""
+    while path and path != '/':
+        if os.path.exists(os.path.join(path, 'bInterfaceNumber')):
+            return path
+        path = os.path.dirname(path)
+    return None
+
+def sysfs_ports(include_unpopulated=False):
+    """enumerate serial ports from sysfs without opening any device.
+    legacy 8250 nodes without a detected UART are skipped unless
+    include_unpopulated is set. return a list of PortInfo objects."""
+    ports = []
+    try:
+        names = sorted(os.listdir(SYSFS_TTY))
+    except OSError:
+        return ports
+    for name in names:
+        ttypath = os.path.join(SYSFS_TTY, name)
+        devpath = os.path.join(ttypath, 'device')
+        if not os.path.exists(devpath):
+            continue                            # virtual terminal, pty etc.
+        if not include_unpopulated and _read_attr(ttypath, 'type') == UART_TYPE_UNKNOWN:
+            continue                            # 8250 node without hardware
+        devpath = os.path.realpath(devpath)
+        driver = None
+        if os.path.exists(os.path.join(devpath, 'driver')):
+            driver = os.path.basename(os.path.realpath(os.path.join(devpath, 'driver')))
+        info = PortInfo(os.path.join('/dev', name), driver)
+        ifpath = _find_usb_interface(devpath)
+        if ifpath:
+            usbpath = os.path.dirname(ifpath)
+            try:
+                info.vid = int(_read_attr(usbpath, 'idVendor'), 16)
+                info.pid = int(_read_attr(usbpath, 'idProduct'), 16)
+            except (TypeError, ValueError):
+                pass
+            info.serial_number = _read_attr(usbpath, 'serial')
+            info.manufacturer = _read_attr(usbpath, 'manufacturer')
+            info.product = _read_attr(usbpath, 'product')
+            number = _read_attr(ifpath, 'bInterfaceNumber')
+            if number is not None:
+                info.interface = int(number, 16)
+            info.location = os.path.basename(ifpath)
+        ports.append(info)
+    return ports
+
 def scan():
     """scan for available ports. return a list of device names."""
+    if USE_SYSFS:
+        return [info.device for info in sysfs_ports()]
     available = []
     for i in portlist:
         try:
@@ -37,7 +141,20 @@ def scan():
             pass
     return available
 
+def usb_ports():
+    """list usb serial adapters without opening them. return a list of device names."""
+    if USE_SYSFS:
+        return [info.device for info in sysfs_ports() if info.is_usb()]
+    ports = []
+    for pattern in usbpatterns:
+        ports.extend(glob.glob(pattern))
+    return sorted(ports)
+
 if __name__ == '__main__':
     print "Found ports:"
-    for name in scan():
-        print name
+    if USE_SYSFS:
+        for info in sysfs_ports():
+            print "%-16s %s" % (info.device, info.description())
+    else:
+        for name in scan():
+            print name
@@ -13,6 +13,11 @@
 
 import serial
 
+# there is no way to list ports on win32 without trying to open them
+OPENS_PORTS = True
+# no sysfs to watch for hotplug events, the port list is polled
+USE_SYSFS = False
+
 def scan():
     """scan for available ports. return a list of device names."""
     available = []
@@ -25,6 +30,14 @@ def scan():
             pass
     return available
 
+def usb_ports():
+    """list usb serial adapters without opening them. return a list of device names."""
+    try:
+        from serial.tools.list_ports import comports
+    except ImportError:
+        return []
+    return [port for port, desc, hwid in comports() if 'USB' in hwid.upper()]
+
 if __name__ == '__main__':
     print "Found ports:"
     for name in scan():
@@ -0,0 +1,675 @@
+#!/usr/bin/env python
+#
+# Programming station service: queues BSL jobs per serial port and
+# exposes them as JSON over HTTP (TCP or UNIX socket)
+#
+# (C) 2009-2010 Flying Camp Design
+#
+# All Rights Reserved.
+#
+# AUTHOR: Chris Wilson <cwilson@flyingcampdesign.com>
+#
+# Released under a BSD-style license (please see LICENSE)
+
+# API, all bodies are JSON:
+#   GET    /status                  ports, queue lengths, cached images
+#   GET    /metrics                 protocol metrics of all ports, Prometheus text format
+#   GET    /jobs                    queued and running jobs and the last finished ones
+#   POST   /jobs                    {"port": ..., "file": ... or "image": {"data": ..., "filetype": ...},
+#                                    "options": {<BSL option>: value, ...}}
+#                                   more files to compose with "file": "files": [FILE or FILE@ADDR, ...],
+#                                   "overlap": "error", "first" or "last"
+#   GET    /jobs/<id>               job state, progress, log and result
+#   GET    /jobs/<id>/events?since=N
+#                                   newline separated JSON events, streamed until the job has finished
+#   DELETE /jobs/<id>               cancel a queued or running job
+
+import os
+import sys
+import time
+import json
+import hashlib
+import threading
+import Queue
+import SocketServer
+import BaseHTTPServer
+import urlparse
+from cStringIO import StringIO
+from optparse import OptionParser
+import job
+from job import BSL_DEFAULTS, Job, JobError, JobCancelled, OutputRouter
+from mspgcc import memory, bsl
+from mspgcc.metrics import ProtocolMetrics, prometheus_text
+
+DEBUG = 0
+
+DEFAULT_HOST = '127.0.0.1'
+DEFAULT_PORT = 8430
+MAX_LOG_LINES = 1000
+MAX_IMAGES = 16
+MAX_FINISHED_JOBS = 100 # finished jobs kept for GET /jobs
+
+# job states
+QUEUED = 'queued'
+RUNNING = 'running'
+DONE = 'done'
+FAILED = 'failed'
+CANCELLED = 'cancelled'
+FINISHED = (DONE, FAILED, CANCELLED)
+
+# options given as numbers, None if unset
+NUMBER_OPTIONS = ['framesize', 'erasecycles', 'timeout', 'speed', 'startaddr', 'size', 'goaddr']
+
+class StationError(Exception):
+    """
+    Invalid request, status is the HTTP status to answer with
+    """
+    def __init__(self, message, status=400):
+        Exception.__init__(self, message)
+        self.status = status
+
+
+def coerce_option(opt, val):
+    """
+    Returns the JSON value val of a BSL option converted to the type Job
+    expects, raises StationError if it has the wrong type
+    """
+    default = BSL_DEFAULTS[opt]
+    if opt in NUMBER_OPTIONS:
+        if val is None and default is None:
+            return None
+        if isinstance(val, (int, long)) and not isinstance(val, bool):
+            return val
+        if isinstance(val, basestring):
+            try:
+                return int(val, 0)
+            except ValueError:
+                pass
+    elif isinstance(default, bool):
+        if isinstance(val, bool):
+            return val
+        if isinstance(val, (int, long)) and val in (0, 1):
+            return bool(val)
+    elif val is None or isinstance(val, basestring):
+        return val and str(val) or None # Job expects plain strings
+    raise StationError("Invalid value for %s: %s" % (opt, json.dumps(val)))
+
+
+class ImageCache:
+    """
+    Parsed firmware images, shared by all jobs. Files are reloaded when
+    their size or modification time changes, inline images are keyed by
+    a hash of their contents.
+    """
+    def __init__(self, maxsize=MAX_IMAGES):
+        self.maxsize = maxsize
+        self.images = {}
+        self.lock = threading.Lock()
+        self.hits = 0
+        self.misses = 0
+
+    def _lookup(self, key, stamp, loader):
+        self.lock.acquire()
+        try:
+            entry = self.images.get(key)
+            if entry is not None and entry[0] == stamp:
+                self.hits += 1
+                entry[2] = time.time()
+                return entry[1]
+        finally:
+            self.lock.release()
+        data = loader() # parse outside the lock, jobs on other ports go on
+        self.lock.acquire()
+        try:
+            self.misses += 1
+            if len(self.images) >= self.maxsize and key not in self.images:
+                oldest = min(self.images.items(), key=lambda item: item[1][2])[0]
+                del self.images[oldest]
+            self.images[key] = [stamp, data, time.time()]
+        finally:
+            self.lock.release()
+        return data
+
+    def get_file(self, filename, filetype=None, binaddress=None, bintrim=False):
+        """
+        Returns the Memory object for a firmware file
+        """
+        if filename is None:
+            return memory.Memory()
+        st = os.stat(filename)
+        key = (os.path.abspath(filename), filetype, binaddress, bintrim)
+        return self._lookup(key, (st.st_size, st.st_mtime),
+            lambda: job.load_image(filename, filetype, binaddress, bintrim))
+
+    def get_composed(self, filename, extrafiles, compose, filetype=None, binaddress=None, bintrim=False, overlap=None):
+        """
+        Returns the Memory object compose() makes of the firmware file and
+        the extrafiles (see job.image_spec). It is composed again only if
+        one of the files changes, unchanged files come from the cache
+        """
+        specs = [(filename, filetype, binaddress, bintrim)]
+        specs.extend([job.image_spec(spec) + (False,) for spec in extrafiles])
+        stamp = []
+        for spec in specs:
+            st = os.stat(spec[0])
+            stamp.append((st.st_size, st.st_mtime))
+        key = tuple([(os.path.abspath(spec[0]),) + spec[1:] for spec in specs]) + (overlap,)
+        return self._lookup(key, tuple(stamp),
+            lambda: compose([self.get_file(*spec) for spec in specs]))
+
+    def get_data(self, data, filetype=None, binaddress=None, bintrim=False):
+        """
+        Returns the Memory object for an image sent with the request
+        """
+        key = (hashlib.sha1(data).hexdigest(), filetype, binaddress, bintrim)
+        def loader():
+            mem = memory.Memory()
+            if filetype == 0:
+                mem.loadIHex(StringIO(data))
+            elif filetype == 1:
+                mem.loadTIText(StringIO(data))
+            elif filetype == 2:
+                mem.loadBinary(StringIO(data), binaddress, bintrim)
+            elif filetype == 3:
+                mem.loadSRec(StringIO(data))
+            else:
+                mem.loadFile('', StringIO(data))
+            return mem
+        return self._lookup(key, None, loader)
+
+    def __len__(self):
+        return len(self.images)
+
+
+class StationJob(Job):
+    """
+    Job using the station's image cache
+    """
+    def __init__(self, options, images=None, image_data=None, **kwargs):
+        Job.__init__(self, options, **kwargs)
+        self.images = images
+        self.image_data = image_data
+
+    def load_image(self):
+        if self.images is None:
+            return Job.load_image(self)
+        if self.image_data is not None:
+            return self.images.get_data(self.image_data, self.filetype, self.binaddress, self.bintrim)
+        if self.extrafiles:
+            data = self.images.get_composed(self.filename, self.extrafiles, self.compose,
+                self.filetype, self.binaddress, self.bintrim, self.overlap)
+            self.result.overlaps = data.overlaps # not set by compose() if cached
+            return data
+        return self.images.get_file(self.filename, self.filetype, self.binaddress, self.bintrim)
+
+
+class JobRecord:
+    """
+    State of a submitted job. Changes are kept as a list of events
+    that clients can follow.
+    """
+    def __init__(self, jobid, port, job):
+        self.id = jobid
+        self.port = port
+        self.job = job
+        self.state = QUEUED
+        self.progress = None
+        self.log = []
+        self.result = None
+        self.submitted = time.time()
+        self.events = []
+        self.changed = threading.Condition()
+        self._partial = ''
+        job.log = self
+        job.progress = self
+        self.post('state', state=QUEUED)
+
+    def post(self, kind, **kwargs):
+        self.changed.acquire()
+        try:
+            kwargs['seq'] = len(self.events)
+            kwargs['type'] = kind
+            self.events.append(kwargs)
+            self.changed.notifyAll()
+        finally:
+            self.changed.release()
+
+    def set_state(self, state):
+        self.state = state
+        self.post('state', state=state)
+
+    def start(self):
+        """
+        QUEUED -> RUNNING, returns False if the job was cancelled meanwhile
+        """
+        self.changed.acquire()
+        try:
+            if self.state != QUEUED:
+                return False
+            self.set_state(RUNNING)
+            return True
+        finally:
+            self.changed.release()
+
+    def cancel_queued(self):
+        """
+        QUEUED -> CANCELLED, returns False if a worker started the job meanwhile
+        """
+        self.changed.acquire()
+        try:
+            if self.state != QUEUED:
+                return False
+            self.job.result.exitcode = job.EXIT_CANCELLED
+            self.job.result.error = 'Cancelled'
+            self.finish(CANCELLED)
+            return True
+        finally:
+            self.changed.release()
+
+    def finish(self, state):
+        self.result = self.job.result.as_dict()
+        self.state = state
+        self.post('result', state=state, result=self.result)
+
+    # file-like interface for the job log
+    def write(self, text):
+        text = self._partial + str(text)
+        lines = text.split('\n')
+        self._partial = lines.pop()
+        for line in lines:
+            self.log.append(line)
+            self.post('log', text=line)
+        del self.log[:-MAX_LOG_LINES]
+
+    def writelines(self, lines):
+        for line in lines: self.write(line)
+
+    def flush(self):
+        pass
+
+    # progress interface of UpdatingBootStrapLoader
+    def set(self, count, total=100):
+        pcnt = total and 100*count/total
+        if pcnt != self.progress:
+            self.progress = pcnt
+            self.post('progress', percent=pcnt)
+
+    def finished(self):
+        return self.state in FINISHED
+
+    def wait_events(self, since, timeout):
+        """
+        Returns the events from sequence number since on, waits up to
+        timeout seconds if there are none yet
+        """
+        self.changed.acquire()
+        try:
+            if len(self.events) <= since and not self.finished():
+                self.changed.wait(timeout)
+            return self.events[since:]
+        finally:
+            self.changed.release()
+
+    def as_dict(self, log=True):
+        d = {
+            'id': self.id,
+            'port': self.port,
+            'state': self.state,
+            'progress': self.progress,
+            'submitted': self.submitted,
+            'result': self.result,
+        }
+        if log:
+            d['log'] = self.log
+        return d
+
+
+class PortWorker(threading.Thread):
+    """
+    Runs the jobs queued for one serial port, one after the other. The
+    BSL session is kept between jobs and checked while idle.
+    """
+    poll_interval = 1 # seconds between session checks while idle
+
+    def __init__(self, port, idle_timeout=job.SESSION_IDLE_TIMEOUT):
+        threading.Thread.__init__(self, name="station %s" % port)
+        self.setDaemon(True)
+        self.port = port
+        self.queue = Queue.Queue()
+        self.session = job.BSLSession(port, idle_timeout)
+        self.metrics = ProtocolMetrics() # of all jobs on this port
+        self.current = None
+
+    def run(self):
+        while True:
+            try:
+                record = self.queue.get(timeout=self.poll_interval)
+            except Queue.Empty:
+                try:
+                    self.session.poll()
+                except Exception:
+                    self.session.close() # the worker goes on, the next job reopens the port
+                continue
+            if record is None:
+                break
+            if not record.start(): # cancelled while waiting
+                continue
+            self.current = record
+            try:
+                record.job.run()
+            except JobCancelled:
+                record.finish(CANCELLED)
+            except (JobError, bsl.BSLException, memory.FileFormatError):
+                record.finish(FAILED)
+            except Exception:
+                # port may be gone or the BSL in an unknown state, reopen for the next job
+                self.session.close()
+                record.finish(FAILED)
+            else:
+                record.finish(DONE)
+            if record.job.result.metrics is not None:
+                self.metrics.merge(record.job.result.metrics)
+            self.current = None
+        self.session.close()
+
+    def pending(self):
+        return self.queue.qsize()
+
+
+class Station:
+    """
+    Accepts jobs and runs them on one PortWorker per serial port
+    """
+    def __init__(self, idle_timeout=job.SESSION_IDLE_TIMEOUT, keep_jobs=MAX_FINISHED_JOBS):
+        self.idle_timeout = idle_timeout
+        self.keep_jobs = keep_jobs
+        self.images = ImageCache()
+        self.workers = {}
+        self.jobs = {}
+        self.lock = threading.Lock()
+        self.next_id = 1
+
+    def submit(self, spec):
+        """
+        Queues a job described by a dict (see the API above), returns
+        its JobRecord. Raises StationError for invalid requests.
+        """
+        if not isinstance(spec, dict):
+            raise StationError('Job must be a JSON object')
+        options = spec.get('options') or {}
+        if not isinstance(options, dict):
+            raise StationError('options must be a JSON object')
+        for opt in options.keys():
+            if opt not in BSL_DEFAULTS:
+                raise StationError("Unknown option: %s" % opt)
+        options = dict((str(opt), coerce_option(opt, val)) for opt, val in options.items())
+        port = spec.get('port') or options.get('comport')
+        if not port:
+            raise StationError('No serial port given')
+        options['comport'] = port = str(port)
+        if spec.get('file'):
+            options['filename'] = str(spec['file'])
+        image_data = None
+        image = spec.get('image')
+        if image:
+            try:
+                image_data = str(image['data'])
+                options['filetype'] = str(image.get('filetype', 'Auto Select'))
+            except (TypeError, KeyError, UnicodeError):
+                raise StationError('image must be an object with a "data" member')
+            options['filename'] = None
+        extrafiles = spec.get('files') or []
+        if not isinstance(extrafiles, list) or (extrafiles and not spec.get('file')):
+            raise StationError('files must be a list of files to compose with "file"')
+        extrafiles = [str(name) for name in extrafiles]
+        overlap = str(spec.get('overlap', memory.OVERLAP_ERROR))
+
+        self.lock.acquire()
+        try:
+            worker = self.workers.get(port)
+            if worker is None:
+                worker = PortWorker(port, self.idle_timeout)
+                self.workers[port] = worker
+                worker.start()
+            stationjob = StationJob(options, images=self.images, session=worker.session,
+                image_data=image_data, extrafiles=extrafiles, overlap=overlap, out=StringIO())
+            try:
+                stationjob.parse_options()
+            except JobError, err:
+                raise StationError(str(err).strip())
+            record = JobRecord(self.next_id, port, stationjob)
+            self._expire()
+            self.jobs[record.id] = record
+            self.next_id += 1
+        finally:
+            self.lock.release()
+        worker.queue.put(record)
+        return record
+
+    def _expire(self):
+        """
+        Forgets finished jobs but the last keep_jobs ones, with their
+        logs, events and BSL objects. Call with self.lock held.
+        """
+        finished = sorted([jobid for jobid, record in self.jobs.items() if record.finished()])
+        for jobid in finished[:max(len(finished) - self.keep_jobs, 0)]:
+            del self.jobs[jobid]
+
+    def get(self, jobid):
+        try:
+            return self.jobs[int(jobid)]
+        except (KeyError, ValueError):
+            raise StationError("No such job: %s" % jobid, 404)
+
+    def cancel(self, jobid):
+        record = self.get(jobid)
+        if record.finished():
+            return record
+        record.job.cancel() # stops the job if the worker picks it up meanwhile
+        record.cancel_queued()
+        return record
+
+    def status(self):
+        ports = {}
+        for port, worker in self.workers.items():
+            current = worker.current
+            ports[port] = {
+                'queued': worker.pending(),
+                'running': current and current.id,
+                'open': worker.session.is_open(),
+                'bsl_active': worker.session.is_active(),
+                'jobs': worker.session.jobs,
+                'resumed': worker.session.resumed,
+            }
+        return {
+            'ports': ports,
+            'jobs': len(self.jobs),
+            'images': len(self.images),
+            'image_hits': self.images.hits,
+            'image_misses': self.images.misses,
+        }
+
+    def prometheus(self):
+        return prometheus_text([({'port': port}, worker.metrics) for port, worker in sorted(self.workers.items())])
+
+    def shutdown(self):
+        for worker in self.workers.values():
+            if worker.current is not None:
+                worker.current.job.cancel()
+            worker.queue.put(None)
+        for worker in self.workers.values():
+            worker.join(5)
+
+
+class StationRequestHandler(BaseHTTPServer.BaseHTTPRequestHandler):
+    server_version = 'msp430bslu-station/1.0'
+    event_timeout = 30  # seconds an event stream waits without news
+
+    def address_string(self):
+        if isinstance(self.client_address, tuple):
+            return self.client_address[0]
+        return 'local'
+
+    def log_message(self, format, *args):
+        if DEBUG:
+            BaseHTTPServer.BaseHTTPRequestHandler.log_message(self, format, *args)
+
+    def send_json(self, obj, status=200):
+        body = json.dumps(obj, sort_keys=True) + '\n'
+        self.send_response(status)
+        self.send_header('Content-Type', 'application/json')
+        self.send_header('Content-Length', str(len(body)))
+        self.end_headers()
+        self.wfile.write(body)
+
+    def read_json(self):
+        try:
+            length = int(self.headers.get('Content-Length', 0))
+            return json.loads(self.rfile.read(length))
+        except ValueError, err:
+            raise StationError("Invalid JSON: %s" % err)
+
+    def route(self):
+        url = urlparse.urlparse(self.path)
+        parts = [part for part in url.path.split('/') if part]
+        return parts, urlparse.parse_qs(url.query)
+
+    def handle_errors(self, method):
+        try:
+            method()
+        except StationError, err:
+            self.send_json({'error': str(err)}, err.status)
+
+    def do_GET(self):
+        self.handle_errors(self._get)
+
+    def do_POST(self):
+        self.handle_errors(self._post)
+
+    def do_DELETE(self):
+        self.handle_errors(self._delete)
+
+    def _get(self):
+        station = self.server.station
+        parts, query = self.route()
+        if parts == ['status']:
+            self.send_json(station.status())
+        elif parts == ['metrics']:
+            body = station.prometheus()
+            self.send_response(200)
+            self.send_header('Content-Type', 'text/plain; version=0.0.4')
+            self.send_header('Content-Length', str(len(body)))
+            self.end_headers()
+            self.wfile.write(body)
+        elif parts == ['jobs']:
+            jobs = [station.jobs[jobid].as_dict(log=False) for jobid in sorted(station.jobs.keys())]
+            self.send_json({'jobs': jobs})
+        elif len(parts) == 2 and parts[0] == 'jobs':
+            self.send_json(station.get(parts[1]).as_dict())
+        elif len(parts) == 3 and parts[0] == 'jobs' and parts[2] == 'events':
+            record = station.get(parts[1])
+            try:
+                since = int(query.get('since', ['0'])[0])
+            except ValueError:
+                raise StationError('Invalid since parameter')
+            self.stream_events(record, since)
+        else:
+            raise StationError('Not found', 404)
+
+    def _post(self):
+        parts = self.route()[0]
+        if parts != ['jobs']:
+            raise StationError('Not found', 404)
+        record = self.server.station.submit(self.read_json())
+        self.send_json(record.as_dict(), 201)
+
+    def _delete(self):
+        parts = self.route()[0]
+        if len(parts) != 2 or parts[0] != 'jobs':
+            raise StationError('Not found', 404)
+        self.send_json(self.server.station.cancel(parts[1]).as_dict(log=False))
+
+    def stream_events(self, record, since):
+        """
+        Sends events as they happen, one JSON object per line, until the
+        job has finished or nothing happened for event_timeout seconds
+        """
+        self.send_response(200)
+        self.send_header('Content-Type', 'application/x-ndjson')
+        self.end_headers()
+        while True:
+            events = record.wait_events(since, self.event_timeout)
+            if not events:
+                break
+            for event in events:
+                self.wfile.write(json.dumps(event, sort_keys=True) + '\n')
+            self.wfile.flush()
+            since = events[-1]['seq'] + 1
+            if record.finished() and since >= len(record.events):
+                break
+
+
+class StationHTTPServer(SocketServer.ThreadingMixIn, BaseHTTPServer.HTTPServer):
+    daemon_threads = True
+    allow_reuse_address = True
+
+    def __init__(self, address, station):
+        BaseHTTPServer.HTTPServer.__init__(self, address, StationRequestHandler)
+        self.station = station
+
+if hasattr(SocketServer, 'UnixStreamServer'):
+    class StationUnixServer(SocketServer.ThreadingMixIn, SocketServer.UnixStreamServer):
+        daemon_threads = True
+
+        def __init__(self, path, station):
+            if os.path.exists(path):
+                os.unlink(path)
+            SocketServer.UnixStreamServer.__init__(self, path, StationRequestHandler)
+            self.station = station
+
+
+def main(argv=None):
+    global DEBUG
+    parser = OptionParser(usage="%prog [options]")
+    parser.add_option('--host', dest='host', default=DEFAULT_HOST, help="address to listen on (default %default)")
+    parser.add_option('-p', '--port', dest='port', type='int', default=DEFAULT_PORT, help="TCP port (default %default)")
+    parser.add_option('--socket', dest='socket', metavar='PATH', help="listen on a UNIX socket instead of TCP")
+    parser.add_option('--idle-timeout', dest='idle_timeout', type='float', default=job.SESSION_IDLE_TIMEOUT, metavar='SECONDS',
+        help="keep the BSL of a port active this long after a job (default %default, 0: power down after each job)")
+    parser.add_option('--keep-jobs', dest='keep_jobs', type='int', default=MAX_FINISHED_JOBS, metavar='COUNT',
+        help="number of finished jobs kept for queries (default %default)")
+    parser.add_option('-D', '--debug', dest='debug', type='int', default=0, metavar='LEVEL', help="debug level")
+    values, args = parser.parse_args(argv)
+    if args:
+        parser.error('no arguments expected')
+    DEBUG = job.DEBUG = bsl.DEBUG = values.debug
+
+    # bsl writes to sys.stderr/sys.stdout, send it to the log of the job
+    # running in the calling thread
+    sys.stderr = OutputRouter(sys.stderr)
+    sys.stdout = OutputRouter(sys.stdout)
+
+    station = Station(values.idle_timeout, values.keep_jobs)
+    if values.socket:
+        if not hasattr(SocketServer, 'UnixStreamServer'):
+            parser.error('UNIX sockets are not supported on this platform')
+        server = StationUnixServer(values.socket, station)
+        where = values.socket
+    else:
+        server = StationHTTPServer((values.host, values.port), station)
+        where = "http://%s:%d/" % (values.host, values.port)
+    sys.stderr.write("Programming station listening on %s\n" % where)
+    try:
+        try:
+            server.serve_forever()
+        except KeyboardInterrupt:
+            pass
+    finally:
+        station.shutdown()
+        server.server_close()
+        if values.socket and os.path.exists(values.socket):
+            os.unlink(values.socket)
+    return 0
+
+if __name__ == '__main__':
+    sys.exit(main())
@@ -0,0 +1,49 @@
+#!/usr/bin/env python
+#
+# Tests of the hotplug monitor
+#
+# (C) 2009-2010 Flying Camp Design
+#
+# All Rights Reserved.
+#
+# AUTHOR: Chris Wilson <cwilson@flyingcampdesign.com>
+#
+# Released under a BSD-style license (please see LICENSE)
+
+import time
+import unittest
+
+from msp430bslu import hotplug, sscan
+
+class PollingTest(unittest.TestCase):
+    """the monitor on a platform without sysfs and inotify, e.g. win32"""
+    def setUp(self):
+        self.usb_ports = sscan.usb_ports
+        self.use_sysfs = sscan.__dict__.pop('USE_SYSFS', None)
+        self.ports = ['COM3']
+        sscan.usb_ports = lambda: list(self.ports)
+
+    def tearDown(self):
+        sscan.usb_ports = self.usb_ports
+        if self.use_sysfs is not None:
+            sscan.USE_SYSFS = self.use_sysfs
+
+    def test_poll(self):
+        events = []
+        monitor = hotplug.HotplugMonitor(lambda event, port: events.append((event, port)), interval=0.02)
+        monitor.start()
+        try:
+            self.ports = ['COM3', 'COM7']
+            end = time.time() + 10
+            while not events and time.time() < end:
+                time.sleep(0.02)
+            self.assertTrue(monitor.isAlive())
+            self.assertFalse(monitor.uses_inotify)
+            self.assertEqual(events, [('add', 'COM7')])
+        finally:
+            monitor.stop()
+            monitor.join(5)
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,156 @@
+#!/usr/bin/env python
+#
+# Tests of the job logic shared by the GUI, the command line and the
+# station, run against simulated targets
+#
+# (C) 2009-2010 Flying Camp Design
+#
+# All Rights Reserved.
+#
+# AUTHOR: Chris Wilson <cwilson@flyingcampdesign.com>
+#
+# Released under a BSD-style license (please see LICENSE)
+
+import os
+import sys
+import time
+import Queue
+import shutil
+import tempfile
+import unittest
+from cStringIO import StringIO
+
+from msp430bslu import job
+from msp430bslu.mspgcc import simulator
+from msp430bslu.mspgcc.memory import Memory, Segment
+
+class JobThreadTest(unittest.TestCase):
+    def setUp(self):
+        self.stderr = sys.stderr
+        sys.stderr = StringIO()
+
+    def tearDown(self):
+        sys.stderr = self.stderr
+
+    def outcome(self, thread, queue):
+        thread.start()
+        thread.join(30)
+        events = []
+        while not queue.empty():
+            events.append(queue.get())
+        return [event for event in events if event[0] in ('done', 'error')]
+
+    def test_done(self):
+        queue = Queue.Queue()
+        thread = job.JobThread({'comport': 'sim:jobthread', 'masserase': True}, queue, tag='t')
+        self.assertEqual(self.outcome(thread, queue), [('done', 't', None)])
+
+    def test_unexpected_error(self):
+        # any exception is posted, the owner must not wait forever
+        queue = Queue.Queue()
+        thread = job.JobThread({'comport': 'sim:jobthread', 'masserase': True}, queue, tag='t')
+        def fail():
+            raise KeyError('broken')
+        thread.job._run = fail
+        outcome = self.outcome(thread, queue)
+        self.assertEqual(len(outcome), 1)
+        self.assertEqual(outcome[0][:2], ('error', 't'))
+        self.assertTrue(isinstance(outcome[0][2], KeyError))
+
+
+class TimelineTest(unittest.TestCase):
+    def setUp(self):
+        self.stderr = sys.stderr
+        sys.stderr = StringIO()
+        self.tmpdir = tempfile.mkdtemp()
+        self.timeline = os.path.join(self.tmpdir, 'missing', 'timeline.json')
+
+    def tearDown(self):
+        sys.stderr = self.stderr
+        shutil.rmtree(self.tmpdir)
+
+    def test_save_error(self):
+        # the job succeeds, the failed save is reported on its own
+        bsljob = job.Job({'comport': 'sim:timeline', 'masserase': True}, timeline=self.timeline)
+        bsljob.run()
+        self.assertTrue(bsljob.result.ok())
+        self.assertTrue(bsljob.result.save_error)
+        self.assertEqual(bsljob.result.as_dict()['save_error'], bsljob.result.save_error)
+
+    def test_save_error_keeps_job_error(self):
+        filename = os.path.join(self.tmpdir, 'firmware.hex')
+        mem = Memory()
+        mem.append(Segment(0xf000, 'ab'))
+        f = open(filename, 'w')
+        mem.saveIHex(f)
+        f.close()
+        options = {'comport': 'sim:timeline', 'filename': filename, 'verify': True}
+        bsljob = job.Job(options, timeline=self.timeline)
+        self.assertRaises(Exception, bsljob.run)
+        self.assertEqual(bsljob.result.exitcode, job.EXIT_VERIFY)
+        self.assertTrue(bsljob.result.save_error)
+
+
+class SessionTest(unittest.TestCase):
+    def setUp(self):
+        self.stderr = sys.stderr
+        sys.stderr = StringIO()
+        self.sessions = job.SessionManager(idle_timeout=2)
+        self.sessions.poll_interval = 0.05
+
+    def tearDown(self):
+        self.sessions.close_all()
+        sys.stderr = self.stderr
+
+    def wait_event(self, executor, kind, timeout=30):
+        end = time.time() + timeout
+        while time.time() < end:
+            for event in executor.events():
+                if event[0] == kind:
+                    return event
+            time.sleep(0.05)
+        self.fail('no %s event' % kind)
+
+    def test_idle_session_monitored(self):
+        # the idle check runs in the monitor thread, its outcome is posted
+        executor = job.JobExecutor(self.sessions)
+        executor.submit({'comport': 'sim:session', 'bslversion': True}, 't')
+        self.assertEqual(self.wait_event(executor, 'done'), ('done', 't', None))
+        self.assertTrue(self.sessions.get('sim:session').is_active())
+        self.assertEqual(self.wait_event(executor, 'session'), ('session', 'sim:session', 'idle'))
+        self.assertFalse(self.sessions.get('sim:session').is_active())
+
+
+class ImageLoaderTest(unittest.TestCase):
+    def setUp(self):
+        self.stderr = sys.stderr
+        sys.stderr = StringIO()
+        self.tmpdir = tempfile.mkdtemp()
+        self.filename = os.path.join(self.tmpdir, 'firmware.hex')
+        mem = Memory()
+        mem.append(Segment(0xf000, 'x' * 1000))
+        f = open(self.filename, 'w')
+        mem.saveIHex(f)
+        f.close()
+
+    def tearDown(self):
+        sys.stderr = self.stderr
+        shutil.rmtree(self.tmpdir)
+
+    def test_frames_for_expected_layout(self):
+        # the second job on the port expects the device of the first one,
+        # programData uses the frames compiled by the loader
+        simulator.get_target('sim:layout', dev_id=0xf112)
+        session = job.BSLSession('sim:layout')
+        options = {'comport': 'sim:layout', 'filename': self.filename, 'masserase': True, 'program': True}
+        for i in range(2):
+            bsljob = job.Job(options, session=session)
+            bsljob.parse_options()
+            bsljob.run()
+        session.close()
+        self.assertEqual(session.layout.name, 'MSP430F11x')
+        self.assertEqual([key[1] for key in bsljob.bslobj.data._frames.keys()], [session.layout.boundaries()])
+
+
+if __name__ == '__main__':
+    unittest.main()
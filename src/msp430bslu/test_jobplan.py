@@ -0,0 +1,77 @@
+#!/usr/bin/env python
+#
+# Tests of the job plan optimizer
+#
+# (C) 2009-2010 Flying Camp Design
+#
+# All Rights Reserved.
+#
+# AUTHOR: Chris Wilson <cwilson@flyingcampdesign.com>
+#
+# Released under a BSD-style license (please see LICENSE)
+
+import unittest
+
+from msp430bslu import jobplan
+from msp430bslu.mspgcc import bsl
+from msp430bslu.mspgcc.memory import Memory, Segment
+
+def image(address, data):
+    mem = Memory()
+    mem.append(Segment(address, data))
+    return mem
+
+class OptimizeTest(unittest.TestCase):
+    def setUp(self):
+        self.bslobj = bsl.BootStrapLoader()
+        self.data = image(0xf000, 'x' * 256)
+
+    def plan(self, init, work=(), blankrun=0):
+        plan = jobplan.JobPlan(blankrun)
+        plan.init = list(init)
+        plan.work = list(work)
+        return jobplan.optimize(plan, self.data, self.bslobj)
+
+    def kinds(self, steps):
+        return [step.kind for step in steps]
+
+    def erasecheck(self):
+        return jobplan.Step(jobplan.ERASECHECK, self.bslobj.actionEraseCheck)
+
+    def test_erasecheck_after_erase(self):
+        plan = self.plan([jobplan.masserase_step(self.bslobj), self.erasecheck()])
+        self.assertEqual(self.kinds(plan.init), [jobplan.MASSERASE])
+        self.assertEqual(plan.bslreset, 0)
+
+    def test_erasecheck_not_covered(self):
+        plan = self.plan([jobplan.segmenterase_step(self.bslobj, 0xf000), self.erasecheck()])
+        self.assertEqual(self.kinds(plan.init), [jobplan.ENTER, jobplan.SEGMENTERASE, jobplan.ERASECHECK])
+
+    def test_program_verify_merged(self):
+        plan = self.plan([], [jobplan.Step(jobplan.PROGRAM, self.bslobj.actionProgram),
+                              jobplan.Step(jobplan.VERIFY, self.bslobj.actionVerify)])
+        self.assertEqual(self.kinds(plan.work), [jobplan.PROGRAMVERIFY])
+        self.assertEqual(plan.bslreset, 1)
+
+    def test_blankrun_needs_erase(self):
+        work = [jobplan.Step(jobplan.PROGRAM, self.bslobj.actionProgram)]
+        plan = self.plan([], work, blankrun=64)
+        self.assertEqual(repr(plan.work[0]), jobplan.PROGRAM)
+        plan = self.plan([jobplan.mainerase_step(self.bslobj)], work, blankrun=64)
+        self.assertEqual(repr(plan.work[0]), '%s (skip 0xff)' % jobplan.PROGRAM)
+
+    def test_entered(self):
+        calls = []
+        def erase(**kwargs):
+            calls.append(kwargs)
+        plan = jobplan.JobPlan()
+        plan.init = [jobplan.Step(jobplan.AUTOERASE, jobplan.bind(erase, usepatch=0))]
+        plan.entered = 1
+        jobplan.optimize(plan, self.data, self.bslobj)
+        plan.init[0]()
+        self.assertEqual(calls, [{'usepatch': 0, 'bslreset': 0}])
+        self.assertEqual(plan.bslreset, 0)
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,59 @@
+#!/usr/bin/env python
+#
+# Tests of the BSL presence probe with simulated targets
+#
+# (C) 2009-2010 Flying Camp Design
+#
+# All Rights Reserved.
+#
+# AUTHOR: Chris Wilson <cwilson@flyingcampdesign.com>
+#
+# Released under a BSD-style license (please see LICENSE)
+
+import sys
+import unittest
+from cStringIO import StringIO
+
+from msp430bslu import probe
+from msp430bslu.mspgcc import bsl, simulator
+
+class ProbeTest(unittest.TestCase):
+    def setUp(self):
+        self.stderr = sys.stderr
+        sys.stderr = StringIO()
+
+    def tearDown(self):
+        sys.stderr = self.stderr
+
+    def test_present(self):
+        simulator.get_target('sim:probe', dev_id=0xf413)
+        result = probe.probe_ports(['sim:probe'])[0]
+        self.assertTrue(result.present)
+        self.assertTrue(result.locked)
+        result = probe.probe_ports(['sim:probe'], passwd='\xff' * 32)[0]
+        self.assertFalse(result.locked)
+        self.assertEqual(result.dev_id, 0xf413)
+        self.assertEqual(result.error, None)
+
+    def test_unexpected_error(self):
+        # errors of real drivers end up in the result, never in the caller
+        def fail(bslobj):
+            raise IOError(5, 'Input/output error')
+        readBSLInfo = bsl.BootStrapLoader.readBSLInfo
+        bsl.BootStrapLoader.readBSLInfo = fail
+        try:
+            results = probe.probe_ports(['sim:probe-a', 'sim:probe-b'])
+        finally:
+            bsl.BootStrapLoader.readBSLInfo = readBSLInfo
+        self.assertEqual([result.port for result in results], ['sim:probe-a', 'sim:probe-b'])
+        for result in results:
+            self.assertFalse(result.present)
+            self.assertTrue('Input/output error' in result.error)
+
+    def test_worker_error(self):
+        results = probe.probe_ports(['sim:probe'], unknown_option=1)
+        self.assertTrue('unknown_option' in results[0].error)
+
+
+if __name__ == '__main__':
+    unittest.main()
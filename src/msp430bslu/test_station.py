@@ -0,0 +1,128 @@
+#!/usr/bin/env python
+#
+# Tests of the programming station service with simulated targets
+#
+# (C) 2009-2010 Flying Camp Design
+#
+# All Rights Reserved.
+#
+# AUTHOR: Chris Wilson <cwilson@flyingcampdesign.com>
+#
+# Released under a BSD-style license (please see LICENSE)
+
+import os
+import sys
+import time
+import shutil
+import tempfile
+import unittest
+from cStringIO import StringIO
+
+from msp430bslu import job, station
+from msp430bslu.mspgcc import simulator
+from msp430bslu.mspgcc.memory import Memory, Segment
+
+FIRMWARE = ''.join([chr(i & 0xff) for i in range(512)])
+
+class FailingJob(station.StationJob):
+    """job failing with an error the worker does not expect"""
+    def _run(self):
+        raise TypeError('unexpected')
+
+
+class StationTest(unittest.TestCase):
+    def setUp(self):
+        self.stderr = sys.stderr
+        sys.stderr = StringIO()
+        self.tmpdir = tempfile.mkdtemp()
+        self.filename = os.path.join(self.tmpdir, 'firmware.hex')
+        mem = Memory()
+        mem.append(Segment(0xf000, FIRMWARE))
+        f = open(self.filename, 'w')
+        mem.saveIHex(f)
+        f.close()
+        self.station = station.Station(idle_timeout=0)
+
+    def tearDown(self):
+        self.station.shutdown()
+        sys.stderr = self.stderr
+        shutil.rmtree(self.tmpdir)
+
+    def wait(self, record, timeout=30):
+        end = time.time() + timeout
+        while not record.finished() and time.time() < end:
+            time.sleep(0.05)
+        return record.state
+
+    def submit(self, port, **options):
+        return self.station.submit({'port': port, 'file': self.filename, 'options': options})
+
+    def test_program(self):
+        record = self.submit('sim:station-program', masserase=True, program=True, verify=True)
+        self.assertEqual(self.wait(record), station.DONE)
+        self.assertEqual(simulator.get_target('sim:station-program').dump(0xf000, len(FIRMWARE)), FIRMWARE)
+        self.assertEqual(record.result['bytes'], len(FIRMWARE))
+
+    def test_failed_verify(self):
+        record = self.submit('sim:station-verify', verify=True)
+        self.assertEqual(self.wait(record), station.FAILED)
+        self.assertEqual(record.result['exitcode'], 5)
+
+    def test_option_types(self):
+        record = self.submit('sim:station-types', masserase=True, erasecycles='2', framesize=u'0x40')
+        self.assertEqual(record.job.meraseCycles, 2)
+        self.assertEqual(record.job.maxData, 0x40)
+        self.assertEqual(self.wait(record), station.DONE)
+        for options in ({'erasecycles': 'two'}, {'masserase': 'yes'}, {'erase': 12}, {'startaddr': [1]}):
+            try:
+                self.submit('sim:station-types', **options)
+            except station.StationError, err:
+                self.assertEqual(err.status, 400)
+            else:
+                self.fail('%r accepted' % options)
+
+    def test_unexpected_error(self):
+        # the worker survives jobs failing with any exception
+        port = 'sim:station-error'
+        first = self.submit(port, masserase=True)
+        self.wait(first)
+        failing = FailingJob({'comport': port, 'masserase': True})
+        failing.parse_options()
+        record = station.JobRecord(100, port, failing)
+        self.station.workers[port].queue.put(record)
+        self.assertEqual(self.wait(record), station.FAILED)
+        self.assertEqual(record.result['error'], 'unexpected')
+        after = self.submit(port, masserase=True, program=True)
+        self.assertEqual(self.wait(after), station.DONE)
+
+    def test_expire_finished(self):
+        self.station.keep_jobs = 2
+        records = []
+        for i in range(4):
+            records.append(self.submit('sim:station-expire', masserase=True))
+            self.wait(records[-1])
+        last = self.submit('sim:station-expire', masserase=True)
+        self.assertEqual(sorted(self.station.jobs.keys()), [records[2].id, records[3].id, last.id])
+        try:
+            self.station.get(records[0].id)
+        except station.StationError, err:
+            self.assertEqual(err.status, 404)
+        else:
+            self.fail('expired job found')
+        self.wait(last)
+
+    def test_cancel_race(self):
+        # a job is either started or cancelled, never both
+        record = station.JobRecord(100, 'sim:station-race', station.StationJob({'comport': 'sim:station-race'}))
+        self.assertTrue(record.start())
+        self.assertFalse(record.cancel_queued())
+        self.assertEqual(record.state, station.RUNNING)
+        record = station.JobRecord(101, 'sim:station-race', station.StationJob({'comport': 'sim:station-race'}))
+        self.assertTrue(record.cancel_queued())
+        self.assertFalse(record.start())
+        self.assertEqual([event['state'] for event in record.events], [station.QUEUED, station.CANCELLED])
+        self.assertEqual(record.result['exitcode'], job.EXIT_CANCELLED)
+
+
+if __name__ == '__main__':
+    unittest.main()
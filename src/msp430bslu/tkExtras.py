@@ -25,6 +25,9 @@ from tkSimpleDialog import askstring
 __version__ = '1.0.0'
 
 FONT    = 'TkFixedFont'
+FLUSH_MS = 100          # minimum time between redraws of buffered widgets
+MAX_LINES = 10000       # lines kept by output windows
+LINE_CHARS = 128        # average line length assumed when capping buffered text
 PLATFORM = platform.platform()
 WINDOWS = PLATFORM.lower().startswith('windows')
 DARWIN = PLATFORM.lower().startswith('darwin')
@@ -182,6 +185,7 @@ class PopupScrolledText(PopupWindow):
         topmenu.add_cascade(label='Edit', menu=edit)
     
     def on_save_as(self):
+        self.flush_now()
         filename = asksaveasfilename()
         if filename:
             alltext = self.gettext()
@@ -193,7 +197,11 @@ class PopupScrolledText(PopupWindow):
         self._text.delete('0.0', END)
         self._text.update()
     
+    def flush_now(self):                         # redef me if buffered
+        pass
+    
     def gettext(self):
+        self.flush_now()
         return self._text.get('1.0', END+'-1c')
     
     def hide(self):
@@ -206,23 +214,63 @@ class PopupScrolledText(PopupWindow):
 # Adapted from 'Programming Python' by Mark Lutz
 class PopupGuiOutput(PopupScrolledText):
     """
-    File-like GUI output window
+    File-like GUI output window. Writes are buffered and inserted at most
+    every interval ms, only the last maxlines lines are kept.
     """
-    def __init__(*args, **kwargs):
-        PopupScrolledText.__init__(*args, **kwargs)
+    def __init__(self, title='', kind='', iconfile=None, var=None, interval=FLUSH_MS, maxlines=MAX_LINES):
+        PopupScrolledText.__init__(self, title=title, kind=kind, iconfile=iconfile, var=var)
+        self._interval = interval
+        self._maxlines = maxlines
+        self._buff = []
+        self._bufflen = 0
+        self._pending = None                     # after() id of the next flush
     
     def write(self, text):
         if self._text != None:
-            self._text.insert(END, str(text))
-            self._text.see(END)
-            self._text.update()
+            text = str(text)
+            self._buff.append(text)
+            self._bufflen += len(text)
+            maxchars = self._maxlines * LINE_CHARS
+            while self._bufflen > maxchars and len(self._buff) > 1:
+                self._bufflen -= len(self._buff.pop(0)) # ring buffer, drop the oldest text
+            self._schedule()
     
     def writelines(self, lines):                 # lines already have '\n'
         for line in lines: self.write(line)      # or map(self.write, lines)
     
-    def flush(self):
+    def flush(self):                             # rate limited, see flush_now
         if self._text != None:
-            self._text.update()
+            self._schedule()
+    
+    def _schedule(self):
+        if self._pending is None:
+            self._pending = self.after(self._interval, self._flush)
+    
+    def _flush(self):
+        self._pending = None
+        if not self._buff:
+            return
+        text = ''.join(self._buff)
+        self._buff = []
+        self._bufflen = 0
+        self._text.insert(END, text[-self._maxlines*LINE_CHARS:])
+        lines = int(self._text.index(END+'-1c').split('.')[0])
+        if lines > self._maxlines:
+            self._text.delete('1.0', "%d.0" % (lines - self._maxlines + 1))
+        self._text.see(END)
+    
+    def flush_now(self):
+        """
+        Inserts buffered text immediately
+        """
+        if self._pending is not None:
+            self.after_cancel(self._pending)
+        self._flush()
+    
+    def on_clear(self):
+        self._buff = []
+        self._bufflen = 0
+        PopupScrolledText.on_clear(self)
     
 
 # Adapted from 'Programming Python' by Mark Lutz
@@ -685,11 +733,15 @@ class RadioSelect(LabelFrame):
 
 class ProgressBar(Frame):
     """
-    Progress bar visual status indicator
+    Progress bar visual status indicator. Updates are coalesced and drawn
+    at most every interval ms.
     """
-    def __init__(self, parent=None, label=None, var=None, orient=None, length=None):
+    def __init__(self, parent=None, label=None, var=None, orient=None, length=None, interval=FLUSH_MS):
         Frame.__init__(self, parent)
         self._parent = parent
+        self._interval = interval
+        self._value = None
+        self._pending = None
         if label:
             self._label = Label(self, text=label)
             self._label.pack(side=TOP, anchor=W)
@@ -701,6 +753,8 @@ class ProgressBar(Frame):
         self._pbar.pack(side=LEFT, anchor=W)
     
     def get(self):
+        if self._pending is not None:
+            return self._value[0]
         return self._var.get()
     
     def set(self, count, total=100):
@@ -709,12 +763,21 @@ class ProgressBar(Frame):
         elif type(total) is not int:
             raise tkExtrasError("Error: Unable to set entry (%s is not type 'int')" % total)
         else:
-            self._var.set(count)
-            self._pbar.configure(maximum=total)
-            self._parent.update()
+            self._value = (count, total)
+            if self._pending is None:
+                self._pending = self.after(self._interval, self._apply)
+    
+    def _apply(self):
+        self._pending = None
+        count, total = self._value
+        self._var.set(count)
+        self._pbar.configure(maximum=total)
     
     def reset(self):
-        self.set(0)
+        if self._pending is not None:
+            self.after_cancel(self._pending)
+        self._value = (0, 100)
+        self._apply()
     
 
 class ScrolledList(Frame):